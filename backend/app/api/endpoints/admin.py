@@ -1,91 +1,39 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+import hmac
 
-from ...database import get_db
-from ...models import Service
+from ...config import settings
+from ...database import get_async_db
+from ...models import Service, EmailOutbox
+from ...catalog import DEFAULT_SERVICES, default_services_upsert, service_catalog
+from ...callback_inbox import callback_inbox, requeue_failed_callbacks
+from ...mail_queue import delivery_stats
 from ...schemas import MessageResponse
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
+def require_admin_token(authorization: Optional[str] = Header(None)):
+    """Operator endpoints: "Authorization: Bearer <ADMIN_TOKEN>"; disabled while ADMIN_TOKEN is empty"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled (ADMIN_TOKEN not set)")
+    if not hmac.compare_digest(authorization or "", f"Bearer {settings.ADMIN_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 @router.get("/init-services", response_model=MessageResponse)
 @router.post("/init-services", response_model=MessageResponse)
-async def initialize_services(db: Session = Depends(get_db)):
+async def initialize_services(db: AsyncSession = Depends(get_async_db)):
     """Initialize or update services in database - supports both GET and POST"""
     
-    services_data = [
-        {
-            "name": "Paket All In Service",
-            "slug": "all-in",
-            "description": "Paket paling hemat & optimal untuk bisnis jangka panjang. Sudah termasuk Website, SEO, Mail Server, Cloudflare, dan Hosting.",
-            "category": "package",
-            "price": 81000000,
-            "duration_days": 365,
-            "features": '["Website Service - Custom UI/UX", "SEO Service (12 bulan)", "Mail Server Service", "Cloudflare Protection", "Hosting Performa Tinggi", "Support Teknis Lengkap"]'
-        },
-        {
-            "name": "Website Service",
-            "slug": "website",
-            "description": "Website Service Profesional - Pembuatan website custom dengan performa tinggi.",
-            "category": "web",
-            "price": 36000000,
-            "duration_days": 365,
-            "features": '["Custom UI/UX", "Hosting Performa Tinggi", "Optimasi Kecepatan", "Maintenance & Update", "Backup & Keamanan", "Support Teknis"]'
-        },
-        {
-            "name": "SEO Service",
-            "slug": "seo",
-            "description": "SEO Service Berkelanjutan (12 Bulan) - Optimasi mesin pencari profesional.",
-            "category": "marketing",
-            "price": 42000000,
-            "duration_days": 365,
-            "features": '["SEO On-Page & Technical", "Optimasi Struktur & Kecepatan", "Google Search Console & Analytics", "Monitoring Keyword Bulanan", "Laporan Performa SEO", "Optimasi Berkelanjutan 12 Bulan"]'
-        },
-        {
-            "name": "Mail Server Service",
-            "slug": "mail-server",
-            "description": "Mail Server Bisnis Profesional - Email bisnis dengan domain perusahaan.",
-            "category": "email",
-            "price": 15000000,
-            "duration_days": 365,
-            "features": '["Email dengan Domain Perusahaan", "Setup SPF, DKIM, DMARC", "Perlindungan Spam & Phishing", "Sinkronisasi Webmail & Perangkat", "Maintenance & Support"]'
-        },
-        {
-            "name": "Cloudflare Service",
-            "slug": "cloudflare",
-            "description": "Cloudflare Protection & Performance - Keamanan dan performa maksimal.",
-            "category": "security",
-            "price": 24000000,
-            "duration_days": 365,
-            "features": '["CDN Global & Caching", "Proteksi DDoS & Firewall", "SSL Full Encryption", "Proteksi Bot & Traffic Berbahaya", "Monitoring Keamanan 24/7"]'
-        },
-        {
-            "name": "Test Payment Service",
-            "slug": "test-payment",
-            "description": "Service untuk test pembayaran dengan nominal minimal Rp 10.000 (minimum iPaymu)",
-            "category": "test",
-            "price": 10000,
-            "duration_days": 1,
-            "features": '["Test Payment", "Minimal Amount", "Email Notification Test"]'
-        }
-    ]
-    
-    created_count = 0
-    updated_count = 0
-    
-    for service_data in services_data:
-        existing = db.query(Service).filter(Service.slug == service_data["slug"]).first()
-        if not existing:
-            service = Service(**service_data)
-            db.add(service)
-            created_count += 1
-        else:
-            # Update existing service
-            for key, value in service_data.items():
-                setattr(existing, key, value)
-            updated_count += 1
+    slugs = [s["slug"] for s in DEFAULT_SERVICES]
+    existing = len((await db.scalars(select(Service.slug).where(Service.slug.in_(slugs)))).all())
+    await db.execute(default_services_upsert(db.get_bind().dialect.name, update=True))
+    created_count = len(slugs) - existing
+    updated_count = existing
     
-    db.commit()
+    await db.commit()
+    service_catalog.invalidate()
     
     return {
         "message": f"Services initialized successfully! Created: {created_count}, Updated: {updated_count}"
@@ -93,37 +41,52 @@ async def initialize_services(db: Session = Depends(get_db)):
 
 @router.post("/add-test-service", response_model=MessageResponse)
 @router.get("/add-test-service", response_model=MessageResponse)
-async def add_test_payment_service(db: Session = Depends(get_db)):
+async def add_test_payment_service(db: AsyncSession = Depends(get_async_db)):
     """Force add/update test-payment service - GUARANTEED to work"""
     
-    test_service_data = {
-        "name": "Test Payment Service",
-        "slug": "test-payment",
-        "description": "Service untuk test pembayaran dengan nominal minimal Rp 10.000 (minimum iPaymu)",
-        "category": "test",
-        "price": 10000,
-        "duration_days": 1,
-        "features": '["Test Payment", "Minimal Amount", "Email Notification Test"]'
-    }
+    existed = await db.scalar(select(Service.id).where(Service.slug == "test-payment")) is not None
+    await db.execute(default_services_upsert(db.get_bind().dialect.name, update=True, slugs=["test-payment"]))
+    await db.commit()
+    service_catalog.invalidate()
     
-    # Check if exists
-    existing = db.query(Service).filter(Service.slug == "test-payment").first()
+    price = await db.scalar(select(Service.price).where(Service.slug == "test-payment"))
+    action = "UPDATED" if existed else "CREATED"
+    return {
+        "message": f"✅ Test payment service {action}! Price: Rp {price:,}"
+    }
+
+@router.post("/callback-inbox/replay", response_model=MessageResponse, dependencies=[Depends(require_admin_token)])
+async def replay_callback_inbox(include_failed: bool = False):
+    """Re-run pending iPaymu callbacks now (and optionally ones that gave up)"""
+    requeued = await requeue_failed_callbacks() if include_failed else 0
+    summary = await callback_inbox.drain()
+    return {
+        "message": f"Callback inbox replayed. Requeued: {requeued}, Processed: {summary['processed']}, "
+                   f"Retrying: {summary['retried']}, Failed: {summary['failed']}"
+    }
+
+@router.get("/email-outbox", dependencies=[Depends(require_admin_token)])
+async def get_email_outbox_status(db: AsyncSession = Depends(get_async_db)):
+    """Mail queue delivery status: counts per status and the latest failures"""
+    failures = (await db.scalars(
+        select(EmailOutbox).where(
+            EmailOutbox.status.in_(["failed", "queued"]),
+            EmailOutbox.last_error.isnot(None)
+        ).order_by(EmailOutbox.id.desc()).limit(20)
+    )).all()
     
-    if existing:
-        # Update existing
-        for key, value in test_service_data.items():
-            setattr(existing, key, value)
-        db.commit()
-        db.refresh(existing)
-        return {
-            "message": f"✅ Test payment service UPDATED! Price: Rp {existing.price:,}"
-        }
-    else:
-        # Create new
-        new_service = Service(**test_service_data)
-        db.add(new_service)
-        db.commit()
-        db.refresh(new_service)
-        return {
-            "message": f"✅ Test payment service CREATED! Price: Rp {new_service.price:,}"
-        }
+    return {
+        "counts": await delivery_stats(db),
+        "recent_errors": [
+            {
+                "id": m.id,
+                "to_email": m.to_email,
+                "subject": m.subject,
+                "status": m.status,
+                "attempts": m.attempts,
+                "last_error": m.last_error,
+                "next_attempt_at": m.next_attempt_at,
+            }
+            for m in failures
+        ]
+    }
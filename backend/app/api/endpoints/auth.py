@@ -1,31 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Header
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 from typing import Optional
+import logging
 import secrets
-import bcrypt
 import jwt
 
-from ...database import get_db
+from ...database import get_async_db
 from ...models import User
 from ...schemas import (
-    UserCreate, UserLogin, UserResponse, Token,
+    UserCreate, UserLogin, UserResponse, Token, StreamToken,
     ForgotPasswordRequest, ResetPasswordRequest, VerifyEmailRequest, MessageResponse
 )
 from ...config import settings
 from ...email import send_verification_email, send_password_reset_email
+from ...auth_cache import auth_user_cache
+from ...passwords import hash_password, verify_password
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 # ============= HELPER FUNCTIONS =============
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
     to_encode = data.copy()
@@ -37,34 +34,89 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-def get_current_user(token: str, db: Session):
-    """Get current user from JWT token"""
+def stream_scope(request: Request) -> str:
+    """Scope of a stream token: the path of the event stream (its token endpoint is that path + /token)"""
+    path = request.url.path
+    return path[:-len("/token")] if path.endswith("/token") else path
+
+def create_stream_token(request: Request, user: User) -> StreamToken:
+    """Short-lived token for the event stream whose /token endpoint this request hit"""
+    token = create_access_token(
+        {"sub": user.email, "scope": stream_scope(request)},
+        timedelta(seconds=settings.STREAM_TOKEN_EXPIRE_SECONDS)
+    )
+    return StreamToken(token=token, expires_in=settings.STREAM_TOKEN_EXPIRE_SECONDS)
+
+async def get_current_user(token: str, db: AsyncSession, scope: Optional[str] = None):
+    """Get current user from JWT token
+
+    Access tokens carry no scope; a stream token is only accepted for the
+    stream named in its "scope" claim.
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            print("[Auth Error] Token payload missing 'sub' field")
+            logger.info("Token payload missing 'sub' field")
             raise HTTPException(status_code=401, detail="Invalid token: missing email")
+        if payload.get("scope") != scope:
+            logger.info("Token scope %r used for %r", payload.get("scope"), scope)
+            raise HTTPException(status_code=401, detail="Invalid token")
     except jwt.ExpiredSignatureError:
-        print("[Auth Error] Token expired")
+        logger.debug("Token expired")
         raise HTTPException(status_code=401, detail="Token expired. Please login again.")
     except jwt.InvalidSignatureError:
-        print("[Auth Error] Token signature invalid - SECRET_KEY mismatch?")
+        logger.warning("Token signature invalid - SECRET_KEY mismatch?")
         raise HTTPException(status_code=401, detail="Invalid token signature")
     except jwt.PyJWTError as e:
-        print(f"[Auth Error] JWT decode failed: {type(e).__name__}: {str(e)}")
+        logger.info("JWT decode failed: %s: %s", type(e).__name__, e)
         raise HTTPException(status_code=401, detail="Invalid token")
     
-    user = db.query(User).filter(User.email == email).first()
+    # Cached row: attach to this request's session without a SELECT
+    user = auth_user_cache.get(email)
+    if user is not None:
+        db.add(user)
+        return user
+    
+    user = await db.scalar(select(User).where(User.email == email))
     if user is None:
-        print(f"[Auth Error] User not found in database: {email}")
+        logger.info("Token user not found in database")
         raise HTTPException(status_code=401, detail="User not found")
+    auth_user_cache.put(email, user)
     return user
 
 # Dependency for protected routes
+async def get_authenticated_user(
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Dependency to get the user from the Authorization: Bearer header"""
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    token = authorization.replace("Bearer ", "")
+    return await get_current_user(token, db)
+
+async def get_stream_user(
+    request: Request,
+    token: Optional[str] = None,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Like get_authenticated_user, but EventSource cannot send headers so ?token= is accepted too
+
+    Only a stream token issued for this stream (POST <stream path>/token)
+    is accepted in the query string - never the access token, which would
+    end up in proxy logs and browser history.
+    """
+    if authorization:
+        return await get_authenticated_user(authorization, db)
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return await get_current_user(token, db, scope=stream_scope(request))
+
 async def get_current_active_user(
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Dependency to get current active user from token"""
     if not authorization or not authorization.startswith("Bearer "):
@@ -73,8 +125,7 @@ async def get_current_active_user(
             detail="Not authenticated. Please provide Authorization header."
         )
     
-    token = authorization.replace("Bearer ", "")
-    user = get_current_user(token, db)
+    user = await get_authenticated_user(authorization, db)
     
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
@@ -83,11 +134,11 @@ async def get_current_active_user(
 
 # ============= ENDPOINTS =============
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register new user"""
     try:
         # Check if email exists
-        existing_user = db.query(User).filter(User.email == user_data.email).first()
+        existing_user = await db.scalar(select(User).where(User.email == user_data.email))
         if existing_user:
             raise HTTPException(
                 status_code=400, 
@@ -103,21 +154,21 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             full_name=user_data.full_name,
             phone=user_data.phone,
             company_name=user_data.company_name,
-            hashed_password=hash_password(user_data.password),
+            hashed_password=await hash_password(user_data.password),
             is_active=True,  # Auto-activate or require email verification
             is_verified=False,
             verification_token=verification_token
         )
         
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
         
-        # Send verification email
+        # Verification email is queued in the same transaction as the user
         try:
-            send_verification_email(new_user.email, verification_token)
+            send_verification_email(new_user.email, verification_token, db=db)
         except Exception as e:
-            print(f"Failed to send verification email: {e}")
+            logger.warning("Failed to queue verification email: %s", e)
+        
+        await db.commit()
         
         # Create access token
         access_token = create_access_token(data={"sub": new_user.email})
@@ -128,19 +179,19 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             "user": new_user
         }
     except HTTPException:
-        db.rollback()
+        await db.rollback()
         raise
     except Exception as e:
-        print(f"Registration error: {str(e)}")
-        db.rollback()
+        logger.exception("Registration error")
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Registrasi gagal: {str(e)}")
 
 @router.post("/login", response_model=Token)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user"""
     # Find user
-    user = db.query(User).filter(User.email == credentials.email).first()
-    if not user or not verify_password(credentials.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.email == credentials.email))
+    if not user or not await verify_password(credentials.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
     if not user.is_active:
@@ -156,63 +207,59 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)):
     }
 
 @router.post("/verify-email", response_model=MessageResponse)
-async def verify_email(request: VerifyEmailRequest, db: Session = Depends(get_db)):
+async def verify_email(request: VerifyEmailRequest, db: AsyncSession = Depends(get_async_db)):
     """Verify user email"""
-    user = db.query(User).filter(User.verification_token == request.token).first()
+    user = await db.scalar(select(User).where(User.verification_token == request.token))
     if not user:
         raise HTTPException(status_code=400, detail="Invalid verification token")
     
     user.is_verified = True
     user.verification_token = None
-    db.commit()
+    await db.commit()
+    auth_user_cache.invalidate(user.email)
     
     return {"message": "Email verified successfully"}
 
 @router.post("/forgot-password", response_model=MessageResponse)
-async def forgot_password(request: ForgotPasswordRequest, db: Session = Depends(get_db)):
+async def forgot_password(request: ForgotPasswordRequest, db: AsyncSession = Depends(get_async_db)):
     """Request password reset"""
-    print(f"[Forgot Password] Request received for email: {request.email}")
-    
-    user = db.query(User).filter(User.email == request.email).first()
+    user = await db.scalar(select(User).where(User.email == request.email))
     if not user:
-        print(f"[Forgot Password] User not found for email: {request.email}")
         # Don't reveal if email exists for security
         return {"message": "If email exists, reset link has been sent"}
     
-    print(f"[Forgot Password] User found: {user.email} (ID: {user.id})")
-    
     # Create reset token
     reset_token = secrets.token_urlsafe(32)
     user.reset_token = reset_token
     user.reset_token_expires = datetime.utcnow() + timedelta(hours=1)
-    db.commit()
-    
-    print(f"[Forgot Password] Reset token created, expires: {user.reset_token_expires}")
     
-    # Send reset email
+    # Reset email is queued in the same transaction as the token
     try:
-        send_password_reset_email(user.email, reset_token)
-        print(f"[Forgot Password] Reset email sent successfully to {user.email}")
-    except Exception as e:
-        print(f"[Forgot Password] ❌ Failed to send reset email: {e}")
-        import traceback
-        traceback.print_exc()
+        send_password_reset_email(user.email, reset_token, db=db)
+    except Exception:
+        logger.exception("Failed to queue password reset email", extra={"user_id": user.id})
         # Still return success to not reveal if email exists
     
+    await db.commit()
+    auth_user_cache.invalidate(user.email)
+    
+    logger.info("Password reset token created", extra={"user_id": user.id})
+    
     return {"message": "If email exists, reset link has been sent"}
 
 @router.post("/reset-password", response_model=MessageResponse)
-async def reset_password(request: ResetPasswordRequest, db: Session = Depends(get_db)):
+async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depends(get_async_db)):
     """Reset password with token"""
-    user = db.query(User).filter(User.reset_token == request.token).first()
+    user = await db.scalar(select(User).where(User.reset_token == request.token))
     if not user or not user.reset_token_expires or user.reset_token_expires < datetime.utcnow():
         raise HTTPException(status_code=400, detail="Invalid or expired reset token")
     
     # Update password
-    user.hashed_password = hash_password(request.new_password)
+    user.hashed_password = await hash_password(request.new_password)
     user.reset_token = None
     user.reset_token_expires = None
-    db.commit()
+    await db.commit()
+    auth_user_cache.invalidate(user.email)
     
     return {"message": "Password reset successfully"}
 
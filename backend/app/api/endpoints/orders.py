@@ -1,53 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
+import logging
 
-from ...database import get_db
+from ...database import get_async_db
 from ...models import Order, Service, User
 from ...schemas import OrderCreate, OrderCreateSimple, OrderResponse
 from ...email import send_order_confirmation_email
-from ...timezone import now_jakarta
-from .auth import get_current_user
+from ...catalog import service_catalog
+from ...order_numbers import generate_order_number
+from ...pagination import PageParams, paginate
+from ...serialization import order_json, orders_json
+from ...conditional import row_not_modified, row_etag, set_etag
+from .auth import get_authenticated_user
 
-router = APIRouter(prefix="/orders", tags=["Orders"])
-
-def get_user_from_token(authorization: Optional[str], db: Session) -> User:
-    """Extract user from authorization header"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    token = authorization.replace("Bearer ", "")
-    return get_current_user(token, db)
+logger = logging.getLogger(__name__)
 
-def generate_order_number() -> str:
-    """Generate unique order number"""
-    timestamp = now_jakarta().strftime("%Y%m%d-%H%M%S")
-    return f"ORD-{timestamp}"
+router = APIRouter(prefix="/orders", tags=["Orders"])
 
 @router.post("/", response_model=OrderResponse, status_code=201)
 async def create_order(
     order_data: OrderCreateSimple,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new order with service slug (simplified)"""
-    user = get_user_from_token(authorization, db)
     
     # Validate slug is not empty
     if not order_data.service_slug or not order_data.service_slug.strip():
         raise HTTPException(status_code=400, detail="service_slug tidak boleh kosong. Silakan pilih layanan dengan benar dari halaman layanan.")
     
-    # Debug logging
-    print(f"[Order Creation] Received slug: '{order_data.service_slug}'")
-    
-    # Find service by slug
-    service = db.query(Service).filter(Service.slug == order_data.service_slug).first()
+    # Find service by slug (cached catalog)
+    catalog = await service_catalog.get(db)
+    service = catalog.by_slug.get(order_data.service_slug)
     if not service:
         # List available services for debugging
-        available_services = db.query(Service).all()
-        available_slugs = [s.slug for s in available_services]
-        print(f"[Order Creation Error] Slug not found: '{order_data.service_slug}'")
-        print(f"[Order Creation Error] Available slugs: {available_slugs}")
+        available_slugs = list(catalog.by_slug)
+        logger.info("Order for unknown service slug", extra={"slug": order_data.service_slug})
         raise HTTPException(
             status_code=404, 
             detail=f"Service dengan slug '{order_data.service_slug}' tidak ditemukan. Tersedia: {', '.join(available_slugs)}"
@@ -71,10 +62,8 @@ async def create_order(
     )
     
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
     
-    # Send order confirmation email
+    # Order confirmation email, committed together with the order
     try:
         send_order_confirmation_email(
             to_email=user.email,
@@ -85,26 +74,28 @@ async def create_order(
                 'quantity': order_data.quantity,
                 'total_amount': total_price,
                 'status': 'pending'
-            }
+            },
+            db=db
         )
     except Exception as e:
-        print(f"Failed to send order confirmation email: {str(e)}")
+        logger.warning("Failed to queue order confirmation email: %s", e, extra={"order": new_order.order_number})
         # Don't fail the order creation if email fails
     
+    await db.commit()
+    
     return new_order
 
 @router.post("/full", response_model=OrderResponse, status_code=201)
 async def create_order_full(
     order_data: OrderCreate,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create new order with full details (backward compatibility)"""
-    user = get_user_from_token(authorization, db)
     
     # Verify service exists if service_id provided
     if order_data.service_id:
-        service = db.query(Service).filter(Service.id == order_data.service_id).first()
+        service = await db.get(Service, order_data.service_id)
         if not service:
             raise HTTPException(status_code=404, detail="Service not found")
     
@@ -122,50 +113,64 @@ async def create_order_full(
     )
     
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
+    await db.commit()
     
     return new_order
 
 @router.get("/", response_model=List[OrderResponse])
 async def get_my_orders(
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    response: Response,
+    status: Optional[str] = None,
+    page: PageParams = Depends(),
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all orders for current user"""
-    user = get_user_from_token(authorization, db)
-    orders = db.query(Order).filter(Order.user_id == user.id).order_by(Order.created_at.desc()).all()
-    return orders
+    """Get orders for current user, newest first (paginated: X-Next-Cursor / X-Total-Count)"""
+    query = select(Order).where(Order.user_id == user.id)
+    if status:
+        query = query.where(Order.status == status)
+    return orders_json.response(await paginate(db, query, Order, page, response), response)
 
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: int,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get specific order"""
-    user = get_user_from_token(authorization, db)
-    order = db.query(Order).filter(Order.id == order_id, Order.user_id == user.id).first()
+    """Get specific order (ETag / If-None-Match: 304 when unchanged)"""
+    owned = (Order.id == order_id, Order.user_id == user.id)
+    unchanged = await row_not_modified(request, db, "order", user.id, select(Order.id, Order.updated_at).where(*owned))
+    if unchanged:
+        return unchanged
+    
+    order = await db.scalar(select(Order).where(*owned))
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    return order
+    set_etag(response, row_etag("order", user.id, order))
+    return order_json.response(order, response)
 
 @router.get("/number/{order_number}", response_model=OrderResponse)
 async def get_order_by_number(
     order_number: str,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get order by order number"""
-    user = get_user_from_token(authorization, db)
-    order = db.query(Order).filter(
-        Order.order_number == order_number,
-        Order.user_id == user.id
-    ).first()
+    """Get order by order number (ETag / If-None-Match: 304 when unchanged)"""
+    owned = (Order.order_number == order_number, Order.user_id == user.id)
+    unchanged = await row_not_modified(request, db, "order", user.id, select(Order.id, Order.updated_at).where(*owned))
+    if unchanged:
+        return unchanged
+    
+    order = await db.scalar(select(Order).where(*owned))
     
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    return order
+    set_etag(response, row_etag("order", user.id, order))
+    return order_json.response(order, response)
@@ -1,370 +1,344 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from typing import List, Optional
 from datetime import datetime, timedelta
+import asyncio
 import httpx
-import hashlib
-import hmac
 import json
+import logging
 
-from ...database import get_db
-from ...models import Payment, Order, Service, Subscription
-from ...schemas import PaymentCreate, PaymentResponse, PaymentCallbackRequest, MessageResponse
+from ...database import get_async_db
+from ...models import Payment, Order, User, PaymentCallbackInbox
+from ...schemas import PaymentCreate, PaymentResponse, PaymentCallbackRequest, MessageResponse, StreamToken
 from ...config import settings
-from ...email import send_payment_pending_email, send_payment_confirmation_email
-from ...timezone import now_jakarta
-from .auth import get_current_user
+from ...ipaymu import ipaymu_client, IpaymuUnavailable
+from ...payment_status import apply_ipaymu_status, order_graph_options
+from ...callback_inbox import callback_inbox
+from ...events import payment_events, payment_event, format_sse, SSE_KEEPALIVE_SECONDS, SSE_MAX_STREAM_SECONDS
+from ...payment_jobs import (
+    payment_jobs, create_ipaymu_payment, ipaymu_payment_data, apply_gateway_response, queue_payment_pending_email
+)
+from ...pagination import PageParams, paginate
+from ...serialization import payment_json, payments_json
+from ...conditional import (
+    row_not_modified, row_etag, list_version, list_etag, etag_matches, not_modified, set_etag
+)
+from .auth import get_authenticated_user, get_stream_user, create_stream_token
 from datetime import timedelta
 
-router = APIRouter(prefix="/payments", tags=["Payments"])
-
-def get_user_from_token(authorization: Optional[str], db: Session):
-    """Extract user from authorization header"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    token = authorization.replace("Bearer ", "")
-    return get_current_user(token, db)
+logger = logging.getLogger(__name__)
 
-def generate_ipaymu_signature(body: dict, method: str = "POST") -> str:
-    """Generate iPaymu signature according to official documentation v2
-    
-    Format: HMAC-SHA256(StringToSign, ApiKey)
-    StringToSign = HTTPMethod:VaNumber:Lowercase(SHA-256(RequestBody)):ApiKey
-    
-    - HTTPMethod: POST or GET (UPPERCASE)
-    - VaNumber: VA iPaymu
-    - RequestBody: JSON body, hashed with SHA-256, then lowercased
-    - ApiKey: Your API Key
-    """
-    va = settings.IPAYMU_VA
-    api_key = settings.IPAYMU_API_KEY
-    
-    # Step 1: Create JSON body (no spaces after colon)
-    body_json = json.dumps(body, separators=(',', ':'))
-    
-    # Step 2: Hash body with SHA-256 and lowercase it
-    body_hash = hashlib.sha256(body_json.encode()).hexdigest().lower()
-    
-    # Step 3: Create string to sign: METHOD:VA:BODY_HASH:APIKEY
-    string_to_sign = f"{method.upper()}:{va}:{body_hash}:{api_key}"
-    
-    # Step 4: Generate HMAC-SHA256 signature using ApiKey as secret
-    signature = hmac.new(
-        api_key.encode(),
-        string_to_sign.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    
-    print(f"[iPaymu Signature Debug v2]")
-    print(f"  VA: {va}")
-    print(f"  API Key: {api_key[:20]}...")
-    print(f"  Body JSON: {body_json[:100]}...")
-    print(f"  Body Hash (SHA256 lowercase): {body_hash}")
-    print(f"  String to sign: {string_to_sign[:150]}...")
-    print(f"  Signature (HMAC-SHA256): {signature}")
-    
-    return signature
-
-async def create_ipaymu_payment(payment_data: dict, payment_method: str):
-    """Create payment via iPaymu API - Direct Payment (VA/QRIS)
-    
-    Based on official iPaymu sample: https://github.com/ipaymu/ipaymu-payment-v2-sample-python
-    Direct payment does NOT require product, qty, price fields.
-    """
-    url = f"{settings.IPAYMU_BASE_URL}/payment/direct"
-    
-    # Prepare request body based on payment method
-    # Direct payment format (VA/QRIS) - EXACTLY as GitHub sample
-    if payment_method == "va":
-        # Get payment channel from request, default to "bca" (most common)
-        # Available channels: "bca", "bni", "bri", "mandiri", "cimb", "permata", "bsi", "danamon"
-        payment_channel = payment_data.get("payment_channel", "bca")
-        
-        body = {
-            "name": payment_data["name"],
-            "phone": payment_data["phone"],
-            "email": payment_data["email"],
-            "amount": str(int(payment_data["amount"])),  # String, not int!
-            "notifyUrl": payment_data["notify_url"],
-            "referenceId": payment_data.get("reference_id", payment_data.get("order_number", "")),
-            "paymentMethod": "va",
-            "paymentChannel": payment_channel
-        }
-    else:
-        raise ValueError(f"Unsupported payment method: {payment_method}. Only 'va' is supported.")
-    
-    # CRITICAL: Serialize body to JSON string EXACTLY as GitHub sample
-    # This MUST be done before signature generation and used for request
-    body_json = json.dumps(body, separators=(',', ':'))
-    
-    # Generate signature using the EXACT JSON string that will be sent
-    signature = generate_ipaymu_signature(body, "POST")
-    
-    # Generate timestamp in format YYYYMMDDhhmmss (Jakarta time)
-    timestamp = now_jakarta().strftime("%Y%m%d%H%M%S")
-    
-    # Debug print
-    print(f"[iPaymu Request] Method: {payment_method}")
-    print(f"[iPaymu Request] Body JSON: {body_json}")
-    print(f"[iPaymu Request] Signature: {signature}")
-    print(f"[iPaymu Request] Timestamp: {timestamp}")
-    
-    # Prepare headers - EXACTLY as GitHub sample
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "signature": signature,
-        "va": settings.IPAYMU_VA,
-        "timestamp": timestamp
-    }
-    
-    # Make API request - CRITICAL: Use data= with JSON string, NOT json= with dict
-    # This ensures the exact string used for signature is sent to server
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, data=body_json, headers=headers, timeout=30.0)
-        
-        print(f"[iPaymu Response] Status: {response.status_code}")
-        print(f"[iPaymu Response] Body: {response.text[:500]}")
-        
-        if response.status_code != 200:
-            error_detail = response.text
-            print(f"[iPaymu Error] HTTP {response.status_code}: {error_detail}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"iPaymu API error (HTTP {response.status_code}): {error_detail}"
-            )
-        
-        result = response.json()
-        
-        if result.get("Status") != 200:
-            error_msg = result.get('Message', 'Unknown error')
-            error_data = result.get('Data')
-            print(f"[iPaymu Error] Status {result.get('Status')}: {error_msg}, Data: {error_data}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"iPaymu error: {error_msg}"
-            )
-        
-        print(f"[iPaymu Success] TransactionId: {result.get('Data', {}).get('TransactionId')}")
-        print(f"[iPaymu Success] SessionID: {result.get('Data', {}).get('SessionID')}")
-        print(f"[iPaymu Success] Data keys: {list(result.get('Data', {}).keys())}")
-        
-        # Log all possible payment info fields
-        data = result.get("Data", {})
-        print(f"[iPaymu Success] Va: {data.get('Va')}")
-        print(f"[iPaymu Success] VaNumber: {data.get('VaNumber')}")
-        print(f"[iPaymu Success] PaymentNo: {data.get('PaymentNo')}")
-        print(f"[iPaymu Success] PaymentCode: {data.get('PaymentCode')}")
-        print(f"[iPaymu Success] PaymentName: {data.get('PaymentName')}")
-        print(f"[iPaymu Success] Url: {data.get('Url')}")
-        print(f"[iPaymu Success] PaymentUrl: {data.get('PaymentUrl')}")
-        print(f"[iPaymu Success] QRImage: {data.get('QRImage')}")
-        print(f"[iPaymu Success] QrString: {data.get('QrString')}")
-        
-        return data
+router = APIRouter(prefix="/payments", tags=["Payments"])
 
 @router.post("/", response_model=PaymentResponse, status_code=201)
 async def create_payment(
     payment_data: PaymentCreate,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Create new payment for an order"""
-    user = get_user_from_token(authorization, db)
+    """Create new payment for an order
+    
+    With PAYMENT_ASYNC_CREATE or "Prefer: respond-async" a VA payment is
+    answered with 202 and status "processing"; the VA number and payment URL
+    appear on GET /payments/{id} and the SSE streams once iPaymu responded.
+    """
     
     # Verify order exists and belongs to user
-    order = db.query(Order).filter(Order.id == payment_data.order_id, Order.user_id == user.id).first()
+    order = await db.scalar(
+        select(Order).where(Order.id == payment_data.order_id, Order.user_id == user.id)
+        .options(joinedload(Order.service))
+    )
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
+    # Gateway known to be down: 503 now instead of a payment row that is deleted again
+    if payment_data.payment_method != "cod":
+        ipaymu_client.ensure_available("/payment/direct")
+    
+    respond_async = payment_data.payment_method != "cod" and (
+        settings.PAYMENT_ASYNC_CREATE or "respond-async" in request.headers.get("prefer", "").lower()
+    )
+    
     # Create payment record
     new_payment = Payment(
         order_id=order.id,
         payment_method=payment_data.payment_method,
         payment_channel=payment_data.payment_channel,
         amount=payment_data.amount,
-        status="pending",
+        status="processing" if respond_async else "pending",
         expired_at=datetime.utcnow() + timedelta(hours=24)
     )
     
     db.add(new_payment)
-    db.commit()
-    db.refresh(new_payment)
+    await db.commit()
+    
+    if respond_async:
+        # The gateway call runs in the background; checkout does not wait for iPaymu
+        payment_jobs.submit(new_payment.id)
+        response.status_code = 202
+        response.headers["Location"] = f"/api/payments/{new_payment.id}"
+        response.headers["Preference-Applied"] = "respond-async"
+        logger.info("Payment queued", extra={"payment_id": new_payment.id, "order": order.order_number, "amount": payment_data.amount})
+        return new_payment
     
     # Create payment via iPaymu if not COD
     if payment_data.payment_method != "cod":
         try:
-            # Get service name from order
-            service = db.query(Service).filter(Service.id == order.service_id).first()
-            service_name = service.name if service else "Layanan NeoIntegra Tech"
-            
-            ipaymu_data = {
-                "name": user.full_name,
-                "phone": user.phone or "08123456789",
-                "email": user.email,
-                "amount": payment_data.amount,
-                "notify_url": f"{settings.BACKEND_URL}/api/payments/callback",
-                "return_url": f"{settings.FRONTEND_URL}/payment/success?order_id={order.id}&order_number={order.order_number}&amount={payment_data.amount}",
-                "expired": 24,
-                "payment_channel": payment_data.payment_channel,
-                "product_name": service_name,
-                "quantity": 1,  # Always 1 for services
-                "order_number": order.order_number,  # For iPaymu referenceId
-                "reference_id": order.order_number
-            }
-            
-            print(f"[Payment Creation] Calling iPaymu API for order {order.order_number}, amount: Rp {payment_data.amount:,.0f}")
-            
-            ipaymu_response = await create_ipaymu_payment(ipaymu_data, payment_data.payment_method)
-            
-            # Log full response for debugging
-            print(f"[Payment Creation] Full iPaymu Response: {json.dumps(ipaymu_response, indent=2)}")
-            
-            # Update payment with iPaymu data
-            new_payment.ipaymu_transaction_id = ipaymu_response.get("TransactionId")
-            new_payment.ipaymu_session_id = ipaymu_response.get("SessionID")
-            
-            # For redirect payment methods
-            new_payment.payment_url = ipaymu_response.get("Url") or ipaymu_response.get("PaymentUrl")
-            
-            # Get payment-specific info based on method
-            payment_info_found = False
-            
-            if payment_data.payment_method == "va":
-                # Try multiple field names for VA number
-                new_payment.va_number = (
-                    ipaymu_response.get("Va") or 
-                    ipaymu_response.get("VaNumber") or 
-                    ipaymu_response.get("PaymentNo") or
-                    ipaymu_response.get("PaymentCode")
-                )
-                print(f"[Payment VA] VA Number: {new_payment.va_number}")
-                if new_payment.va_number:
-                    payment_info_found = True
-            
-            # Fallback: if payment_url exists, consider it success
-            if new_payment.payment_url:
-                payment_info_found = True
-                print(f"[Payment] Payment URL: {new_payment.payment_url}")
+            ipaymu_response = await create_ipaymu_payment(
+                ipaymu_payment_data(order, user, new_payment), payment_data.payment_method
+            )
             
-            # Only raise error if NO payment info at all
-            if not payment_info_found:
-                print(f"[Payment Creation ERROR] No payment info in response!")
-                print(f"[Payment Creation ERROR] Response keys: {list(ipaymu_response.keys())}")
-                print(f"[Payment Creation ERROR] Full response: {json.dumps(ipaymu_response, indent=2)}")
+            # Update payment with iPaymu data; only raise error if NO payment info at all
+            if not apply_gateway_response(new_payment, ipaymu_response):
+                logger.error("No payment info in iPaymu response", extra={"order": order.order_number, "keys": list(ipaymu_response.keys())})
                 raise HTTPException(
                     status_code=500,
                     detail=f"iPaymu tidak mengembalikan informasi pembayaran. Response: {list(ipaymu_response.keys())}"
                 )
             
-            db.commit()
-            db.refresh(new_payment)
+            # Payment pending email, committed together with the gateway data (never fails the payment)
+            queue_payment_pending_email(user, order, new_payment, db)
+            await db.commit()
             
-            print(f"[Payment Creation] Success! Payment ID: {new_payment.id}, VA: {new_payment.va_number}")
-            
-            # Send payment pending email notification
-            try:
-                send_payment_pending_email(
-                    to_email=user.email,
-                    payment_data={
-                        'customer_name': user.full_name,
-                        'order_number': order.order_number,
-                        'service_name': service_name,
-                        'amount': payment_data.amount,
-                        'payment_method': payment_data.payment_method.upper(),
-                        'payment_channel': payment_data.payment_channel.upper() if payment_data.payment_channel else '',
-                        'va_number': new_payment.va_number,
-                        'payment_url': new_payment.payment_url,
-                        'expired_at': new_payment.expired_at.strftime('%d %B %Y %H:%M') if new_payment.expired_at else ''
-                    }
-                )
-                print(f"[Payment Creation] Payment pending email sent to {user.email}")
-            except Exception as email_error:
-                print(f"[Payment Creation] Failed to send pending email: {str(email_error)}")
-                # Don't fail the payment creation if email fails
+            logger.info("Payment created", extra={"payment_id": new_payment.id, "order": order.order_number, "amount": payment_data.amount})
             
         except HTTPException as e:
             # iPaymu API error - delete payment record and re-raise
-            db.delete(new_payment)
-            db.commit()
-            print(f"[Payment Creation Error] iPaymu API failed: {e.detail}")
+            await db.rollback()
+            await db.delete(new_payment)
+            await db.commit()
+            logger.warning("Payment creation failed: iPaymu API error", extra={"order": order.order_number, "detail": e.detail})
             raise
+        except httpx.TimeoutException as e:
+            # Slow gateway - counted by the circuit breaker, no traceback needed
+            await db.rollback()
+            await db.delete(new_payment)
+            await db.commit()
+            logger.warning("Payment creation failed: iPaymu timeout (%s)", type(e).__name__, extra={"order": order.order_number})
+            raise HTTPException(
+                status_code=504,
+                detail="iPaymu tidak merespons, silakan coba lagi beberapa saat lagi."
+            )
         except Exception as e:
             # Unexpected error - delete payment record
-            db.delete(new_payment)
-            db.commit()
-            print(f"[Payment Creation Error] Unexpected error: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            await db.rollback()
+            await db.delete(new_payment)
+            await db.commit()
+            logger.exception("Payment creation failed", extra={"order": order.order_number})
             raise HTTPException(
                 status_code=500,
                 detail=f"Payment creation failed: {str(e)}"
             )
-            new_payment.status = "pending"
-            db.commit()
     else:
         # COD payment - mark as pending
         order.status = "pending"
-        db.commit()
+        await db.commit()
     
     return new_payment
 
 @router.get("/order/{order_id}", response_model=List[PaymentResponse])
 async def get_order_payments(
     order_id: int,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    page: PageParams = Depends(),
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all payments for an order"""
-    user = get_user_from_token(authorization, db)
+    """Get payments for an order, newest first (paginated: X-Next-Cursor / X-Total-Count)
+    
+    ETag / If-None-Match: 304 when no payment of the order changed.
+    """
     
     # Verify order belongs to user
-    order = db.query(Order).filter(Order.id == order_id, Order.user_id == user.id).first()
+    order_id = await db.scalar(select(Order.id).where(Order.id == order_id, Order.user_id == user.id))
+    if not order_id:
+        raise HTTPException(status_code=404, detail="Order not found")
+    
+    query = select(Payment).where(Payment.order_id == order_id)
+    if status:
+        query = query.where(Payment.status == status)
+    
+    version = await list_version(db, query)
+    etag = list_etag(request, f"payments-order-{order_id}", user.id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    set_etag(response, etag)
+    return payments_json.response(await paginate(db, query, Payment, page, response, total=version[0]), response)
+
+# Terminal statuses end a payment event stream
+FINAL_PAYMENT_STATUSES = ("success", "failed", "cancelled", "expired")
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # disable nginx response buffering
+}
+
+async def payment_event_stream(request: Request, key: str, queue: asyncio.Queue, initial_events: list):
+    """Yield SSE frames: current state first, then pushed transitions until a final status"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SSE_MAX_STREAM_SECONDS
+    try:
+        yield "retry: 5000\n\n"
+        for event in initial_events:
+            yield format_sse(event)
+        if initial_events and all(e["status"] in FINAL_PAYMENT_STATUSES for e in initial_events):
+            return
+        
+        while loop.time() < deadline:
+            if await request.is_disconnected():
+                break
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield format_sse(event)
+            if event["status"] in FINAL_PAYMENT_STATUSES:
+                break
+    finally:
+        payment_events.unsubscribe(key, queue)
+
+@router.post("/order/{order_id}/events/token", response_model=StreamToken)
+async def create_order_events_token(
+    order_id: int,
+    request: Request,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Short-lived ?token= for GET /order/{order_id}/events (EventSource cannot send headers)"""
+    
+    if not await db.scalar(select(Order.id).where(Order.id == order_id, Order.user_id == user.id)):
+        raise HTTPException(status_code=404, detail="Order not found")
+    return create_stream_token(request, user)
+
+@router.get("/order/{order_id}/events")
+async def stream_order_payment_events(
+    order_id: int,
+    request: Request,
+    user: User = Depends(get_stream_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream payment status changes for an order as Server-Sent Events
+    
+    EventSource cannot send headers, so a stream token from
+    POST .../events/token may be passed as ?token= instead
+    """
+    
+    order = await db.scalar(select(Order).where(Order.id == order_id, Order.user_id == user.id))
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    payments = db.query(Payment).filter(Payment.order_id == order_id).all()
-    return payments
+    # Subscribe before reading the snapshot so no transition falls in between
+    key = f"order:{order_id}"
+    queue = payment_events.subscribe(key)
+    payments = (await db.scalars(select(Payment).where(Payment.order_id == order_id))).all()
+    initial_events = [payment_event(p) for p in payments]
+    
+    return StreamingResponse(
+        payment_event_stream(request, key, queue, initial_events),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
 
-@router.get("/{payment_id}", response_model=PaymentResponse)
-async def get_payment(
+@router.post("/{payment_id}/events/token", response_model=StreamToken)
+async def create_payment_events_token(
     payment_id: int,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get specific payment"""
-    user = get_user_from_token(authorization, db)
+    """Short-lived ?token= for GET /{payment_id}/events (EventSource cannot send headers)"""
     
-    payment = db.query(Payment).join(Order).filter(
+    owned = select(Payment.id).join(Order).where(Payment.id == payment_id, Order.user_id == user.id)
+    if not await db.scalar(owned):
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return create_stream_token(request, user)
+
+@router.get("/{payment_id}/events")
+async def stream_payment_events(
+    payment_id: int,
+    request: Request,
+    user: User = Depends(get_stream_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Stream status changes of one payment as Server-Sent Events
+    
+    EventSource cannot send headers, so a stream token from
+    POST .../events/token may be passed as ?token= instead
+    """
+    
+    payment = await db.scalar(select(Payment).join(Order).where(
         Payment.id == payment_id,
         Order.user_id == user.id
-    ).first()
+    ))
+    if not payment:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    
+    # Subscribe before reading the snapshot so no transition falls in between
+    key = f"payment:{payment_id}"
+    queue = payment_events.subscribe(key)
+    await db.refresh(payment)
+    
+    return StreamingResponse(
+        payment_event_stream(request, key, queue, [payment_event(payment)]),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.get("/{payment_id}", response_model=PaymentResponse)
+async def get_payment(
+    payment_id: int,
+    request: Request,
+    response: Response,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get specific payment (ETag / If-None-Match: 304 when unchanged)"""
+    
+    owned = (Payment.id == payment_id, Order.user_id == user.id)
+    unchanged = await row_not_modified(
+        request, db, "payment", user.id, select(Payment.id, Payment.updated_at).join(Order).where(*owned)
+    )
+    if unchanged:
+        return unchanged
+    
+    payment = await db.scalar(select(Payment).join(Order).where(*owned))
     
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
-    return payment
+    set_etag(response, row_etag("payment", user.id, payment))
+    return payment_json.response(payment, response)
 
 @router.post("/{payment_id}/check-status", response_model=PaymentResponse)
 async def check_payment_status(
     payment_id: int,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Manually check payment status from iPaymu and update local database"""
-    user = get_user_from_token(authorization, db)
     
-    # Get payment and verify ownership
-    payment = db.query(Payment).join(Order).filter(
+    # Get payment and verify ownership (order, user and subscription in the same query)
+    payment = await db.scalar(select(Payment).join(Order).where(
         Payment.id == payment_id,
         Order.user_id == user.id
-    ).first()
+    ).options(order_graph_options(order_joined=True)))
     
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
     
-    # If already success or failed, return current status
-    if payment.status in ["success", "failed", "cancelled"]:
+    # If already success or failed (or still being created), return current status
+    if payment.status in ["success", "failed", "cancelled", "processing"]:
         return payment
     
     # Check status from iPaymu
@@ -372,89 +346,33 @@ async def check_payment_status(
         raise HTTPException(status_code=400, detail="No iPaymu transaction ID found")
     
     try:
-        # Prepare request to check transaction status
-        url = f"{settings.IPAYMU_BASE_URL}/transaction"
-        body = {
-            "transactionId": payment.ipaymu_transaction_id
-        }
-        
-        signature = generate_ipaymu_signature(body, "POST")
+        # Check transaction status over the shared pooled client
+        status_code = await ipaymu_client.transaction_status(payment.ipaymu_transaction_id)
         
-        headers = {
-            "Content-Type": "application/json",
-            "va": settings.IPAYMU_VA,
-            "signature": signature,
-            "timestamp": datetime.utcnow().strftime("%Y%m%d%H%M%S")
-        }
+        if status_code is not None:
+            if await apply_ipaymu_status(db, payment, status_code, source="Payment Status Check"):
+                await db.commit()
+                payment_events.publish(payment)
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(url, json=body, headers=headers)
-            result = response.json()
-        
-        print(f"[Payment Status Check] Response: {result}")
-        
-        if result.get("Status") == 200 and result.get("Success"):
-            data = result.get("Data", {})
-            status_code = data.get("StatusCode")
-            
-            # Update payment based on status
-            if status_code == "1":  # Success/Paid
-                payment.status = "success"
-                payment.paid_at = now_jakarta()
-                
-                # Update order
-                order = db.query(Order).filter(Order.id == payment.order_id).first()
-                if order and order.status != "paid":
-                    order.status = "paid"
-                    
-                    # Send confirmation email
-                    try:
-                        from ...models import User
-                        user_data = db.query(User).filter(User.id == order.user_id).first()
-                        if user_data:
-                            send_payment_confirmation_email(
-                                to_email=user_data.email,
-                                payment_data={
-                                    'customer_name': user_data.full_name,
-                                    'order_number': order.order_number,
-                                    'amount': payment.amount,
-                                    'payment_method': payment.payment_method,
-                                    'status': 'success',
-                                    'transaction_id': payment.ipaymu_transaction_id
-                                }
-                            )
-                            print(f"[Payment Status Check] Confirmation email sent to {user_data.email}")
-                    except Exception as email_error:
-                        print(f"[Payment Status Check] Email error: {email_error}")
-                
-                db.commit()
-                print(f"[Payment Status Check] Payment #{payment.id} marked as SUCCESS")
-                
-            elif status_code == "0":  # Pending
-                payment.status = "pending"
-                db.commit()
-                print(f"[Payment Status Check] Payment still PENDING")
-                
-            else:  # Failed/Expired
-                payment.status = "failed"
-                db.commit()
-                print(f"[Payment Status Check] Payment marked as FAILED (status_code: {status_code})")
-        
-        db.refresh(payment)
+        # Attributes stay loaded after commit (expire_on_commit=False), no refresh needed
         return payment
         
+    except IpaymuUnavailable:
+        raise
     except Exception as e:
-        print(f"[Payment Status Check Error] {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Payment status check failed", extra={"payment_id": payment_id})
         raise HTTPException(
             status_code=500,
             detail=f"Failed to check payment status: {str(e)}"
         )
 
 @router.post("/callback", response_model=MessageResponse)
-async def payment_callback(request: Request, db: Session = Depends(get_db)):
-    """Handle iPaymu payment callback - supports both JSON and form-urlencoded"""
+async def payment_callback(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Handle iPaymu payment callback - supports both JSON and form-urlencoded
+    
+    Only records the callback in the inbox and returns immediately; order,
+    subscription and email side effects run in the inbox processor.
+    """
     try:
         # Get callback data - support both JSON and form-urlencoded
         content_type = request.headers.get("content-type", "")
@@ -467,77 +385,34 @@ async def payment_callback(request: Request, db: Session = Depends(get_db)):
             form_data = await request.form()
             body = dict(form_data)
         
-        print(f"[iPaymu Callback] Received: {body}")
+        logger.info("iPaymu callback received", extra={"trx_id": body.get("trx_id"), "status_code": body.get("status_code")})
         
         trx_id = body.get("trx_id")
-        status = body.get("status")
         status_code = body.get("status_code")
         
-        # Find payment by transaction ID
-        payment = db.query(Payment).filter(Payment.ipaymu_transaction_id == trx_id).first()
-        
-        if not payment:
-            print(f"[iPaymu Callback] Payment not found for trx_id: {trx_id}")
-            return {"message": "Payment not found"}
+        if not trx_id:
+            logger.warning("iPaymu callback without trx_id ignored")
+            return {"message": "Callback ignored"}
         
-        print(f"[iPaymu Callback] Processing payment ID {payment.id}, status_code: {status_code}")
-        
-        # Update payment status
-        if status_code == "1":  # Success
-            payment.status = "success"
-            payment.paid_at = now_jakarta()
-            
-            # Update order status
-            order = db.query(Order).filter(Order.id == payment.order_id).first()
-            if order:
-                order.status = "paid"
-                print(f"[iPaymu Callback] Order {order.order_number} marked as paid")
-                
-                # Check if this is a renewal order (has subscription_id)
-                if order.subscription_id:
-                    subscription = db.query(Subscription).filter(Subscription.id == order.subscription_id).first()
-                    if subscription:
-                        # Extend subscription by 1 year from current end_date
-                        old_end = subscription.end_date
-                        subscription.end_date = old_end + timedelta(days=365)
-                        subscription.status = "active"
-                        subscription.updated_at = datetime.utcnow()
-                        print(f"[iPaymu Callback] Subscription #{subscription.id} extended")
-                        print(f"  Old end: {old_end}")
-                        print(f"  New end: {subscription.end_date}")
-                
-                # Send payment confirmation email
-                try:
-                    user = db.query(Order).join(Order).filter(Order.id == order.id).first().user
-                    send_payment_confirmation_email(
-                        to_email=user.email,
-                        payment_data={
-                            'customer_name': user.full_name,
-                            'order_number': order.order_number,
-                            'amount': payment.amount,
-                            'payment_method': payment.payment_method,
-                            'status': 'success',
-                            'transaction_id': payment.ipaymu_transaction_id
-                        }
-                    )
-                    print(f"[iPaymu Callback] Payment confirmation email sent to {user.email}")
-                except Exception as e:
-                    print(f"[iPaymu Callback] Failed to send confirmation email: {str(e)}")
-        
-        elif status_code == "0":  # Pending
-            payment.status = "pending"
-            print(f"[iPaymu Callback] Payment still pending")
-        
-        else:  # Failed or expired
-            payment.status = "failed"
-            print(f"[iPaymu Callback] Payment failed with status_code: {status_code}")
+        # Store the raw payload and ack; the inbox processor applies it in the background
+        entry = PaymentCallbackInbox(
+            trx_id=str(trx_id),
+            status_code=str(status_code) if status_code is not None else "",
+            payload=json.dumps(body, default=str)
+        )
+        db.add(entry)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Same trx_id + status already received - iPaymu retry or duplicate
+            await db.rollback()
+            logger.info("Duplicate iPaymu callback", extra={"trx_id": trx_id, "status_code": status_code})
+            return {"message": "Callback already received"}
         
-        db.commit()
+        callback_inbox.notify()
         
-        return {"message": "Callback processed"}
+        return {"message": "Callback received"}
     
     except Exception as e:
-        print(f"[iPaymu Callback Error] {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("iPaymu callback error")
         return {"message": "Callback error"}
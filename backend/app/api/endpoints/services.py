@@ -1,40 +1,47 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from ...database import get_db
-from ...models import Service
+from ...catalog import service_catalog, render_json
+from ...conditional import etag_matches
+from ...config import settings
+from ...database import get_async_db
 from ...schemas import ServiceResponse
 
 router = APIRouter(prefix="/services", tags=["Services"])
 
+def catalog_response(request: Request, etag: str, body: bytes) -> Response:
+    """Serve a pre-rendered catalog body, or 304 if the client already has it"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.CATALOG_HTTP_MAX_AGE_SECONDS}",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=List[ServiceResponse])
 async def get_services(
+    request: Request,
     category: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all active services, optionally filtered by category"""
-    query = db.query(Service).filter(Service.is_active == True)
-    
-    if category:
-        query = query.filter(Service.category == category)
-    
-    services = query.all()
-    return services
+    catalog = await service_catalog.get(db)
+    body = catalog.category_body(category) if category else catalog.active_json
+    return catalog_response(request, catalog.etag, body)
 
 @router.get("/{service_id}", response_model=ServiceResponse)
-async def get_service(service_id: int, db: Session = Depends(get_db)):
+async def get_service(service_id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     """Get specific service by ID"""
-    service = db.query(Service).filter(Service.id == service_id).first()
+    catalog = await service_catalog.get(db)
+    service = catalog.by_id.get(service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
-    return service
+    return catalog_response(request, catalog.etag, render_json(service.model_dump(mode="json")))
 
 @router.get("/category/{category}", response_model=List[ServiceResponse])
-async def get_services_by_category(category: str, db: Session = Depends(get_db)):
+async def get_services_by_category(category: str, request: Request, db: AsyncSession = Depends(get_async_db)):
     """Get services by category"""
-    services = db.query(Service).filter(
-        Service.category == category,
-        Service.is_active == True
-    ).all()
-    return services
+    catalog = await service_catalog.get(db)
+    return catalog_response(request, catalog.etag, catalog.category_body(category))
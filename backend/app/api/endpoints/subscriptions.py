@@ -1,90 +1,123 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timedelta
+import logging
 
-from ...database import get_db
+from ...database import get_async_db
 from ...models import Subscription, Order, User
 from ...schemas import SubscriptionResponse, SubscriptionRenewalCreate, MessageResponse
 from ...email import send_order_confirmation_email
-from ...timezone import now_jakarta
-from .auth import get_current_user
+from ...pagination import PageParams, paginate
+from ...serialization import subscription_json, subscriptions_json
+from ...conditional import (
+    row_not_modified, row_etag, list_version, list_etag, etag_matches, not_modified, set_etag
+)
+from ...order_numbers import generate_order_number
+from .auth import get_authenticated_user
 
-router = APIRouter(prefix="/subscriptions", tags=["Subscriptions"])
+logger = logging.getLogger(__name__)
 
-def get_user_from_token(authorization: Optional[str], db: Session) -> User:
-    """Extract user from authorization header"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Not authenticated")
-    token = authorization.replace("Bearer ", "")
-    return get_current_user(token, db)
+router = APIRouter(prefix="/subscriptions", tags=["Subscriptions"])
 
 @router.get("/my-subscriptions", response_model=List[SubscriptionResponse])
 async def get_my_subscriptions(
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    page: PageParams = Depends(),
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get all subscriptions for current user"""
-    user = get_user_from_token(authorization, db)
-    subscriptions = db.query(Subscription).filter(
-        Subscription.user_id == user.id
-    ).order_by(Subscription.created_at.desc()).all()
-    return subscriptions
+    """Get subscriptions for current user, newest first (paginated: X-Next-Cursor / X-Total-Count)
+    
+    ETag / If-None-Match: 304 when none of the user's subscriptions changed.
+    """
+    query = select(Subscription).where(Subscription.user_id == user.id)
+    if status:
+        query = query.where(Subscription.status == status)
+    
+    version = await list_version(db, query)
+    etag = list_etag(request, "subscriptions", user.id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    set_etag(response, etag)
+    return subscriptions_json.response(await paginate(db, query, Subscription, page, response, total=version[0]), response)
 
 @router.get("/expiring-soon", response_model=List[SubscriptionResponse])
 async def get_expiring_subscriptions(
-    authorization: Optional[str] = Header(None),
+    request: Request,
+    response: Response,
+    user: User = Depends(get_authenticated_user),
     days: int = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get subscriptions expiring within specified days (default 30)"""
-    user = get_user_from_token(authorization, db)
+    """Get subscriptions expiring within specified days (default 30)
+    
+    ETag / If-None-Match: 304 while the same, unchanged subscriptions are in the window.
+    """
     
     expiry_threshold = datetime.utcnow() + timedelta(days=days)
     
-    subscriptions = db.query(Subscription).filter(
+    query = select(Subscription).where(
         Subscription.user_id == user.id,
         Subscription.is_active == True,
         Subscription.end_date <= expiry_threshold,
         Subscription.end_date >= datetime.utcnow()
-    ).all()
+    )
     
-    return subscriptions
+    version = await list_version(db, query)
+    etag = list_etag(request, "subscriptions-expiring", user.id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    # Nothing in the window: skip the row query
+    subscriptions = (await db.scalars(query)).all() if version[0] else []
+    
+    set_etag(response, etag)
+    return subscriptions_json.response(subscriptions, response)
 
 @router.get("/{subscription_id}", response_model=SubscriptionResponse)
 async def get_subscription(
     subscription_id: int,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Get specific subscription"""
-    user = get_user_from_token(authorization, db)
+    """Get specific subscription (ETag / If-None-Match: 304 when unchanged)"""
     
-    subscription = db.query(Subscription).filter(
-        Subscription.id == subscription_id,
-        Subscription.user_id == user.id
-    ).first()
+    owned = (Subscription.id == subscription_id, Subscription.user_id == user.id)
+    unchanged = await row_not_modified(
+        request, db, "subscription", user.id, select(Subscription.id, Subscription.updated_at).where(*owned)
+    )
+    if unchanged:
+        return unchanged
+    
+    subscription = await db.scalar(select(Subscription).where(*owned))
     
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
     
-    return subscription
+    set_etag(response, row_etag("subscription", user.id, subscription))
+    return subscription_json.response(subscription, response)
 
 @router.post("/renew/{subscription_id}")
 async def renew_subscription(
     subscription_id: int,
     renewal_data: SubscriptionRenewalCreate,
-    authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_authenticated_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create renewal order for a subscription"""
-    user = get_user_from_token(authorization, db)
     
     # Get subscription
-    subscription = db.query(Subscription).filter(
+    subscription = await db.scalar(select(Subscription).where(
         Subscription.id == subscription_id,
         Subscription.user_id == user.id
-    ).first()
+    ))
     
     if not subscription:
         raise HTTPException(status_code=404, detail="Subscription not found")
@@ -92,14 +125,10 @@ async def renew_subscription(
     # Determine renewal price
     renewal_price = subscription.renewal_price if subscription.renewal_price else subscription.price
     
-    # Generate order number (Jakarta time)
-    timestamp = now_jakarta().strftime("%Y%m%d-%H%M%S")
-    order_number = f"ORD-{timestamp}"
-    
     # Create renewal order
     renewal_order = Order(
         user_id=user.id,
-        order_number=order_number,
+        order_number=generate_order_number(),
         service_name=f"Renewal: {subscription.package_name}",
         quantity=1,
         unit_price=renewal_price,
@@ -110,10 +139,8 @@ async def renew_subscription(
     )
     
     db.add(renewal_order)
-    db.commit()
-    db.refresh(renewal_order)
     
-    # Send order confirmation email
+    # Order confirmation email, committed together with the renewal order
     try:
         send_order_confirmation_email(
             to_email=user.email,
@@ -124,15 +151,15 @@ async def renew_subscription(
                 'quantity': 1,
                 'total_amount': renewal_price,
                 'status': 'pending'
-            }
+            },
+            db=db
         )
-        print(f"✅ [Renewal] Email sent to {user.email} for order {renewal_order.order_number}")
-    except Exception as e:
-        print(f"❌ [Renewal] Failed to send email: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception("Failed to queue renewal email", extra={"order": renewal_order.order_number})
         # Don't fail the renewal if email fails
     
+    await db.commit()
+    
     return {
         "message": "Renewal order created successfully",
         "order_id": renewal_order.id,
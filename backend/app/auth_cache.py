@@ -0,0 +1,87 @@
+"""
+Cache of authenticated users for the JWT dependency
+
+Dashboard and status polling send the same token many times a minute; each
+call used to re-read the user row. Entries hold the user's column values
+(never a live ORM object) for a short TTL and are dropped whenever the
+user row changes. The cache is per process, so with several workers a
+change elsewhere is picked up at the latest after the TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from .config import settings
+from .models import User
+
+
+class AuthUserCache:
+    """Bounded LRU + TTL cache of user rows keyed by token subject (email)"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, subject: str) -> Optional[User]:
+        """Return a fresh detached User built from the cached row, or None"""
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[subject]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            values = entry[1]
+
+        # New instance per request so handlers never share mutable state
+        user = User(**values)
+        make_transient_to_detached(user)
+        return user
+
+    def put(self, subject: str, user: User):
+        if self.ttl_seconds <= 0:
+            return
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl_seconds, values)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, subject: str):
+        """Drop a user after their row changed (profile, password, verification)"""
+        with self._lock:
+            if self._entries.pop(subject, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Shared cache instance
+auth_user_cache = AuthUserCache(settings.AUTH_USER_CACHE_MAX_ENTRIES, settings.AUTH_USER_CACHE_TTL_SECONDS)
@@ -0,0 +1,144 @@
+"""
+Durable inbox for iPaymu payment callbacks
+
+POST /payments/callback only stores the raw payload and acks. Entries are
+applied here in the background, in arrival order, each in its own
+transaction together with its inbox row and the confirmation email, so a
+crash or a failed commit either leaves an entry pending (retried, nothing
+sent) or fully applied.
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select, update
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .events import payment_events
+from .models import Payment, PaymentCallbackInbox
+from .payment_status import apply_ipaymu_status, order_graph_options
+
+logger = logging.getLogger(__name__)
+
+
+async def process_pending_callbacks(after_id: int = 0, limit: int = 100) -> dict:
+    """Apply pending inbox entries with id > after_id
+
+    Returns counters (processed, retried, failed) and last_id, the id of the
+    last entry looked at, or None when there was nothing to do.
+    """
+    summary = {"processed": 0, "retried": 0, "failed": 0, "last_id": None}
+    async with AsyncSessionLocal() as db:
+        entries = (await db.scalars(
+            select(PaymentCallbackInbox).where(
+                PaymentCallbackInbox.status == "pending",
+                PaymentCallbackInbox.id > after_id
+            ).order_by(PaymentCallbackInbox.id).limit(limit)
+        )).all()
+
+        for entry in entries:
+            entry_id = entry.id
+            summary["last_id"] = entry_id
+            entry.attempts = (entry.attempts or 0) + 1
+            try:
+                payment = await db.scalar(
+                    select(Payment).where(Payment.ipaymu_transaction_id == entry.trx_id)
+                    .options(order_graph_options())
+                )
+
+                if not payment:
+                    # The callback may race the commit of create_payment; retry a few times
+                    entry.last_error = f"Payment not found for trx_id: {entry.trx_id}"
+                    if entry.attempts >= settings.CALLBACK_INBOX_MAX_ATTEMPTS:
+                        entry.status = "failed"
+                        summary["failed"] += 1
+                    else:
+                        summary["retried"] += 1
+                    await db.commit()
+                    continue
+
+                changed = await apply_ipaymu_status(db, payment, entry.status_code, source="iPaymu Callback")
+                entry.status = "processed"
+                entry.processed_at = datetime.utcnow()
+                entry.last_error = None
+                await db.commit()
+                summary["processed"] += 1
+
+                if changed:
+                    payment_events.publish(payment)
+            except Exception as e:
+                await db.rollback()
+                logger.warning("Callback inbox entry failed: %s: %s", type(e).__name__, e, extra={"entry_id": entry_id})
+                entry = await db.get(PaymentCallbackInbox, entry_id)
+                entry.attempts = (entry.attempts or 0) + 1
+                entry.last_error = f"{type(e).__name__}: {e}"
+                if entry.attempts >= settings.CALLBACK_INBOX_MAX_ATTEMPTS:
+                    entry.status = "failed"
+                    summary["failed"] += 1
+                else:
+                    summary["retried"] += 1
+                await db.commit()
+                # Rollback expired the rest of the batch; the caller resumes after this entry
+                break
+
+    return summary
+
+
+async def requeue_failed_callbacks() -> int:
+    """Reset failed inbox entries to pending so they are replayed"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(PaymentCallbackInbox).where(
+                PaymentCallbackInbox.status == "failed"
+            ).values(status="pending", attempts=0)
+        )
+        await db.commit()
+        return result.rowcount
+
+
+class CallbackInboxProcessor:
+    """Background task draining the callback inbox"""
+
+    def __init__(self):
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def notify(self):
+        """Wake the processor after a new entry was committed"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def drain(self) -> dict:
+        """Process everything currently pending once, batch by batch"""
+        total = {"processed": 0, "retried": 0, "failed": 0}
+        last_id = 0
+        while True:
+            summary = await process_pending_callbacks(last_id)
+            batch_last_id = summary.pop("last_id")
+            if batch_last_id is None:
+                return total
+            for key, value in summary.items():
+                total[key] += value
+            last_id = batch_last_id
+
+    async def run(self):
+        """Replay leftovers from before a restart, then process new entries as they arrive"""
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                summary = await self.drain()
+                if any(summary.values()):
+                    logger.info("Callback inbox drained", extra=summary)
+            except Exception as e:
+                logger.exception("Callback inbox error")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.CALLBACK_INBOX_RETRY_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+# Shared processor instance
+callback_inbox = CallbackInboxProcessor()
@@ -0,0 +1,199 @@
+"""
+In-process service catalog cache
+
+The catalog only changes through the admin endpoints, yet every page view
+queried the services table. The whole table is loaded once into an
+immutable snapshot with per-id, per-slug and per-category indexes and the
+JSON bodies pre-rendered. Admin writes invalidate it; a TTL bounds how long
+another worker process can serve an outdated copy.
+
+DEFAULT_SERVICES is the single source of the built-in catalog, written with
+one INSERT ... ON CONFLICT (slug) statement by startup, the admin endpoint
+and the seeder.
+"""
+import hashlib
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .models import Service
+from .schemas import ServiceResponse
+
+
+DEFAULT_SERVICES = [
+    {
+        "name": "Paket All In Service",
+        "slug": "all-in",
+        "description": "Paket paling hemat & optimal untuk bisnis jangka panjang. Sudah termasuk Website, SEO, Mail Server, Cloudflare, dan Hosting.",
+        "category": "package",
+        "price": 81000000,
+        "duration_days": 365,
+        "features": '["Website Service - Custom UI/UX", "SEO Service (12 bulan)", "Mail Server Service", "Cloudflare Protection", "Hosting Performa Tinggi", "Support Teknis Lengkap"]',
+        "is_active": True
+    },
+    {
+        "name": "Website Service",
+        "slug": "website",
+        "description": "Website Service Profesional - Pembuatan website custom dengan performa tinggi.",
+        "category": "web",
+        "price": 36000000,
+        "duration_days": 365,
+        "features": '["Custom UI/UX", "Hosting Performa Tinggi", "Optimasi Kecepatan", "Maintenance & Update", "Backup & Keamanan", "Support Teknis"]',
+        "is_active": True
+    },
+    {
+        "name": "SEO Service",
+        "slug": "seo",
+        "description": "SEO Service Berkelanjutan (12 Bulan) - Optimasi mesin pencari profesional.",
+        "category": "marketing",
+        "price": 42000000,
+        "duration_days": 365,
+        "features": '["SEO On-Page & Technical", "Optimasi Struktur & Kecepatan", "Google Search Console & Analytics", "Monitoring Keyword Bulanan", "Laporan Performa SEO", "Optimasi Berkelanjutan 12 Bulan"]',
+        "is_active": True
+    },
+    {
+        "name": "Mail Server Service",
+        "slug": "mail-server",
+        "description": "Mail Server Bisnis Profesional - Email bisnis dengan domain perusahaan.",
+        "category": "email",
+        "price": 15000000,
+        "duration_days": 365,
+        "features": '["Email dengan Domain Perusahaan", "Setup SPF, DKIM, DMARC", "Perlindungan Spam & Phishing", "Sinkronisasi Webmail & Perangkat", "Maintenance & Support"]',
+        "is_active": True
+    },
+    {
+        "name": "Cloudflare Service",
+        "slug": "cloudflare",
+        "description": "Cloudflare Protection & Performance - Keamanan dan performa maksimal.",
+        "category": "security",
+        "price": 24000000,
+        "duration_days": 365,
+        "features": '["CDN Global & Caching", "Proteksi DDoS & Firewall", "SSL Full Encryption", "Proteksi Bot & Traffic Berbahaya", "Monitoring Keamanan 24/7"]',
+        "is_active": True
+    },
+    {
+        "name": "Test Payment Service",
+        "slug": "test-payment",
+        "description": "Service untuk test pembayaran dengan nominal minimal Rp 10.000 (minimum iPaymu)",
+        "category": "test",
+        "price": 10000,
+        "duration_days": 1,
+        "features": '["Test Payment", "Minimal Amount", "Email Notification Test"]',
+        "is_active": True
+    }
+]
+
+
+def default_services_upsert(dialect_name: str, update: bool, slugs: List[str] = None):
+    """One INSERT for the built-in services (all, or only `slugs`)
+
+    update=False only adds missing slugs (startup); update=True also resets
+    existing rows to the defaults (admin init, seeder), leaving is_active as
+    an admin set it. Run it with conn/session.execute(); rowcount is the
+    number of rows written.
+    """
+    rows = [dict(s) for s in DEFAULT_SERVICES if slugs is None or s["slug"] in slugs]
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    statement = dialect_insert(Service).values(rows)
+    if not update:
+        return statement.on_conflict_do_nothing(index_elements=["slug"])
+    columns = {key: statement.excluded[key] for key in rows[0] if key not in ("slug", "is_active")}
+    columns["updated_at"] = datetime.utcnow()
+    return statement.on_conflict_do_update(index_elements=["slug"], set_=columns)
+
+
+def render_json(content) -> bytes:
+    """Same encoding as the app's default ORJSONResponse"""
+    return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: int
+    etag: str
+    loaded_at: float
+    by_id: Dict[int, ServiceResponse]
+    by_slug: Dict[str, ServiceResponse]
+    active_json: bytes
+    category_json: Dict[str, bytes] = field(default_factory=dict)
+
+    def category_body(self, category: str) -> bytes:
+        return self.category_json.get(category, b"[]")
+
+
+class ServiceCatalog:
+    """Versioned catalog snapshot, rebuilt on demand after invalidation or TTL"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self.hits = 0
+        self.loads = 0
+
+    async def get(self, db: AsyncSession) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < self.ttl_seconds:
+            self.hits += 1
+            return snapshot
+
+        version = self.version
+        services = (await db.scalars(select(Service).order_by(Service.id))).all()
+        snapshot = self._build(version, services)
+        self.loads += 1
+        # Do not store a snapshot that an admin write invalidated while we were loading
+        if version == self.version:
+            self._snapshot = snapshot
+        return snapshot
+
+    def _build(self, version: int, services: List[Service]) -> CatalogSnapshot:
+        entries = [ServiceResponse.model_validate(s) for s in services]
+        active = [e for e in entries if e.is_active]
+
+        active_dump = [e.model_dump(mode="json") for e in active]
+        by_category: Dict[str, list] = {}
+        for entry, dumped in zip(active, active_dump):
+            by_category.setdefault(entry.category, []).append(dumped)
+
+        active_json = render_json(active_dump)
+        # Content hash, so every worker process serves the same ETag for the same catalog
+        digest = hashlib.sha1(render_json([e.model_dump(mode="json") for e in entries])).hexdigest()[:16]
+
+        return CatalogSnapshot(
+            version=version,
+            etag=f'"catalog-{digest}"',
+            loaded_at=time.monotonic(),
+            by_id={e.id: e for e in entries},
+            by_slug={e.slug: e for e in entries if e.slug},
+            active_json=active_json,
+            category_json={category: render_json(items) for category, items in by_category.items()},
+        )
+
+    def invalidate(self):
+        """Drop the snapshot after the services table changed"""
+        self.version += 1
+        self._snapshot = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": self.version,
+            "loaded": snapshot is not None,
+            "services": len(snapshot.by_id) if snapshot else 0,
+            "etag": snapshot.etag if snapshot else None,
+            "hits": self.hits,
+            "loads": self.loads,
+        }
+
+
+# Shared catalog instance
+service_catalog = ServiceCatalog(settings.CATALOG_CACHE_TTL_SECONDS)
@@ -0,0 +1,87 @@
+"""
+Conditional GET for user-scoped resources (orders, payments, subscriptions)
+
+The dashboard and payment pages poll these endpoints while the rows rarely
+change. Every row carries updated_at (bumped by the ORM on each write), so
+the ETag is derived from row versions only: (id, updated_at) for one row,
+(count, max(updated_at), sum(id)) for a filtered list. A request with
+If-None-Match runs just that version lookup - no full rows, no Pydantic -
+and gets 304 when nothing changed. The tags are weak (W/): they follow row
+versions, not response bytes.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+
+def weak_etag(kind: str, *versions) -> str:
+    # APP_VERSION: a deploy that changes a response schema invalidates old tags
+    raw = "|".join(str(v) for v in (settings.APP_VERSION, kind, *versions))
+    return f'W/"{kind}-{hashlib.sha1(raw.encode()).hexdigest()[:16]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check with weak comparison (W/ prefixes are ignored)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    # Per-user data: browsers may keep it but must revalidate on every use
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
+
+
+def set_etag(response: Response, etag: str):
+    response.headers.update(cache_headers(etag))
+
+
+def row_etag(kind: str, user_id: int, row) -> str:
+    """ETag of one loaded row (anything with id and updated_at)"""
+    return weak_etag(kind, user_id, row.id, row.updated_at)
+
+
+async def row_not_modified(request: Request, db: AsyncSession, kind: str, user_id: int, version_query) -> Optional[Response]:
+    """304 if the client's copy of one row is current, else None
+
+    version_query selects (id, updated_at) with the same ownership filter as
+    the full query; it only runs when the request carries If-None-Match. A
+    missing row returns None so the caller answers 404 as usual.
+    """
+    if "if-none-match" not in request.headers:
+        return None
+    version = (await db.execute(version_query)).first()
+    if version is None:
+        return None
+    etag = weak_etag(kind, user_id, *version)
+    return not_modified(etag) if etag_matches(request, etag) else None
+
+
+async def list_version(db: AsyncSession, query) -> tuple:
+    """(count, max(updated_at), sum(id)) of a filtered list query
+
+    sum(id) catches a row leaving and another entering the set between two
+    polls, which count and max(updated_at) alone can miss.
+    """
+    rows = query.order_by(None).subquery()
+    return tuple((await db.execute(
+        select(func.count(), func.max(rows.c.updated_at), func.sum(rows.c.id))
+    )).one())
+
+
+def list_etag(request: Request, kind: str, user_id: int, version: tuple) -> str:
+    # Query string included: every page / filter is its own representation
+    return weak_etag(kind, user_id, request.url.query, *version)
@@ -16,10 +16,31 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./neointegratech.db")
     
+    # Connection pool (per engine; the app runs one sync and one async engine)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # max wait for a free pooled connection
+    DB_POOL_RECYCLE: int = 1800  # seconds before a pooled connection is reopened
+    DB_QUERY_WARN_THRESHOLD: int = 20  # DEBUG: log requests running more queries than this
+    
+    # SQLite storage profile (applied to every new connection)
+    SQLITE_JOURNAL_MODE: str = "WAL"  # readers no longer block the writer
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # safe with WAL, fsync only at checkpoints
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # wait for a lock instead of "database is locked"
+    SQLITE_CACHE_SIZE_KB: int = 65536  # page cache per connection
+    SQLITE_MMAP_SIZE: int = 268435456  # 256 MB memory-mapped I/O, 0 disables
+    SQLITE_TEMP_STORE: str = "MEMORY"
+    
     # Security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    STREAM_TOKEN_EXPIRE_SECONDS: int = 60  # ?token= of an event stream URL, scoped to that stream
+    AUTH_USER_CACHE_TTL_SECONDS: float = 60.0  # 0 disables the authenticated-user cache
+    AUTH_USER_CACHE_MAX_ENTRIES: int = 10000
+    PASSWORD_HASH_WORKERS: int = min(4, os.cpu_count() or 1)  # bcrypt threads
+    PASSWORD_HASH_MAX_QUEUE: int = 64  # waiting hash/verify calls before 503
+    ADMIN_TOKEN: str = ""  # operator endpoints (mail queue, callback inbox replay) need "Authorization: Bearer <token>"; empty = disabled
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -49,21 +70,96 @@ class Settings(BaseSettings):
     SMTP_USER: str = os.getenv("MAIL_USERNAME", os.getenv("SMTP_USER", ""))
     SMTP_PASSWORD: str = os.getenv("MAIL_PASSWORD", os.getenv("SMTP_PASSWORD", ""))
     EMAIL_FROM: str = os.getenv("MAIL_FROM", os.getenv("EMAIL_FROM", "noreply@neointegra.tech"))
+    SMTP_STARTTLS: bool = True  # false only for a local plaintext relay (e.g. the load-test SMTP sink)
+    SMTP_TIMEOUT: float = 30.0
+    SMTP_SESSION_IDLE_SECONDS: int = 60  # close/probe a reused SMTP session after this idle time
+    
+    # Outbound mail queue
+    MAIL_QUEUE_BATCH_SIZE: int = 50
+    MAIL_QUEUE_POLL_SECONDS: int = 15
+    MAIL_QUEUE_MAX_ATTEMPTS: int = 5
+    MAIL_QUEUE_RETRY_BASE_SECONDS: int = 30  # doubled after every failed attempt
+    MAIL_PROVIDER_MAX_PER_MINUTE: int = 120  # deliveries per recipient domain (gmail.com, ...); 0 = unlimited
+    
+    # Subscription renewal reminders (queued through the mail queue)
+    SUBSCRIPTION_REMINDERS_ENABLED: bool = True
+    SUBSCRIPTION_REMINDER_DAYS: list = [7, 3, 1, 0]  # H-7, H-3, H-1 and the end date itself
+    SUBSCRIPTION_REMINDER_INTERVAL_SECONDS: int = 3600  # reruns are safe: queued reminders are logged
+    SUBSCRIPTION_REMINDER_BATCH_SIZE: int = 500
     
     # iPaymu Payment Gateway
     IPAYMU_VA: str = os.getenv("IPAYMU_VA", "")
     IPAYMU_API_KEY: str = os.getenv("IPAYMU_API_KEY", "")
     IPAYMU_PRODUCTION: bool = os.getenv("IPAYMU_PRODUCTION", "false").lower() == "true"
+    IPAYMU_API_URL: str = ""  # overrides the sandbox/production URL (e.g. loadtest/fake_ipaymu.py)
     
     @property
     def IPAYMU_BASE_URL(self) -> str:
         """Return iPaymu URL based on production mode"""
+        if self.IPAYMU_API_URL:
+            return self.IPAYMU_API_URL.rstrip("/")
         if self.IPAYMU_PRODUCTION:
             return "https://my.ipaymu.com/api/v2"
         return "https://sandbox.ipaymu.com/api/v2"
     
+    # iPaymu HTTP client pool (shared keep-alive connections)
+    IPAYMU_MAX_CONNECTIONS: int = 20
+    IPAYMU_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    IPAYMU_KEEPALIVE_EXPIRY: float = 120.0  # seconds an idle connection is kept open
+    IPAYMU_CONNECT_TIMEOUT: float = 5.0
+    IPAYMU_READ_TIMEOUT: float = 30.0
+    IPAYMU_POOL_TIMEOUT: float = 5.0  # max wait for a free pooled connection
+    
+    # iPaymu bulkhead and circuit breaker (fail fast with 503 while the gateway is down)
+    IPAYMU_MAX_CONCURRENT_CALLS: int = 10  # outbound calls in flight; the rest wait for a slot
+    IPAYMU_BULKHEAD_WAIT_SECONDS: float = 2.0  # max wait for a slot before 503
+    IPAYMU_BREAKER_FAILURE_THRESHOLD: int = 5  # consecutive timeouts/connection errors/5xx that open the circuit
+    IPAYMU_BREAKER_RESET_SECONDS: float = 30.0  # open time before one probe call is let through
+    
+    # Background reconciliation of pending payments
+    PAYMENT_RECONCILE_ENABLED: bool = True
+    PAYMENT_RECONCILE_INTERVAL_SECONDS: int = 60
+    PAYMENT_RECONCILE_BATCH_SIZE: int = 100
+    PAYMENT_RECONCILE_CONCURRENCY: int = 5  # max concurrent iPaymu /transaction calls
+    
+    # iPaymu callback inbox (callbacks are stored, acked, then applied in background)
+    CALLBACK_INBOX_MAX_ATTEMPTS: int = 5
+    CALLBACK_INBOX_RETRY_SECONDS: int = 30
+    
+    # Asynchronous payment creation: POST /payments/ answers 202 and the iPaymu
+    # call runs in a background job (per request with "Prefer: respond-async")
+    PAYMENT_ASYNC_CREATE: bool = False  # true: every VA payment is created async
+    PAYMENT_JOB_CONCURRENCY: int = 5
+    PAYMENT_JOB_MAX_ATTEMPTS: int = 5
+    PAYMENT_JOB_RETRY_SECONDS: int = 5  # doubled after every transient failure
+    
+    # List pagination (orders, payments, subscriptions)
+    PAGE_SIZE_DEFAULT: int = 50
+    PAGE_SIZE_MAX: int = 200
+    
+    # Service catalog cache
+    CATALOG_CACHE_TTL_SECONDS: int = 300  # reload even without an admin write (other workers)
+    CATALOG_HTTP_MAX_AGE_SECONDS: int = 60  # browser/nginx freshness, then revalidate via ETag
+    
     # Rate Limiting
-    RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_PER_MINUTE: int = 60  # budget per client IP and cost class; login costs 10, forgot-password 20
+    RATE_LIMIT_MAX_CLIENTS: int = 100000  # LRU cap on tracked (client IP, cost class) buckets
+    RATE_LIMIT_TRUST_PROXY: bool = False  # True behind nginx: use X-Real-IP, else the proxy's (last) X-Forwarded-For hop; warns once if those headers arrive while off
+    
+    # Logging (queue-backed, written by a background thread)
+    LOG_LEVEL: str = ""  # DEBUG/INFO/WARNING; empty = DEBUG when DEBUG=True, else INFO
+    LOG_FORMAT: str = "text"  # "text" (key=value) or "json" (one object per line)
+    LOG_QUEUE_SIZE: int = 10000  # records beyond this are dropped, never blocking a request
+    
+    # Startup warm-up: DB pool, catalog, iPaymu and SMTP connections before the first request
+    WARMUP_ENABLED: bool = True
+    WARMUP_TIMEOUT_SECONDS: float = 10.0  # per step; a slow gateway/SMTP never blocks startup longer
+    
+    # Prometheus metrics (/metrics)
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: str = ""  # if set, scrapers must send "Authorization: Bearer <token>"
+    EVENT_LOOP_LAG_INTERVAL_SECONDS: float = 0.5  # how often the loop lag probe wakes up
     
     class Config:
         env_file = ".env"
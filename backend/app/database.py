@@ -1,20 +1,80 @@
-from sqlalchemy import create_engine
+import asyncio
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 
-# Create engine
-if settings.DATABASE_URL.startswith("sqlite"):
+def async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL to its asyncio driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+IS_SQLITE = settings.DATABASE_URL.startswith("sqlite")
+
+def sqlite_pragmas() -> dict:
+    """PRAGMA values of the configured SQLite storage profile"""
+    return {
+        "journal_mode": settings.SQLITE_JOURNAL_MODE.lower(),
+        "synchronous": settings.SQLITE_SYNCHRONOUS.upper(),
+        "busy_timeout": settings.SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": -settings.SQLITE_CACHE_SIZE_KB,  # negative = size in KiB, not pages
+        "mmap_size": settings.SQLITE_MMAP_SIZE,
+        "temp_store": settings.SQLITE_TEMP_STORE.upper(),
+    }
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Connect hook: apply the storage profile to a new SQLite connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+def pool_options(url: str) -> dict:
+    """Explicit pool sizing; in-memory SQLite keeps its single-connection pool"""
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+aiosqlite:")):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": not url.startswith("sqlite"),
+    }
+
+# Create engine (sync: scripts, seed, init_db)
+if IS_SQLITE:
     engine = create_engine(
         settings.DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        **pool_options(settings.DATABASE_URL)
     )
 else:
-    engine = create_engine(settings.DATABASE_URL)
+    engine = create_engine(settings.DATABASE_URL, **pool_options(settings.DATABASE_URL))
+
+# Create async engine (API routes and background tasks)
+async_engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    **pool_options(settings.DATABASE_URL)
+)
+
+if IS_SQLITE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
 
 # Create session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async sessions keep attributes loaded after commit - lazy refreshes are not
+# possible outside an await
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 # Base class for models
 Base = declarative_base()
 
@@ -26,11 +86,77 @@ def get_db():
     finally:
         db.close()
 
+# Dependency for getting async DB session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 # Initialize database (create tables)
-def init_db():
+def init_db() -> bool:
+    """Create/upgrade the schema unless it is already at the latest version
+
+    A database at LATEST_VERSION costs one query; create_all() (a PRAGMA per
+    table) and the migrations only run for new or older databases, so every
+    schema change needs a migration. Returns True if anything was run.
+    """
+    from .migrations import LATEST_VERSION, current_version, run_migrations
+    version = current_version(engine)
+    if version >= LATEST_VERSION:
+        print(f"✅ Database schema up to date (version {version})")
+        return False
+
     from . import models  # Import models to register them
     Base.metadata.create_all(bind=engine)
     print("✅ Database tables created successfully!")
+    # Existing databases: add indexes/columns introduced after they were created
+    run_migrations(engine)
+    return True
+
+# Open pooled connections before the first request needs them
+async def warm_up_database(connections: int = None) -> int:
+    """Fill the async pool (and open one sync connection) with PRAGMAs applied
+
+    Returns the number of async connections opened.
+    """
+    connections = connections or settings.DB_POOL_SIZE
+
+    async def touch():
+        async with async_engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    if not pool_options(settings.DATABASE_URL):
+        connections = 1  # in-memory SQLite: one shared connection
+    await asyncio.gather(*(touch() for _ in range(connections)))
+    # Mail queue, callback inbox and scripts use the sync engine from worker threads
+    await asyncio.to_thread(lambda: engine.connect().close())
+    return connections
+
+# Report the storage settings actually in effect
+def check_database_profile() -> dict:
+    """Read back the effective PRAGMA values and pool sizing
+
+    SQLite silently ignores some settings (e.g. WAL is refused on network
+    filesystems and in-memory databases), so mismatches are reported.
+    """
+    report = {"dialect": engine.dialect.name, "pool": engine.pool.status(), "pragmas": {}, "mismatches": []}
+    if not IS_SQLITE:
+        return report
+
+    expected = sqlite_pragmas()
+    # synchronous and temp_store read back as numbers
+    numeric = {
+        "synchronous": {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3},
+        "temp_store": {"DEFAULT": 0, "FILE": 1, "MEMORY": 2},
+    }
+    with engine.connect() as conn:
+        for name, wanted in expected.items():
+            actual = conn.execute(text(f"PRAGMA {name}")).scalar()
+            report["pragmas"][name] = actual
+            wanted = numeric.get(name, {}).get(wanted, wanted)
+            if str(actual).lower() != str(wanted).lower():
+                report["mismatches"].append(f"{name}: wanted {wanted}, got {actual}")
+    return report
 
 if __name__ == "__main__":
     init_db()
+    print(check_database_profile())
@@ -1,40 +1,24 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+import logging
+
 from .config import settings
+from .mail_queue import enqueue_email
+
+logger = logging.getLogger(__name__)
 
-def send_email(to_email: str, subject: str, body: str, html: str = None):
-    """Send email using SMTP"""
+def send_email(to_email: str, subject: str, body: str, html: str = None, db=None):
+    """Queue email for delivery by the background mail worker (see mail_queue.py)
+
+    Pass the caller's session (before its commit) to queue the message in
+    the same transaction as the change it reports.
+    """
     try:
-        # Create message
-        msg = MIMEMultipart('alternative')
-        msg['From'] = settings.EMAIL_FROM
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        # Add plain text body
-        part1 = MIMEText(body, 'plain')
-        msg.attach(part1)
-        
-        # Add HTML body if provided
-        if html:
-            part2 = MIMEText(html, 'html')
-            msg.attach(part2)
-        
-        # Send email
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            server.starttls()
-            if settings.SMTP_USER and settings.SMTP_PASSWORD:
-                server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.send_message(msg)
-        
-        print(f"✅ Email sent successfully to {to_email}")
+        enqueue_email(to_email, subject, body, html, db=db)
         return True
     except Exception as e:
-        print(f"❌ Failed to send email: {str(e)}")
+        logger.error("Failed to queue email: %s", e)
         return False
 
-def send_verification_email(to_email: str, verification_token: str):
+def send_verification_email(to_email: str, verification_token: str, db=None):
     """Send email verification link"""
     verification_url = f"{settings.FRONTEND_URL}/verify-email?token={verification_token}"
     
@@ -69,9 +53,9 @@ def send_verification_email(to_email: str, verification_token: str):
     </html>
     """
     
-    return send_email(to_email, subject, body, html)
+    return send_email(to_email, subject, body, html, db=db)
 
-def send_password_reset_email(to_email: str, reset_token: str):
+def send_password_reset_email(to_email: str, reset_token: str, db=None):
     """Send password reset link"""
     reset_url = f"{settings.FRONTEND_URL}/reset-password?token={reset_token}"
     
@@ -106,10 +90,10 @@ def send_password_reset_email(to_email: str, reset_token: str):
     </html>
     """
     
-    return send_email(to_email, subject, body, html)
+    return send_email(to_email, subject, body, html, db=db)
 
 
-def send_order_confirmation_email(to_email: str, order_data: dict):
+def send_order_confirmation_email(to_email: str, order_data: dict, db=None):
     """Send order confirmation email to client"""
     subject = f"Order Confirmation #{order_data['order_number']} - NeoIntegra Tech"
     
@@ -190,10 +174,10 @@ def send_order_confirmation_email(to_email: str, order_data: dict):
     </html>
     """
     
-    return send_email(to_email, subject, body, html)
+    return send_email(to_email, subject, body, html, db=db)
 
 
-def send_payment_confirmation_email(to_email: str, payment_data: dict):
+def send_payment_confirmation_email(to_email: str, payment_data: dict, db=None):
     """Send payment confirmation email to client"""
     subject = f"Payment Received - Order #{payment_data['order_number']} - NeoIntegra Tech"
     
@@ -283,10 +267,10 @@ def send_payment_confirmation_email(to_email: str, payment_data: dict):
     </html>
     """
     
-    return send_email(to_email, subject, body, html)
+    return send_email(to_email, subject, body, html, db=db)
 
 
-def send_payment_pending_email(to_email: str, payment_data: dict):
+def send_payment_pending_email(to_email: str, payment_data: dict, db=None):
     """Send payment pending email with payment instructions"""
     subject = f"Complete Your Payment - Order #{payment_data['order_number']} - NeoIntegra Tech"
     
@@ -384,5 +368,5 @@ def send_payment_pending_email(to_email: str, payment_data: dict):
     </html>
     """
     
-    return send_email(to_email, subject, body, html)
+    return send_email(to_email, subject, body, html, db=db)
 
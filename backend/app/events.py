@@ -0,0 +1,83 @@
+"""
+In-process pub/sub for payment status changes, consumed by the
+Server-Sent Events endpoints in api/endpoints/payments.py
+
+Subscriptions live in this process only; the app runs a single uvicorn
+worker (see Dockerfile), so every transition is published where the
+subscribers are connected.
+"""
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Set, Tuple
+
+from .models import Payment
+
+# Seconds between SSE keep-alive comments (keeps proxies from closing idle streams)
+SSE_KEEPALIVE_SECONDS = 15
+# Hard cap on one stream's lifetime; EventSource reconnects automatically
+SSE_MAX_STREAM_SECONDS = 30 * 60
+
+
+def payment_event(payment: Payment) -> dict:
+    """Serializable status payload for a payment"""
+    return {
+        "payment_id": payment.id,
+        "order_id": payment.order_id,
+        "status": payment.status,
+        "va_number": payment.va_number,
+        "payment_url": payment.payment_url,
+        "paid_at": payment.paid_at.isoformat() if payment.paid_at else None,
+    }
+
+
+def format_sse(data: dict, event: str = "payment_status") -> str:
+    """Encode one Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class PaymentEventBroker:
+    """Fan out payment status events to subscribers keyed by payment and order id"""
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = defaultdict(set)
+
+    def subscribe(self, key: str) -> asyncio.Queue:
+        """Register a queue for a key such as "payment:12" or "order:7" """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=16)
+        self._subscribers[key].add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, key: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(key)
+        if not subscribers:
+            return
+        for entry in list(subscribers):
+            if entry[1] is queue:
+                subscribers.discard(entry)
+        if not subscribers:
+            self._subscribers.pop(key, None)
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, payment: Payment):
+        """Publish a committed payment transition; safe to call from any thread"""
+        event = payment_event(payment)
+        for key in (f"payment:{payment.id}", f"order:{payment.order_id}"):
+            for loop, queue in list(self._subscribers.get(key, ())):
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, event: dict):
+        # A stalled client only loses intermediate events, never blocks publishers
+        if queue.full():
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(event)
+
+
+# Shared broker instance
+payment_events = PaymentEventBroker()
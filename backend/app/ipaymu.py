@@ -0,0 +1,343 @@
+"""
+iPaymu gateway client
+
+One long-lived httpx.AsyncClient shared by the whole app so checkout and
+status checks reuse pooled keep-alive connections instead of paying a
+fresh TCP + TLS handshake per request.
+
+Calls go through a bulkhead (at most IPAYMU_MAX_CONCURRENT_CALLS in flight)
+and a circuit breaker: after IPAYMU_BREAKER_FAILURE_THRESHOLD consecutive
+timeouts, connection errors or 5xx answers every call fails fast with 503
+until one probe call succeeds. A slow gateway then costs each checkout a
+quick 503 instead of up to 30 s of a worker's time.
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import math
+import time
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+
+from .config import settings
+from .metrics import Counter, Gauge, Histogram
+from .timezone import now_jakarta
+
+logger = logging.getLogger(__name__)
+
+# Latency per iPaymu endpoint, labelled by outcome (ok / http_error / timeout / error)
+ipaymu_request_seconds = Histogram(
+    "ipaymu_request_duration_seconds",
+    "Latency of outbound iPaymu API calls",
+    labelnames=("endpoint", "outcome"),
+)
+# Failed calls by error class: HTTP status (http_502) or exception name (ConnectTimeout)
+ipaymu_request_errors_total = Counter(
+    "ipaymu_request_errors_total",
+    "Failed outbound iPaymu API calls",
+    labelnames=("endpoint", "error"),
+)
+ipaymu_circuit_state = Gauge(
+    "ipaymu_circuit_state",
+    "iPaymu circuit breaker state (0 closed, 1 half-open, 2 open)",
+)
+ipaymu_rejected_total = Counter(
+    "ipaymu_rejected_total",
+    "iPaymu calls refused locally, by reason (circuit_open / bulkhead_full)",
+    labelnames=("endpoint", "reason"),
+)
+ipaymu_calls_in_flight = Gauge(
+    "ipaymu_calls_in_flight",
+    "Outbound iPaymu calls holding a bulkhead slot",
+)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_OPEN = "open"
+_CIRCUIT_STATE_VALUES = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+
+class IpaymuUnavailable(HTTPException):
+    """iPaymu call refused without trying: circuit open or bulkhead full (503)"""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        super().__init__(
+            status_code=503,
+            detail="Layanan pembayaran sedang tidak tersedia, silakan coba lagi beberapa saat lagi.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; after `reset_seconds`
+    lets a single probe call through and closes again if it succeeds"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        ipaymu_circuit_state.set(0)
+
+    def retry_after(self) -> float:
+        """Seconds until the next probe is allowed (0 unless open)"""
+        if self.state != CIRCUIT_OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_seconds - self._clock())
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one probe at a time"""
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_OPEN:
+            if self.retry_after() > 0:
+                return False
+            self._set_state(CIRCUIT_HALF_OPEN)
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self._probing = False
+        self.failures = 0
+        if self.state != CIRCUIT_CLOSED:
+            self._set_state(CIRCUIT_CLOSED)
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+            if self.state != CIRCUIT_OPEN:
+                self.opened += 1
+                self._set_state(CIRCUIT_OPEN)
+
+    def release(self):
+        """The call ended without saying anything about the gateway's health"""
+        self._probing = False
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("iPaymu circuit %s", state, extra={"previous": self.state, "failures": self.failures})
+        self.state = state
+        ipaymu_circuit_state.set(_CIRCUIT_STATE_VALUES[state])
+
+
+def generate_ipaymu_signature(body: dict, method: str = "POST") -> str:
+    """Generate iPaymu signature according to official documentation v2
+
+    Format: HMAC-SHA256(StringToSign, ApiKey)
+    StringToSign = HTTPMethod:VaNumber:Lowercase(SHA-256(RequestBody)):ApiKey
+
+    - HTTPMethod: POST or GET (UPPERCASE)
+    - VaNumber: VA iPaymu
+    - RequestBody: JSON body, hashed with SHA-256, then lowercased
+    - ApiKey: Your API Key
+    """
+    va = settings.IPAYMU_VA
+    api_key = settings.IPAYMU_API_KEY
+
+    # Step 1: Create JSON body (no spaces after colon)
+    body_json = json.dumps(body, separators=(',', ':'))
+
+    # Step 2: Hash body with SHA-256 and lowercase it
+    body_hash = hashlib.sha256(body_json.encode()).hexdigest().lower()
+
+    # Step 3: Create string to sign: METHOD:VA:BODY_HASH:APIKEY
+    string_to_sign = f"{method.upper()}:{va}:{body_hash}:{api_key}"
+
+    # Step 4: Generate HMAC-SHA256 signature using ApiKey as secret
+    signature = hmac.new(
+        api_key.encode(),
+        string_to_sign.encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+    # Never log the API key or the string to sign (it ends with the key)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("iPaymu signature", extra={"va": va, "body_sha256": body_hash, "signature": signature[:12] + "..."})
+
+    return signature
+
+
+class IpaymuClient:
+    """Pooled iPaymu API client, started on app startup and closed on shutdown"""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._bulkhead: Optional[asyncio.Semaphore] = None
+        self.breaker = CircuitBreaker(settings.IPAYMU_BREAKER_FAILURE_THRESHOLD, settings.IPAYMU_BREAKER_RESET_SECONDS)
+
+    async def start(self):
+        """Open the shared connection pool"""
+        if self._client is not None:
+            return
+        # Created here so it belongs to the running event loop
+        self._bulkhead = asyncio.Semaphore(settings.IPAYMU_MAX_CONCURRENT_CALLS)
+        self._client = httpx.AsyncClient(
+            base_url=settings.IPAYMU_BASE_URL,
+            limits=httpx.Limits(
+                max_connections=settings.IPAYMU_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.IPAYMU_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.IPAYMU_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(
+                connect=settings.IPAYMU_CONNECT_TIMEOUT,
+                read=settings.IPAYMU_READ_TIMEOUT,
+                write=settings.IPAYMU_CONNECT_TIMEOUT,
+                pool=settings.IPAYMU_POOL_TIMEOUT,
+            ),
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        )
+
+    async def warm_up(self) -> bool:
+        """Open one keep-alive connection (TCP + TLS) so the first checkout skips the handshake
+
+        Any HTTP status counts; returns False if iPaymu is not configured.
+        """
+        if not settings.IPAYMU_VA:
+            return False
+        if self._client is None:
+            await self.start()
+        await self._client.head("/")
+        return True
+
+    async def close(self):
+        """Close the pool and drop idle keep-alive connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._bulkhead = None
+
+    def ensure_available(self, endpoint: str):
+        """Raise IpaymuUnavailable while the circuit is open, before any local work is done"""
+        retry_after = self.breaker.retry_after()
+        if retry_after > 0:
+            ipaymu_rejected_total.inc(endpoint, "circuit_open")
+            raise IpaymuUnavailable("circuit_open", retry_after)
+
+    async def _acquire(self, endpoint: str) -> asyncio.Semaphore:
+        """Take a bulkhead slot and pass the breaker, or raise IpaymuUnavailable"""
+        if self._bulkhead is None:
+            self._bulkhead = asyncio.Semaphore(settings.IPAYMU_MAX_CONCURRENT_CALLS)
+        bulkhead = self._bulkhead
+        # Open circuit: refuse before queueing for a slot
+        self.ensure_available(endpoint)
+        try:
+            await asyncio.wait_for(bulkhead.acquire(), settings.IPAYMU_BULKHEAD_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            ipaymu_rejected_total.inc(endpoint, "bulkhead_full")
+            raise IpaymuUnavailable("bulkhead_full", 1)
+        if not self.breaker.allow():
+            bulkhead.release()
+            ipaymu_rejected_total.inc(endpoint, "circuit_open")
+            raise IpaymuUnavailable("circuit_open", self.breaker.retry_after() or 1)
+        ipaymu_calls_in_flight.inc()
+        return bulkhead
+
+    async def post(self, endpoint: str, body: dict) -> httpx.Response:
+        """Sign and POST a JSON body to an iPaymu endpoint (e.g. "/payment/direct")
+
+        The exact JSON string used for the signature is sent as the request
+        body, so the server hashes the same bytes we signed. Raises
+        IpaymuUnavailable (503) while the circuit is open or the bulkhead is full.
+        """
+        if self._client is None:
+            await self.start()
+
+        body_json = json.dumps(body, separators=(',', ':'))
+        headers = {
+            "signature": generate_ipaymu_signature(body, "POST"),
+            "va": settings.IPAYMU_VA,
+            # Timestamp in format YYYYMMDDhhmmss (Jakarta time)
+            "timestamp": now_jakarta().strftime("%Y%m%d%H%M%S"),
+        }
+
+        bulkhead = await self._acquire(endpoint)
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            response = await self._client.post(endpoint, content=body_json, headers=headers)
+            if response.status_code < 400:
+                outcome = "ok"
+            else:
+                outcome = "http_error"
+                ipaymu_request_errors_total.inc(endpoint, f"http_{response.status_code}")
+            # 4xx means the gateway is up and answered; only 5xx counts against it
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+        except httpx.TimeoutException as e:
+            outcome = "timeout"
+            ipaymu_request_errors_total.inc(endpoint, type(e).__name__)
+            self.breaker.record_failure()
+            raise
+        except httpx.TransportError as e:
+            ipaymu_request_errors_total.inc(endpoint, type(e).__name__)
+            self.breaker.record_failure()
+            raise
+        except BaseException as e:
+            ipaymu_request_errors_total.inc(endpoint, type(e).__name__)
+            self.breaker.release()
+            raise
+        finally:
+            ipaymu_calls_in_flight.dec()
+            bulkhead.release()
+            ipaymu_request_seconds.observe(time.perf_counter() - started, endpoint, outcome)
+
+    async def transaction_status(self, transaction_id: str) -> Optional[str]:
+        """Return the iPaymu StatusCode for a transaction, or None if unavailable"""
+        response = await self.post("/transaction", {"transactionId": transaction_id})
+        result = response.json()
+        logger.debug("iPaymu transaction status %s: %s", transaction_id, result)
+
+        if result.get("Status") == 200 and result.get("Success"):
+            status_code = (result.get("Data") or {}).get("StatusCode")
+            return str(status_code) if status_code is not None else None
+        return None
+
+    def stats(self) -> dict:
+        """Per-endpoint call count, mean and p99 latency in milliseconds"""
+        stats = {}
+        for (endpoint, outcome), data in ipaymu_request_seconds.snapshot().items():
+            key = f"{endpoint} [{outcome}]"
+            stats[key] = {
+                "count": data["count"],
+                "avg_ms": round(data["sum"] / data["count"] * 1000, 1) if data["count"] else 0,
+                "p99_ms": ipaymu_request_seconds.quantile(0.99, endpoint, outcome) * 1000,
+            }
+        return stats
+
+    def gateway_stats(self) -> dict:
+        """Circuit breaker state, bulkhead use and local rejections"""
+        rejected = {}
+        for (endpoint, reason), count in ipaymu_rejected_total.snapshot().items():
+            rejected[reason] = rejected.get(reason, 0) + int(count)
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.opened,
+            "retry_after_seconds": round(self.breaker.retry_after(), 1),
+            "in_flight": int(ipaymu_calls_in_flight.total()),
+            "max_concurrent": settings.IPAYMU_MAX_CONCURRENT_CALLS,
+            "rejected": rejected,
+        }
+
+
+# Shared client instance
+ipaymu_client = IpaymuClient()
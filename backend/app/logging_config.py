@@ -0,0 +1,131 @@
+"""
+Structured, non-blocking logging
+
+Modules log through logging.getLogger(__name__). Records under the "app"
+logger are put on a bounded in-memory queue and written to stdout by a
+background QueueListener thread, so a request never waits on a slow
+terminal or log collector. When the queue is full records are dropped and
+counted (log_records_dropped_total) instead of blocking.
+
+Context goes in `extra={...}` and is rendered as key=value pairs (or JSON
+fields with LOG_FORMAT=json):
+
+    logger.info("Payment created", extra={"payment_id": 12, "order": "ORD-1"})
+
+Use %-style arguments, and guard expensive debug payloads with
+logger.isEnabledFor(logging.DEBUG) so they are never built in production.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from .config import settings
+from .metrics import Counter
+
+log_records_dropped_total = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+)
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """The extra={...} fields of a record"""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """2026-01-31T10:00:00.123Z INFO app.payments Payment created payment_id=12"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        line = f"{timestamp}Z {record.levelname} {record.name} {record.getMessage()}"
+        fields = record_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for log collectors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update(record_fields(record))
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: drops and counts on a full queue"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now (arguments may change later),
+        # but keep the traceback out of the message so formatters place it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped_total.inc()
+
+
+_listener: Optional[QueueListener] = None
+
+
+def log_level() -> int:
+    """LOG_LEVEL if set, otherwise DEBUG in development and INFO in production"""
+    if settings.LOG_LEVEL:
+        return logging.getLevelName(settings.LOG_LEVEL.upper())
+    return logging.DEBUG if settings.DEBUG else logging.INFO
+
+
+def setup_logging():
+    """Route the "app" logger through the queue; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else KeyValueFormatter())
+
+    log_queue = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    app_logger = logging.getLogger("app")
+    app_logger.handlers = [DroppingQueueHandler(log_queue)]
+    app_logger.setLevel(log_level())
+    app_logger.propagate = False
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,356 @@
+"""
+Persistent outbound mail queue
+
+Request handlers only add a row to email_outbox, in the same transaction
+as the change the message reports. A background worker
+drains the queue over one authenticated SMTP session that is kept open and
+reused between messages, retrying failed deliveries with exponential
+backoff. Deliveries per recipient domain are throttled so bulk runs (e.g.
+renewal reminders) stay under the receiving providers' rate limits.
+
+Each message is claimed (queued -> sending) with one conditional UPDATE
+before it is sent, so the app's worker and a CLI run next to it never
+both send the same row. A claim whose process died is taken over once
+SENDING_LEASE has passed.
+"""
+import asyncio
+import logging
+import smtplib
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Deque, Dict, List, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .config import settings
+from .database import SessionLocal
+from .metrics import Counter, Histogram
+from .models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+smtp_send_seconds = Histogram(
+    "smtp_send_duration_seconds",
+    "Time to hand one message to the SMTP server (including reconnects)",
+    labelnames=("outcome",),
+)
+smtp_send_failures_total = Counter(
+    "smtp_send_failures_total",
+    "SMTP deliveries that raised, by exception class",
+    labelnames=("error",),
+)
+
+
+def build_message(to_email: str, subject: str, body: str, html: str = None) -> MIMEMultipart:
+    """Build a plain text + optional HTML message"""
+    msg = MIMEMultipart('alternative')
+    msg['From'] = settings.EMAIL_FROM
+    msg['To'] = to_email
+    msg['Subject'] = subject
+
+    msg.attach(MIMEText(body, 'plain'))
+    if html:
+        msg.attach(MIMEText(html, 'html'))
+    return msg
+
+
+class SMTPSession:
+    """One authenticated SMTP connection, reused until it goes idle or drops"""
+
+    def __init__(self):
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT)
+        if settings.SMTP_STARTTLS:
+            server.starttls()
+        if settings.SMTP_USER and settings.SMTP_PASSWORD:
+            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
+        self._server = server
+
+    def _alive(self) -> bool:
+        try:
+            return self._server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, msg: MIMEMultipart):
+        """Send over the open session, reconnecting once if the server dropped us"""
+        if self._server is not None and time.monotonic() - self._last_used > settings.SMTP_SESSION_IDLE_SECONDS:
+            # Servers close idle sessions; probe before trusting an old connection
+            if not self._alive():
+                self.close()
+
+        if self._server is None:
+            self._connect()
+
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self._connect()
+            self._server.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def open(self):
+        """Connect and log in ahead of the first message (no-op if already open)"""
+        if self._server is None:
+            self._connect()
+            self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+    @property
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self._last_used if self._server is not None else 0.0
+
+
+class ProviderThrottle:
+    """At most `per_minute` deliveries per recipient domain in any 60 s window"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._sent: Dict[str, Deque[float]] = {}
+
+    @staticmethod
+    def provider(to_email: str) -> str:
+        return to_email.rpartition("@")[2].strip().lower()
+
+    def delay(self, to_email: str) -> float:
+        """Seconds until the recipient's provider may take another message (0 = now)"""
+        if self.per_minute <= 0:
+            return 0.0
+        provider = self.provider(to_email)
+        sent = self._sent.get(provider)
+        if not sent:
+            return 0.0
+        now = time.monotonic()
+        while sent and now - sent[0] >= 60:
+            sent.popleft()
+        if not sent:
+            del self._sent[provider]
+            return 0.0
+        if len(sent) < self.per_minute:
+            return 0.0
+        return 60 - (now - sent[0])
+
+    def record(self, to_email: str):
+        if self.per_minute > 0:
+            self._sent.setdefault(self.provider(to_email), deque()).append(time.monotonic())
+
+
+# A message claimed for sending by a process that died is retried after this
+SENDING_LEASE = timedelta(minutes=10)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff: base, 2x base, 4x base ... capped at one hour"""
+    seconds = settings.MAIL_QUEUE_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, 3600))
+
+
+class MailQueueWorker:
+    """Background task delivering queued email over a reused SMTP session"""
+
+    def __init__(self):
+        self._smtp = SMTPSession()
+        self._throttle = ProviderThrottle(settings.MAIL_PROVIDER_MAX_PER_MINUTE)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def running(self) -> bool:
+        return self._wakeup is not None
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return self._loop
+
+    def notify(self):
+        """Wake the worker after a new message was queued; safe from any thread"""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def warm_up(self) -> bool:
+        """Open the SMTP session before the worker starts; False if SMTP is not configured"""
+        if not settings.SMTP_USER:
+            return False
+        await asyncio.to_thread(self._smtp.open)
+        return True
+
+    @staticmethod
+    def _claim(db, message: EmailOutbox) -> bool:
+        """Mark a due message "sending" unless another process got to it first"""
+        now = datetime.utcnow()
+        claimed = db.query(EmailOutbox).filter(
+            EmailOutbox.id == message.id,
+            EmailOutbox.status.in_(("queued", "sending")),
+            EmailOutbox.next_attempt_at <= now
+        ).update({"status": "sending", "next_attempt_at": now + SENDING_LEASE}, synchronize_session=False)
+        db.commit()
+        if claimed != 1:
+            return False
+        set_committed_value(message, "status", "sending")
+        set_committed_value(message, "next_attempt_at", now + SENDING_LEASE)
+        return True
+
+    def deliver_due(self, limit: int = None, ids: List[int] = None) -> dict:
+        """Deliver one batch of due messages, or only the given ids (blocking;
+        runs in a worker thread)"""
+        limit = limit or settings.MAIL_QUEUE_BATCH_SIZE
+        summary = {"sent": 0, "retrying": 0, "failed": 0, "deferred": 0}
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            query = db.query(EmailOutbox).filter(
+                EmailOutbox.status.in_(("queued", "sending")),
+                EmailOutbox.next_attempt_at <= datetime.utcnow()
+            )
+            if ids is not None:
+                query = query.filter(EmailOutbox.id.in_(ids))
+            messages: List[EmailOutbox] = query.order_by(EmailOutbox.id).limit(limit).all()
+
+            for message in messages:
+                if not self._claim(db, message):
+                    continue
+                wait = self._throttle.delay(message.to_email)
+                if wait > 0:
+                    # Provider budget used up: not an attempt, just try later
+                    message.status = "queued"
+                    message.next_attempt_at = datetime.utcnow() + timedelta(seconds=wait)
+                    summary["deferred"] += 1
+                    db.commit()
+                    continue
+
+                message.attempts = (message.attempts or 0) + 1
+                self._throttle.record(message.to_email)
+                started = time.perf_counter()
+                try:
+                    self._smtp.send(build_message(message.to_email, message.subject, message.body, message.html))
+                    smtp_send_seconds.observe(time.perf_counter() - started, "ok")
+                    message.status = "sent"
+                    message.sent_at = datetime.utcnow()
+                    message.last_error = None
+                    summary["sent"] += 1
+                    logger.info("Email sent", extra={"email_id": message.id, "subject": message.subject})
+                except Exception as e:
+                    smtp_send_seconds.observe(time.perf_counter() - started, "error")
+                    smtp_send_failures_total.inc(type(e).__name__)
+                    self._smtp.close()
+                    message.last_error = f"{type(e).__name__}: {e}"
+                    if message.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+                        message.status = "failed"
+                        summary["failed"] += 1
+                    else:
+                        message.status = "queued"
+                        message.next_attempt_at = datetime.utcnow() + retry_delay(message.attempts)
+                        summary["retrying"] += 1
+                    logger.warning("Email delivery failed: %s", e, extra={"email_id": message.id, "attempt": message.attempts})
+                db.commit()
+            db.commit()
+        finally:
+            db.close()
+        return summary
+
+    async def run(self):
+        """Drain due messages, then sleep until notified or the next poll"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                self._wakeup.clear()
+                try:
+                    while True:
+                        summary = await asyncio.to_thread(self.deliver_due)
+                        if not any(summary.values()):
+                            break
+                except Exception as e:
+                    logger.exception("Mail queue error")
+
+                if self._smtp.idle_seconds > settings.SMTP_SESSION_IDLE_SECONDS:
+                    await asyncio.to_thread(self._smtp.close)
+
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.MAIL_QUEUE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeup = None
+            await asyncio.to_thread(self._smtp.close)
+
+
+# Shared worker instance
+mail_queue = MailQueueWorker()
+
+
+def store_email(to_email: str, subject: str, body: str, html: str = None) -> int:
+    """Insert one message into email_outbox and return its id (blocking)"""
+    db = SessionLocal()
+    try:
+        message = EmailOutbox(to_email=to_email, subject=subject, body=body, html=html)
+        db.add(message)
+        db.commit()
+        return message.id
+    finally:
+        db.close()
+
+
+def enqueue_email(to_email: str, subject: str, body: str, html: str = None, db=None):
+    """Persist an email for background delivery
+
+    With `db` (Session or AsyncSession) the row is only added to the
+    caller's transaction: it is committed together with the change it
+    reports, or rolled back with it, and the worker is woken after the
+    commit. Without a session the message is stored in its own transaction
+    right away; outside the app (CLI scripts) no worker is running, so that
+    message is delivered right away too.
+    """
+    if db is not None:
+        db.add(EmailOutbox(to_email=to_email, subject=subject, body=body, html=html))
+        db.info["mail_queued"] = True
+        return
+
+    message_id = store_email(to_email, subject, body, html)
+    if mail_queue.running:
+        mail_queue.notify()
+    else:
+        # Only this message; the rest of the queue belongs to the app's worker
+        mail_queue.deliver_due(ids=[message_id])
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_after_commit(session: Session):
+    # AsyncSession commits through its sync Session, so this covers both
+    if session.info.pop("mail_queued", False):
+        mail_queue.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session: Session):
+    session.info.pop("mail_queued", None)
+
+
+async def delivery_stats(db: AsyncSession) -> dict:
+    """Queue size by delivery status"""
+    rows = (await db.execute(
+        select(EmailOutbox.status, func.count(EmailOutbox.id)).group_by(EmailOutbox.status)
+    )).all()
+    return {status: count for status, count in rows}
@@ -1,21 +1,51 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
 from datetime import datetime
+from sqlalchemy import text
 import asyncio
+import hmac
+import logging
+import time
 
 from .config import settings
-from .database import init_db
+from .logging_config import setup_logging, stop_logging
+from .database import init_db, check_database_profile, warm_up_database, engine, async_engine, AsyncSessionLocal
 from .api.router import api_router
-from .rate_limit import cleanup_rate_limit_storage
+from .rate_limit import RateLimitMiddleware, rate_limiter
+from .query_counter import QueryCountMiddleware
+from .metrics import render_prometheus
+from .monitoring import MetricsMiddleware, app_startup_seconds, event_loop_lag_monitor
+from .ipaymu import ipaymu_client
+from .auth_cache import auth_user_cache
+from .passwords import password_hasher
+from .catalog import service_catalog, default_services_upsert
+from .reconcile import payment_reconciliation_loop
+from .reminders import subscription_reminder_loop
+from .callback_inbox import callback_inbox
+from .payment_jobs import payment_jobs
+from .mail_queue import mail_queue
+
+# Queue-backed logging for the "app" logger (written by a background thread)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    # orjson encoder for every JSON response (hot reads use app/serialization.py)
+    default_response_class=ORJSONResponse
 )
 
+# Per-request SQL query count headers (X-DB-Query-Count) for spotting N+1s
+if settings.DEBUG:
+    app.add_middleware(QueryCountMiddleware)
+
+# Rate limiting (added before CORS so 429 responses still carry CORS headers)
+app.add_middleware(RateLimitMiddleware)
+
 # Configure CORS - MUST be before routes
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +57,10 @@ app.add_middleware(
     max_age=3600,
 )
 
+# Request metrics for /metrics (outermost, so rate-limited and CORS requests count too)
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # Include API router
 app.include_router(api_router)
 
@@ -46,13 +80,37 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Detailed health check"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(text("SELECT 1"))
+        database = "connected"
+    except Exception as e:
+        database = f"error: {type(e).__name__}"
     return {
-        "status": "healthy",
-        "database": "connected",
+        "status": "healthy" if database == "connected" else "degraded",
+        "database": database,
         "timestamp": datetime.utcnow().isoformat(),
-        "cors_configured": True
+        "cors_configured": True,
+        "ipaymu": ipaymu_client.stats(),
+        "ipaymu_gateway": ipaymu_client.gateway_stats(),
+        "payment_jobs": payment_jobs.stats(),
+        "auth_cache": auth_user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "catalog": service_catalog.stats(),
+        "rate_limit": rate_limiter.stats()
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus scrape endpoint"""
+    if not settings.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+            return JSONResponse(status_code=401, content={"detail": "Invalid metrics token"})
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api")
 async def api_root():
     """API root endpoint"""
@@ -73,115 +131,82 @@ async def api_root():
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler"""
+    logger.exception("Unhandled error", extra={"method": request.method, "path": request.url.path})
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error", "error": str(exc)}
     )
 
 # Function to initialize default services
-def init_default_services():
-    """Initialize default services in database"""
-    from .database import SessionLocal
-    from .models import Service
-    
-    db = SessionLocal()
-    try:
-        default_services = [
-            {
-                "name": "Paket All In Service",
-                "slug": "all-in",
-                "description": "Paket paling hemat & optimal untuk bisnis jangka panjang. Sudah termasuk Website, SEO, Mail Server, Cloudflare, dan Hosting.",
-                "category": "package",
-                "price": 81000000,
-                "duration_days": 365,
-                "features": '["Website Service - Custom UI/UX", "SEO Service (12 bulan)", "Mail Server Service", "Cloudflare Protection", "Hosting Performa Tinggi", "Support Teknis Lengkap"]',
-                "is_active": True
-            },
-            {
-                "name": "Website Service",
-                "slug": "website",
-                "description": "Website Service Profesional - Pembuatan website custom dengan performa tinggi.",
-                "category": "web",
-                "price": 36000000,
-                "duration_days": 365,
-                "features": '["Custom UI/UX", "Hosting Performa Tinggi", "Optimasi Kecepatan", "Maintenance & Update", "Backup & Keamanan", "Support Teknis"]',
-                "is_active": True
-            },
-            {
-                "name": "SEO Service",
-                "slug": "seo",
-                "description": "SEO Service Berkelanjutan (12 Bulan) - Optimasi mesin pencari profesional.",
-                "category": "marketing",
-                "price": 42000000,
-                "duration_days": 365,
-                "features": '["SEO On-Page & Technical", "Optimasi Struktur & Kecepatan", "Google Search Console & Analytics", "Monitoring Keyword Bulanan", "Laporan Performa SEO", "Optimasi Berkelanjutan 12 Bulan"]',
-                "is_active": True
-            },
-            {
-                "name": "Mail Server Service",
-                "slug": "mail-server",
-                "description": "Mail Server Bisnis Profesional - Email bisnis dengan domain perusahaan.",
-                "category": "email",
-                "price": 15000000,
-                "duration_days": 365,
-                "features": '["Email dengan Domain Perusahaan", "Setup SPF, DKIM, DMARC", "Perlindungan Spam & Phishing", "Sinkronisasi Webmail & Perangkat", "Maintenance & Support"]',
-                "is_active": True
-            },
-            {
-                "name": "Cloudflare Service",
-                "slug": "cloudflare",
-                "description": "Cloudflare Protection & Performance - Keamanan dan performa maksimal.",
-                "category": "security",
-                "price": 24000000,
-                "duration_days": 365,
-                "features": '["CDN Global & Caching", "Proteksi DDoS & Firewall", "SSL Full Encryption", "Proteksi Bot & Traffic Berbahaya", "Monitoring Keamanan 24/7"]',
-                "is_active": True
-            },
-            {
-                "name": "Test Payment Service",
-                "slug": "test-payment",
-                "description": "Service untuk test pembayaran dengan nominal minimal Rp 10.000 (minimum iPaymu)",
-                "category": "test",
-                "price": 10000,
-                "duration_days": 1,
-                "features": '["Test Payment", "Minimal Amount", "Email Notification Test"]',
-                "is_active": True
-            }
-        ]
-        
-        created = 0
-        for service_data in default_services:
-            existing = db.query(Service).filter(Service.slug == service_data["slug"]).first()
-            if not existing:
-                service = Service(**service_data)
-                db.add(service)
-                created += 1
-        
-        db.commit()
-        return created
-    except Exception as e:
-        db.rollback()
-        raise e
-    finally:
-        db.close()
+def init_default_services() -> int:
+    """Add missing default services in one INSERT ... ON CONFLICT DO NOTHING"""
+    with engine.begin() as conn:
+        return conn.execute(default_services_upsert(engine.dialect.name, update=False)).rowcount
+
+async def warm_up():
+    """Open DB, iPaymu and SMTP connections and load the catalog, concurrently
+
+    Runs before uvicorn accepts the first request, so the first checkout or
+    signup after a restart does not pay for connection setup. Each step is
+    bounded by WARMUP_TIMEOUT_SECONDS; a failed step only logs a warning.
+    """
+    async def load_catalog():
+        async with AsyncSessionLocal() as db:
+            return len((await service_catalog.get(db)).by_id)
+
+    async def step(name: str, coro) -> str:
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(coro, settings.WARMUP_TIMEOUT_SECONDS)
+        except Exception as e:
+            return f"{name} failed ({type(e).__name__})"
+        if result is False:
+            return f"{name} skipped"
+        return f"{name} {(time.perf_counter() - started) * 1000:.0f} ms"
+
+    results = await asyncio.gather(
+        step("database", warm_up_database()),
+        step("catalog", load_catalog()),
+        step("iPaymu", ipaymu_client.warm_up()),
+        step("SMTP", mail_queue.warm_up()),
+    )
+    print(f"{'⚠️' if any('failed' in r for r in results) else '✅'} Warm-up: {', '.join(results)}")
+
+# Worker loops started on startup; cancelled on shutdown
+background_tasks = []
+
+def start_background(coro):
+    background_tasks.append(asyncio.create_task(coro))
 
 # Startup event
 @app.on_event("startup")
 async def startup_event():
     """Run on application startup"""
+    started = time.perf_counter()
+    setup_logging()  # restarts the writer thread if a previous shutdown stopped it
     print(f"🚀 Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     print(f"🌍 Environment: {'Development' if settings.DEBUG else 'Production'}")
     
-    # Initialize database
+    # Schema version check; create_all and migrations only when behind
     try:
         init_db()
         print("✅ Database initialized")
     except Exception as e:
         print(f"❌ Database initialization error: {e}")
     
-    # Auto-initialize default services
+    # Report effective storage settings (WAL, pragmas, pool)
+    try:
+        profile = check_database_profile()
+        print(f"✅ Database profile: {profile['pragmas'] or profile['dialect']} pool=[{profile['pool']}]")
+        for mismatch in profile["mismatches"]:
+            print(f"⚠️ Database profile mismatch - {mismatch}")
+    except Exception as e:
+        print(f"⚠️ Database profile check failed: {e}")
+    
+    # Auto-initialize default services (one INSERT ... ON CONFLICT DO NOTHING)
     try:
         created = init_default_services()
+        service_catalog.invalidate()
         if created > 0:
             print(f"✅ Default services initialized: {created} created")
         else:
@@ -189,15 +214,63 @@ async def startup_event():
     except Exception as e:
         print(f"⚠️ Services initialization warning: {e}")
     
-    # Start rate limit cleanup task
-    asyncio.create_task(cleanup_rate_limit_storage())
-    print("✅ Rate limit cleanup task started")
+    # Open the pooled iPaymu client so checkout reuses warm keep-alive connections
+    await ipaymu_client.start()
+    print("✅ iPaymu client pool started")
+    
+    # Warm pools and caches before the first request (and before the mail worker uses SMTP)
+    if settings.WARMUP_ENABLED:
+        await warm_up()
+    
+    # Start outbound mail queue worker
+    start_background(mail_queue.run())
+    print("✅ Mail queue worker started")
+    
+    # Start callback inbox processor (replays entries left pending by a crash first)
+    start_background(callback_inbox.run())
+    print("✅ Callback inbox processor started")
+    
+    # Background iPaymu payment creation (async checkout; resumes jobs left by a restart)
+    start_background(payment_jobs.run())
+    print("✅ Payment job worker started")
+    
+    # Event loop lag probe for /metrics
+    if settings.METRICS_ENABLED:
+        start_background(event_loop_lag_monitor(settings.EVENT_LOOP_LAG_INTERVAL_SECONDS))
+        print("✅ Event loop lag monitor started")
+    
+    # Start pending payment reconciliation (covers missed iPaymu callbacks)
+    if settings.PAYMENT_RECONCILE_ENABLED:
+        start_background(payment_reconciliation_loop())
+        print("✅ Payment reconciliation task started")
+    
+    # Queue subscription renewal reminders (H-7, H-3, H-1, H-0)
+    if settings.SUBSCRIPTION_REMINDERS_ENABLED:
+        start_background(subscription_reminder_loop())
+        print("✅ Subscription reminder task started")
+    
+    elapsed = time.perf_counter() - started
+    app_startup_seconds.set(elapsed)
+    print(f"✅ Startup complete in {elapsed * 1000:.0f} ms")
 
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     print(f"👋 Shutting down {settings.APP_NAME}")
+    for _ in range(3):
+        pending = [task for task in background_tasks if not task.done()]
+        if not pending:
+            break
+        for task in pending:
+            task.cancel()
+        # wait_for() on Python 3.11 can swallow a cancel that races its timeout; cancel again
+        await asyncio.wait(pending, timeout=1)
+    background_tasks.clear()
+    await ipaymu_client.close()
+    # Close pooled connections while their event loop is still running
+    await async_engine.dispose()
+    stop_logging()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,145 @@
+"""
+Lightweight in-process metrics (counters, gauges and histograms with labels)
+
+Every metric registers itself in REGISTRY on creation; render_prometheus()
+turns the registry into the Prometheus text exposition format for /metrics.
+"""
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Tuple
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# All metrics created in this process, in creation order
+REGISTRY: List = []
+
+
+class Histogram:
+    """Cumulative histogram keyed by a tuple of label values"""
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labelvalues):
+        """Record one observation for the given label values"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # [bucket counts..., +Inf count, sum]
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._series[labelvalues] = series
+            series[index] += 1
+            series[-1] += value
+
+    def snapshot(self) -> Dict[tuple, dict]:
+        """Return count, sum and cumulative bucket counts per label set"""
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+
+        result = {}
+        for labels, series in items:
+            cumulative = []
+            running = 0
+            for count in series[:-1]:
+                running += count
+                cumulative.append(running)
+            result[labels] = {
+                "count": running,
+                "sum": series[-1],
+                "buckets": dict(zip(self.buckets + (float("inf"),), cumulative)),
+            }
+        return result
+
+    def quantile(self, q: float, *labelvalues) -> float:
+        """Estimate a quantile (upper bucket bound) for one label set"""
+        data = self.snapshot().get(labelvalues)
+        if not data or not data["count"]:
+            return 0.0
+        target = q * data["count"]
+        for bound, count in data["buckets"].items():
+            if count >= target:
+                return bound
+        return float("inf")
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+    type = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def snapshot(self) -> Dict[tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def total(self) -> float:
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(Counter):
+    """Value that goes up and down (in-flight requests, last measured lag)"""
+    type = "gauge"
+
+    def set(self, value: float, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def dec(self, *labelvalues, amount: float = 1):
+        self.inc(*labelvalues, amount=-amount)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(registry: List = None) -> str:
+    """Render metrics in the Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for metric in REGISTRY if registry is None else registry:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        if metric.type == "histogram":
+            for labels, data in sorted(metric.snapshot().items()):
+                for bound, count in data["buckets"].items():
+                    le = _labels(metric.labelnames, labels, f'le="{_number(bound)}"')
+                    lines.append(f"{metric.name}_bucket{le} {count}")
+                tags = _labels(metric.labelnames, labels)
+                lines.append(f"{metric.name}_sum{tags} {_number(data['sum'])}")
+                lines.append(f"{metric.name}_count{tags} {data['count']}")
+        else:
+            for labels, value in sorted(metric.snapshot().items()):
+                lines.append(f"{metric.name}{_labels(metric.labelnames, labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
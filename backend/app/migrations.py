@@ -0,0 +1,94 @@
+"""
+Versioned schema migrations
+
+create_all() only creates missing tables, so databases deployed before a
+change never get new indexes or columns. Each migration below runs once,
+in order, and is recorded in the schema_version table. Startup skips
+create_all() for a database already at LATEST_VERSION, so new tables need
+a migration too. Statements must be idempotent (IF NOT EXISTS) because a
+fresh database already has everything create_all() built from the models.
+"""
+from datetime import datetime
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# (version, description, statements)
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Indexes for hot lookup columns", [
+        "CREATE INDEX IF NOT EXISTS ix_payments_ipaymu_transaction_id ON payments (ipaymu_transaction_id)",
+        "CREATE INDEX IF NOT EXISTS ix_payments_order_id ON payments (order_id)",
+        "CREATE INDEX IF NOT EXISTS ix_payments_status_expired_at ON payments (status, expired_at)",
+        "CREATE INDEX IF NOT EXISTS ix_users_verification_token ON users (verification_token)",
+        "CREATE INDEX IF NOT EXISTS ix_users_reset_token ON users (reset_token)",
+        "CREATE INDEX IF NOT EXISTS ix_orders_user_id_created_at ON orders (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_user_id_end_date ON subscriptions (user_id, end_date)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_status_end_date ON subscriptions (status, end_date)",
+    ]),
+    (2, "Indexes for keyset pagination on (created_at, id)", [
+        "CREATE INDEX IF NOT EXISTS ix_orders_user_id_status_created_at ON orders (user_id, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_payments_order_id_created_at ON payments (order_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_subscriptions_user_id_created_at ON subscriptions (user_id, created_at)",
+        # Covered by the (order_id, created_at) prefix
+        "DROP INDEX IF EXISTS ix_payments_order_id",
+    ]),
+    (3, "Subscription renewal reminder log", [
+        "CREATE TABLE IF NOT EXISTS subscription_reminders ("
+        "id INTEGER NOT NULL PRIMARY KEY, "
+        "subscription_id INTEGER NOT NULL REFERENCES subscriptions (id), "
+        "end_date DATETIME NOT NULL, "
+        "days_before INTEGER NOT NULL, "
+        "created_at DATETIME, "
+        "CONSTRAINT uq_subscription_reminders_step UNIQUE (subscription_id, end_date, days_before))",
+        "CREATE INDEX IF NOT EXISTS ix_subscription_reminders_id ON subscription_reminders (id)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def current_version(bind: Engine) -> int:
+    """Highest applied migration version (0 for an unmigrated database)"""
+    with bind.begin() as conn:
+        _ensure_version_table(conn)
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+
+def run_migrations(bind: Engine) -> int:
+    """Apply pending migrations in order, each in its own transaction
+
+    CREATE INDEX only holds the write lock while the index is built; with WAL
+    readers keep going, so this is safe on a live database. Returns the
+    number of migrations applied.
+    """
+    applied = 0
+    version = current_version(bind)
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        with bind.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": number, "d": description, "t": datetime.utcnow()}
+            )
+        applied += 1
+        print(f"✅ Migration {number} applied: {description}")
+    return applied
+
+
+if __name__ == "__main__":
+    from .database import engine
+    run_migrations(engine)
+    print(f"Schema version: {current_version(engine)}")
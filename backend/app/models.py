@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -14,8 +14,8 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=False)
     is_verified = Column(Boolean, default=False)
-    verification_token = Column(String, nullable=True)
-    reset_token = Column(String, nullable=True)
+    verification_token = Column(String, nullable=True, index=True)
+    reset_token = Column(String, nullable=True, index=True)
     reset_token_expires = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -41,6 +41,11 @@ class Service(Base):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # "My orders", newest first (keyset pages on created_at, id)
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+        Index("ix_orders_user_id_status_created_at", "user_id", "status", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -64,14 +69,20 @@ class Order(Base):
 
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Pending/expired sweeps (reconciler)
+        Index("ix_payments_status_expired_at", "status", "expired_at"),
+        # Payments of an order, newest first
+        Index("ix_payments_order_id_created_at", "order_id", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     payment_method = Column(String, nullable=False)  # va, qris, cstore, cod
     payment_channel = Column(String, nullable=True)  # bca, bni, bri, mandiri (for VA), alfamart/indomaret (for cstore)
     amount = Column(Float, nullable=False)
-    status = Column(String, default="pending")  # pending, success, failed, expired
-    ipaymu_transaction_id = Column(String, nullable=True)
+    status = Column(String, default="pending")  # processing (async creation), pending, success, failed, expired
+    ipaymu_transaction_id = Column(String, nullable=True, index=True)
     ipaymu_session_id = Column(String, nullable=True)
     payment_url = Column(String, nullable=True)
     qr_code_url = Column(String, nullable=True)
@@ -89,6 +100,14 @@ class Payment(Base):
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # "Expiring soon"
+        Index("ix_subscriptions_user_id_end_date", "user_id", "end_date"),
+        # "My subscriptions", newest first
+        Index("ix_subscriptions_user_id_created_at", "user_id", "created_at"),
+        # Renewal reminder sweeps across all users
+        Index("ix_subscriptions_status_end_date", "status", "end_date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -107,3 +126,52 @@ class Subscription(Base):
     
     # Relationships
     user = relationship("User", back_populates="subscriptions")
+
+class PaymentCallbackInbox(Base):
+    """Raw iPaymu callbacks, stored before processing so the webhook can ack fast"""
+    __tablename__ = "payment_callback_inbox"
+    __table_args__ = (
+        # One row per transaction + status: retried/duplicate callbacks are dropped
+        UniqueConstraint("trx_id", "status_code", name="uq_callback_inbox_trx_status"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    trx_id = Column(String, nullable=False)
+    status_code = Column(String, nullable=False, default="")
+    payload = Column(Text, nullable=False)  # JSON string of the callback body
+    status = Column(String, default="pending", index=True)  # pending, processed, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+class EmailOutbox(Base):
+    """Outbound transactional email, delivered by the background mail worker"""
+    __tablename__ = "email_outbox"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    html = Column(Text, nullable=True)
+    status = Column(String, default="queued", index=True)  # queued, sending, sent, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+class SubscriptionReminder(Base):
+    """Renewal reminders already queued, so a rerun never sends the same one twice"""
+    __tablename__ = "subscription_reminders"
+    __table_args__ = (
+        # One reminder per subscription, end date and step (H-7, H-3, H-1, H-0);
+        # a renewed subscription has a new end date and gets a fresh set
+        UniqueConstraint("subscription_id", "end_date", "days_before", name="uq_subscription_reminders_step"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    subscription_id = Column(Integer, ForeignKey("subscriptions.id"), nullable=False)
+    end_date = Column(DateTime, nullable=False)
+    days_before = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
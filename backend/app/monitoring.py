@@ -0,0 +1,118 @@
+"""
+Request and event loop metrics for /metrics
+
+MetricsMiddleware records count and latency per route template (e.g.
+/api/orders/{order_id}, never the raw path, so label cardinality stays
+bounded), status code, in-flight requests and SQL statements per request.
+Server-Sent Events streams stay open for up to 30 minutes; they record the
+time to open the stream as their request latency and their lifetime in a
+histogram of their own, so they do not swamp the request latency buckets.
+A background probe measures event loop lag: how late a short sleep wakes
+up, which is how long something blocked the loop. Startup duration is
+recorded once per process.
+"""
+import asyncio
+import time
+
+from .metrics import Gauge, Histogram
+from .query_counter import count_queries
+
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template and status",
+    labelnames=("method", "route", "status"),
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+)
+http_request_db_queries = Histogram(
+    "http_request_db_queries",
+    "SQL statements executed per HTTP request",
+    labelnames=("method", "route"),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+http_request_db_seconds = Histogram(
+    "http_request_db_seconds",
+    "Total SQL execution time per HTTP request",
+    labelnames=("method", "route"),
+)
+http_stream_seconds = Histogram(
+    "http_stream_duration_seconds",
+    "Lifetime of Server-Sent Events streams by route template",
+    labelnames=("method", "route"),
+    buckets=(1.0, 5.0, 30.0, 60.0, 300.0, 600.0, 1800.0, 3600.0),
+)
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between a scheduled wake-up and the event loop running it",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+event_loop_lag_last_seconds = Gauge(
+    "event_loop_lag_last_seconds",
+    "Most recent event loop lag measurement",
+)
+app_startup_seconds = Gauge(
+    "app_startup_duration_seconds",
+    "Time from the startup event to accepting requests (schema check, catalog, warm-up)",
+)
+
+
+def route_template(scope) -> str:
+    """Path template of the matched route; unmatched paths share one label"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding the HTTP metrics above (outermost, so 429s count too)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+        stream_opened = None
+
+        async def send_with_status(message):
+            nonlocal status, stream_opened
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers") or []:
+                    if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        stream_opened = time.perf_counter()
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            with count_queries() as stats:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            # The router stores the matched route in the shared scope
+            method, route = scope["method"], route_template(scope)
+            finished = time.perf_counter()
+            if stream_opened is None:
+                http_request_seconds.observe(finished - started, method, route, str(status))
+            else:
+                http_request_seconds.observe(stream_opened - started, method, route, str(status))
+                http_stream_seconds.observe(finished - stream_opened, method, route)
+            http_request_db_queries.observe(stats.count, method, route)
+            http_request_db_seconds.observe(stats.seconds, method, route)
+
+
+async def event_loop_lag_monitor(interval: float):
+    """Sleep `interval` seconds in a loop and record how late each wake-up is"""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - scheduled, 0.0)
+        event_loop_lag_seconds.observe(lag)
+        event_loop_lag_last_seconds.set(lag)
+
@@ -0,0 +1,87 @@
+"""
+Order number generator
+
+Format: ORD-YYYYMMDD-HHMMSS-SSSSNNNN (Jakarta time), e.g.
+ORD-20260131-142305-0003K7QM
+
+- SSSS: per-second sequence of this process, 4 Crockford base32 chars
+  (up to 1,048,576 numbers per second before borrowing the next second)
+- NNNN: node id, 20 random bits drawn per process (re-drawn after fork)
+
+No database round trip and no shared state: two orders only collide if
+two processes draw the same node id and issue the same sequence in the
+same second. Within a process numbers are strictly increasing, also as
+strings, and never go back when the clock does.
+"""
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+
+from .timezone import JAKARTA_TZ
+
+# Crockford base32: no I, L, O, U; digits-first, so string order = numeric order
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+SEQUENCE_BITS = 20
+NODE_BITS = 20
+
+
+def _base32(value: int, width: int) -> str:
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, 32)
+        chars.append(_ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+class OrderNumberGenerator:
+    """Monotonic, collision-resistant order numbers (thread-safe)"""
+
+    def __init__(self, prefix: str = "ORD", clock=time.time):
+        self.prefix = prefix
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pid = None
+        self._node = ""
+        self._second = 0
+        self._sequence = 0
+        self._stamp = ""
+
+    def _reseed(self):
+        # A forked worker inherits the parent's node id; draw a fresh one per pid
+        self._pid = os.getpid()
+        self._node = _base32(secrets.randbits(NODE_BITS), NODE_BITS // 5)
+        self._second = 0
+        self._sequence = 0
+
+    def next(self) -> str:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reseed()
+
+            second = int(self._clock())
+            if second > self._second:
+                self._set_second(second)
+            else:
+                # Same second, or the clock went back: keep counting from the last second
+                self._sequence += 1
+                if self._sequence >= 1 << SEQUENCE_BITS:
+                    self._set_second(self._second + 1)
+
+            sequence = _base32(self._sequence, SEQUENCE_BITS // 5)
+            return f"{self.prefix}-{self._stamp}-{sequence}{self._node}"
+
+    def _set_second(self, second: int):
+        self._second = second
+        self._sequence = 0
+        self._stamp = datetime.fromtimestamp(second, JAKARTA_TZ).strftime("%Y%m%d-%H%M%S")
+
+
+# Shared generator for orders and renewal orders
+order_numbers = OrderNumberGenerator()
+
+
+def generate_order_number() -> str:
+    """Generate unique order number"""
+    return order_numbers.next()
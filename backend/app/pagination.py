@@ -0,0 +1,79 @@
+"""
+Keyset (cursor) pagination for per-user listings
+
+Pages are ordered newest first by (created_at, id). The cursor encodes the
+last row of the previous page, so each page is an index range scan no
+matter how deep the client pages - unlike OFFSET, which re-reads every
+skipped row. List endpoints keep returning a plain JSON array; the cursor
+for the next page and a total-count hint travel in response headers:
+
+    X-Next-Cursor: <opaque>   (absent on the last page)
+    X-Total-Count: <n>        (first page only)
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class PageParams:
+    """Query parameters shared by paginated list endpoints"""
+
+    def __init__(
+        self,
+        limit: int = Query(None, ge=1, description="Page size"),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    ):
+        self.limit = min(limit or settings.PAGE_SIZE_DEFAULT, settings.PAGE_SIZE_MAX)
+        self.cursor = cursor
+
+
+async def paginate(db: AsyncSession, query, model, page: PageParams, response: Response,
+                   total: Optional[int] = None) -> list:
+    """Run `query` (already filtered) one keyset page at a time, newest first
+
+    Pass `total` when the caller already counted the rows (ETag version lookup).
+    """
+    if page.cursor is None:
+        # Total-count hint on the first page only; later pages skip the COUNT
+        if total is None:
+            total = await db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+    else:
+        total = None
+        created_at, row_id = decode_cursor(page.cursor)
+        # The <= bound gives SQLite an index range to seek to; the OR settles ties
+        query = query.where(model.created_at <= created_at, or_(
+            model.created_at < created_at,
+            model.id < row_id
+        ))
+
+    rows = (await db.scalars(
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(page.limit + 1)
+    )).all()
+
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    return rows
@@ -0,0 +1,315 @@
+"""
+iPaymu payment creation, inline or as a background job
+
+POST /payments/ normally calls iPaymu inside the request. In async mode
+(PAYMENT_ASYNC_CREATE, or a request sending "Prefer: respond-async") it
+only stores the payment as "processing" and answers 202; the worker below
+makes the gateway call, fills in the VA number / payment URL and moves the
+payment to "pending" (or "failed"), publishing each change to the SSE
+streams. The payments table is the queue: payments still "processing"
+after a restart are picked up again on startup.
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .email import send_payment_pending_email
+from .events import payment_events
+from .ipaymu import ipaymu_client, IpaymuUnavailable
+from .metrics import Counter
+from .models import Order, Payment
+
+logger = logging.getLogger(__name__)
+
+payment_jobs_total = Counter(
+    "payment_jobs_total",
+    "Background payment creation jobs by outcome (created, failed, retried)",
+    ["outcome"],
+)
+
+
+async def create_ipaymu_payment(payment_data: dict, payment_method: str):
+    """Create payment via iPaymu API - Direct Payment (VA/QRIS)
+
+    Based on official iPaymu sample: https://github.com/ipaymu/ipaymu-payment-v2-sample-python
+    Direct payment does NOT require product, qty, price fields.
+    """
+    # Prepare request body based on payment method
+    # Direct payment format (VA/QRIS) - EXACTLY as GitHub sample
+    if payment_method == "va":
+        # Get payment channel from request, default to "bca" (most common)
+        # Available channels: "bca", "bni", "bri", "mandiri", "cimb", "permata", "bsi", "danamon"
+        payment_channel = payment_data.get("payment_channel", "bca")
+
+        body = {
+            "name": payment_data["name"],
+            "phone": payment_data["phone"],
+            "email": payment_data["email"],
+            "amount": str(int(payment_data["amount"])),  # String, not int!
+            "notifyUrl": payment_data["notify_url"],
+            "referenceId": payment_data.get("reference_id", payment_data.get("order_number", "")),
+            "paymentMethod": "va",
+            "paymentChannel": payment_channel
+        }
+    else:
+        raise ValueError(f"Unsupported payment method: {payment_method}. Only 'va' is supported.")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("iPaymu request: %s", json.dumps(body, separators=(',', ':')), extra={"method": payment_method})
+
+    # Make API request over the shared pooled client - it signs the body and
+    # sends the EXACT JSON string used for the signature
+    response = await ipaymu_client.post("/payment/direct", body)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("iPaymu response: %s", response.text[:500], extra={"http_status": response.status_code})
+
+    if response.status_code != 200:
+        error_detail = response.text
+        logger.warning("iPaymu HTTP error: %s", error_detail[:500], extra={"http_status": response.status_code})
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"iPaymu API error (HTTP {response.status_code}): {error_detail}"
+        )
+
+    result = response.json()
+
+    if result.get("Status") != 200:
+        error_msg = result.get('Message', 'Unknown error')
+        error_data = result.get('Data')
+        logger.warning("iPaymu error: %s", error_msg, extra={"ipaymu_status": result.get('Status'), "data": error_data})
+        raise HTTPException(
+            status_code=400,
+            detail=f"iPaymu error: {error_msg}"
+        )
+
+    data = result.get("Data", {})
+    logger.info("iPaymu payment created", extra={"trx_id": data.get('TransactionId'), "session_id": data.get('SessionID')})
+
+    return data
+
+
+def service_name_of(order: Order) -> str:
+    return order.service.name if order.service else "Layanan NeoIntegra Tech"
+
+
+def ipaymu_payment_data(order: Order, user, payment: Payment) -> dict:
+    """Gateway request fields for a payment of this order"""
+    return {
+        "name": user.full_name,
+        "phone": user.phone or "08123456789",
+        "email": user.email,
+        "amount": payment.amount,
+        "notify_url": f"{settings.BACKEND_URL}/api/payments/callback",
+        "return_url": f"{settings.FRONTEND_URL}/payment/success?order_id={order.id}&order_number={order.order_number}&amount={payment.amount}",
+        "expired": 24,
+        "payment_channel": payment.payment_channel,
+        "product_name": service_name_of(order),
+        "quantity": 1,  # Always 1 for services
+        "order_number": order.order_number,  # For iPaymu referenceId
+        "reference_id": order.order_number
+    }
+
+
+def apply_gateway_response(payment: Payment, ipaymu_response: dict) -> bool:
+    """Copy transaction id, VA number and payment URL onto the payment
+
+    Returns False when the response has no payment info at all.
+    """
+    payment.ipaymu_transaction_id = ipaymu_response.get("TransactionId")
+    payment.ipaymu_session_id = ipaymu_response.get("SessionID")
+
+    # For redirect payment methods
+    payment.payment_url = ipaymu_response.get("Url") or ipaymu_response.get("PaymentUrl")
+
+    if payment.payment_method == "va":
+        # Try multiple field names for VA number
+        payment.va_number = (
+            ipaymu_response.get("Va") or
+            ipaymu_response.get("VaNumber") or
+            ipaymu_response.get("PaymentNo") or
+            ipaymu_response.get("PaymentCode")
+        )
+
+    # A payment URL alone is enough
+    return bool(payment.va_number or payment.payment_url)
+
+
+def queue_payment_pending_email(user, order: Order, payment: Payment, db=None):
+    """Queue the payment instructions email (in db's transaction); never fails the payment"""
+    try:
+        send_payment_pending_email(
+            to_email=user.email,
+            payment_data={
+                'customer_name': user.full_name,
+                'order_number': order.order_number,
+                'service_name': service_name_of(order),
+                'amount': payment.amount,
+                'payment_method': payment.payment_method.upper(),
+                'payment_channel': payment.payment_channel.upper() if payment.payment_channel else '',
+                'va_number': payment.va_number,
+                'payment_url': payment.payment_url,
+                'expired_at': payment.expired_at.strftime('%d %B %Y %H:%M') if payment.expired_at else ''
+            },
+            db=db
+        )
+    except Exception as email_error:
+        logger.warning("Failed to queue payment pending email: %s", email_error, extra={"payment_id": payment.id})
+
+
+def is_transient(error: Exception) -> bool:
+    """Gateway unavailable, slow or erroring: worth another attempt later
+
+    A read timeout is not: iPaymu got the whole request and may already
+    have created the transaction, so another attempt could open a second
+    VA for the same order. iPaymu's status lookup needs the transaction id
+    we never received, so such a payment is failed and the customer can
+    start a new one.
+    """
+    if isinstance(error, httpx.ReadTimeout):
+        return False
+    if isinstance(error, (IpaymuUnavailable, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    return isinstance(error, HTTPException) and error.status_code >= 500
+
+
+async def run_payment_job(payment_id: int, final_attempt: bool = False) -> str:
+    """Create the gateway transaction of one "processing" payment
+
+    Returns "created", "failed", "retry" (transient error, payment left
+    "processing") or "skipped" (not processing any more).
+    """
+    async with AsyncSessionLocal() as db:
+        payment = await db.scalar(
+            select(Payment).where(Payment.id == payment_id, Payment.status == "processing")
+            .options(joinedload(Payment.order).options(joinedload(Order.user), joinedload(Order.service)))
+        )
+        if not payment:
+            return "skipped"
+        order = payment.order
+        user = order.user
+
+        try:
+            ipaymu_response = await create_ipaymu_payment(ipaymu_payment_data(order, user, payment), payment.payment_method)
+            if not apply_gateway_response(payment, ipaymu_response):
+                raise ValueError(f"iPaymu returned no payment info: {list(ipaymu_response.keys())}")
+            payment.status = "pending"
+            queue_payment_pending_email(user, order, payment, db)
+            outcome = "created"
+        except Exception as e:
+            if is_transient(e) and not final_attempt:
+                logger.warning("Payment job will retry: %s", type(e).__name__, extra={"payment_id": payment_id, "order": order.order_number})
+                return "retry"
+            logger.warning("Payment job failed: %s: %s", type(e).__name__, getattr(e, "detail", e), extra={"payment_id": payment_id, "order": order.order_number})
+            if isinstance(e, httpx.ReadTimeout):
+                logger.warning("iPaymu may have created a transaction for this order; check reference %s in the iPaymu dashboard",
+                               order.order_number, extra={"payment_id": payment_id, "order": order.order_number})
+            await db.rollback()
+            payment = await db.get(Payment, payment_id)
+            payment.status = "failed"
+            outcome = "failed"
+
+        await db.commit()
+        payment_events.publish(payment)
+
+        if outcome == "created":
+            logger.info("Payment created", extra={"payment_id": payment.id, "order": order.order_number, "amount": payment.amount})
+        return outcome
+
+
+async def give_up_payment_job(payment_id: int) -> str:
+    """Mark a payment still "processing" as "failed" after its last attempt
+    broke down; returns "failed" or "skipped" (not processing any more)"""
+    async with AsyncSessionLocal() as db:
+        payment = await db.scalar(select(Payment).where(Payment.id == payment_id, Payment.status == "processing"))
+        if not payment:
+            return "skipped"
+        payment.status = "failed"
+        await db.commit()
+        payment_events.publish(payment)
+        return "failed"
+
+
+class PaymentJobWorker:
+    """Runs queued payment creations with bounded concurrency"""
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._attempts: Dict[int, int] = {}
+        self.outcomes: Dict[str, int] = {}
+
+    def submit(self, payment_id: int):
+        """Queue a committed "processing" payment (no-op before the worker
+        started; startup picks it up from the table)"""
+        if self._queue is not None:
+            self._queue.put_nowait(payment_id)
+
+    async def run_one(self, payment_id: int) -> str:
+        attempt = self._attempts.get(payment_id, 0) + 1
+        final_attempt = attempt >= settings.PAYMENT_JOB_MAX_ATTEMPTS
+        try:
+            outcome = await run_payment_job(payment_id, final_attempt=final_attempt)
+        except Exception:
+            logger.exception("Payment job error", extra={"payment_id": payment_id})
+            outcome = "retry"
+            if final_attempt:
+                # Nothing reschedules it any more: fail it rather than leave it "processing"
+                try:
+                    outcome = await give_up_payment_job(payment_id)
+                except Exception:
+                    logger.exception("Payment job could not be failed, left processing until restart", extra={"payment_id": payment_id})
+
+        if outcome == "retry" and not final_attempt:
+            self._attempts[payment_id] = attempt
+            delay = settings.PAYMENT_JOB_RETRY_SECONDS * 2 ** (attempt - 1)
+            asyncio.get_running_loop().call_later(delay, self.submit, payment_id)
+            payment_jobs_total.inc("retried")
+        else:
+            self._attempts.pop(payment_id, None)
+            if outcome in ("created", "failed"):
+                payment_jobs_total.inc(outcome)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        return outcome
+
+    async def _consume(self):
+        while True:
+            payment_id = await self._queue.get()
+            try:
+                await self.run_one(payment_id)
+            finally:
+                self._queue.task_done()
+
+    async def run(self):
+        """Requeue payments left "processing" before a restart, then run new jobs"""
+        self._queue = asyncio.Queue()
+        try:
+            async with AsyncSessionLocal() as db:
+                leftovers = (await db.scalars(
+                    select(Payment.id).where(Payment.status == "processing").order_by(Payment.id)
+                )).all()
+            for payment_id in leftovers:
+                self._queue.put_nowait(payment_id)
+            if leftovers:
+                logger.info("Requeued %d payment jobs", len(leftovers))
+            await asyncio.gather(*(self._consume() for _ in range(max(1, settings.PAYMENT_JOB_CONCURRENCY))))
+        finally:
+            self._queue = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "retrying": len(self._attempts),
+            "outcomes": dict(self.outcomes),
+        }
+
+
+# Shared worker instance
+payment_jobs = PaymentJobWorker()
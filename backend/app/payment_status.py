@@ -0,0 +1,131 @@
+"""
+Payment status transitions shared by the iPaymu callback, manual status
+checks and the background reconciler
+"""
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .models import Payment, Order, Subscription, User
+from .email import send_payment_confirmation_email
+from .timezone import now_jakarta
+
+logger = logging.getLogger(__name__)
+
+# iPaymu status codes: "1" = paid, "0" = pending, anything else = failed/expired
+IPAYMU_STATUS_SUCCESS = "1"
+IPAYMU_STATUS_PENDING = "0"
+
+
+async def transition(db: AsyncSession, payment: Payment, status: str, **values) -> bool:
+    """Compare-and-set the payment's status in the database
+
+    The UPDATE only matches while the row is neither "success" nor already
+    `status`, so when the callback inbox, a status check and the reconciler
+    race on the same payment exactly one of them wins. The winner gets True
+    and its in-memory payment is updated without another UPDATE; a loser's
+    stale payment is reloaded from the database.
+    """
+    values = {"status": status, "updated_at": datetime.utcnow(), **values}
+    result = await db.execute(
+        update(Payment)
+        .where(Payment.id == payment.id, Payment.status.notin_(["success", status]))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.refresh(payment)
+        return False
+    for key, value in values.items():
+        set_committed_value(payment, key, value)
+    return True
+
+
+def order_graph_options(order_joined: bool = False):
+    """Loader option fetching a payment's order, user and subscription in the same query
+
+    Use on every query whose result goes to apply_ipaymu_status; its db.get()
+    calls are then served from the identity map with no extra SELECTs. Pass
+    order_joined=True when the query already joins Order (ownership checks).
+    """
+    order = contains_eager(Payment.order) if order_joined else joinedload(Payment.order)
+    return order.options(joinedload(Order.user), joinedload(Order.subscription))
+
+
+async def apply_ipaymu_status(db: AsyncSession, payment: Payment, status_code: str, source: str = "iPaymu") -> bool:
+    """Apply an iPaymu status code to a payment and its order/subscription
+
+    Does not commit - the caller owns the transaction. Returns True when the
+    payment status actually changed. A payment that is already "success" is
+    never touched again: the status change is a compare-and-set on the row
+    (transition()), and the order, subscription and email side effects only
+    run for the caller that won it, so repeated or concurrent notifications
+    cannot extend a renewal subscription twice or resend the confirmation
+    email. Load the payment with order_graph_options() to avoid one query
+    per related row.
+    """
+    status_code = str(status_code) if status_code is not None else None
+
+    if payment.status == "success":
+        logger.debug("Payment already success, ignoring status", extra={"source": source, "payment_id": payment.id, "status_code": status_code})
+        return False
+
+    if status_code == IPAYMU_STATUS_SUCCESS:
+        if not await transition(db, payment, "success", paid_at=now_jakarta()):
+            logger.debug("Payment already success, ignoring status", extra={"source": source, "payment_id": payment.id, "status_code": status_code})
+            return False
+
+        order = await db.get(Order, payment.order_id)
+        if order:
+            order.status = "paid"
+
+            # Renewal order: extend subscription by 1 year from current end_date
+            if order.subscription_id:
+                # Fresh row: the caller's copy may be older than another renewal's write
+                subscription = await db.get(Subscription, order.subscription_id, populate_existing=True)
+                if subscription:
+                    old_end = subscription.end_date
+                    subscription.end_date = old_end + timedelta(days=365)
+                    subscription.status = "active"
+                    subscription.updated_at = datetime.utcnow()
+                    logger.info("Subscription extended", extra={
+                        "source": source, "subscription_id": subscription.id,
+                        "old_end": old_end, "new_end": subscription.end_date
+                    })
+
+            # Confirmation email: queued in the caller's transaction, so it is
+            # committed exactly once together with the status change
+            try:
+                user = await db.get(User, order.user_id)
+                send_payment_confirmation_email(
+                    to_email=user.email,
+                    payment_data={
+                        'customer_name': user.full_name,
+                        'order_number': order.order_number,
+                        'amount': payment.amount,
+                        'payment_method': payment.payment_method,
+                        'status': 'success',
+                        'transaction_id': payment.ipaymu_transaction_id
+                    },
+                    db=db
+                )
+            except Exception as e:
+                logger.warning("Failed to queue payment confirmation email: %s", e, extra={"source": source, "payment_id": payment.id})
+
+        logger.info("Payment marked as success", extra={
+            "source": source, "payment_id": payment.id, "order": order.order_number if order else None
+        })
+        return True
+
+    if status_code == IPAYMU_STATUS_PENDING:
+        logger.debug("Payment still pending", extra={"source": source, "payment_id": payment.id})
+        return False
+
+    # Failed or expired (never overrides a success written meanwhile)
+    if not await transition(db, payment, "failed"):
+        return False
+    logger.info("Payment failed", extra={"source": source, "payment_id": payment.id, "status_code": status_code})
+    return True
@@ -0,0 +1,110 @@
+"""
+Per-request SQL query counting
+
+A cursor-execute hook on both engines counts statements into a
+context-local QueryStats, so each request (or a `count_queries()` block in
+a test script) sees only its own queries. In DEBUG the middleware reports
+them as X-DB-Query-Count / X-DB-Query-Time-Ms response headers and warns
+about requests over DB_QUERY_WARN_THRESHOLD - the usual sign of an N+1.
+Statement latency by operation always goes to /metrics.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+
+from .config import settings
+from .database import engine, async_engine
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Every statement is timed, whether or not a count_queries() block is active
+db_query_seconds = Histogram(
+    "db_query_duration_seconds",
+    "SQL statement execution time",
+    labelnames=("operation",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+
+class QueryStats:
+    __slots__ = ("count", "seconds", "parent")
+
+    def __init__(self, parent: "QueryStats" = None):
+        self.count = 0
+        self.seconds = 0.0
+        self.parent = parent
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _operation(statement: str) -> str:
+    keyword = statement.lstrip()[:6].upper()
+    return keyword if keyword in _OPERATIONS else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    db_query_seconds.observe(elapsed, _operation(statement))
+
+    # Nested blocks (metrics middleware around the DEBUG header middleware) all see the query
+    stats = _current.get()
+    while stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats = stats.parent
+
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+@contextmanager
+def count_queries():
+    """Count the queries run inside the block (the async session shares the context)"""
+    stats = QueryStats(_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+class QueryCountMiddleware:
+    """ASGI middleware adding per-request query count/time headers (DEBUG only)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as stats:
+            async def send_with_headers(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-db-query-count", str(stats.count).encode()))
+                    headers.append((b"x-db-query-time-ms", f"{stats.seconds * 1000:.1f}".encode()))
+                    message = {**message, "headers": headers}
+                    if stats.count > settings.DB_QUERY_WARN_THRESHOLD:
+                        logger.warning("Query budget exceeded: %s %s ran %d queries", scope['method'], scope['path'], stats.count)
+                await send(message)
+
+            await self.app(scope, receive, send_with_headers)
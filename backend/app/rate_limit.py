@@ -1,53 +1,199 @@
-from fastapi import HTTPException, Request
-from datetime import datetime, timedelta
-from collections import defaultdict
-from typing import Dict
-import asyncio
+"""
+Rate limiting middleware (sliding-window counter per client IP and cost class)
 
-# In-memory storage for rate limiting (use Redis in production)
-rate_limit_storage: Dict[str, list] = defaultdict(list)
+Each client keeps two counters - the current and the previous fixed
+window - and the request rate is estimated as
+previous * (remaining share of the window) + current. That is O(1) per
+request and a fixed size per client. Clients live in an LRU map capped at
+RATE_LIMIT_MAX_CLIENTS, so memory stays bounded without a cleanup sweep.
 
-async def check_rate_limit(request: Request, max_requests: int = 60, window_seconds: int = 60):
-    """
-    Rate limiting middleware
-    Default: 60 requests per minute per IP
+Routes have a cost: login, register and password reset spend much more
+of the per-minute budget than browsing the catalog. Every listed route is
+its own cost class with its own budget per client, so a locked-out login
+does not block browsing; all unlisted routes share the "default" class.
+Rejections are counted per cost class, which keeps the metric's label set
+as small as ROUTE_COSTS.
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+from .config import settings
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+rate_limit_rejected_total = Counter(
+    "rate_limit_rejected_total",
+    "Requests rejected with 429 by the rate limiter",
+    labelnames=("cost_class",),
+)
+
+# (method, path, cost); cost 0 = not limited. Unlisted routes cost 1.
+ROUTE_COSTS = [
+    ("POST", "/api/auth/login", 10),
+    ("POST", "/api/auth/register", 10),
+    ("POST", "/api/auth/forgot-password", 20),
+    ("POST", "/api/auth/reset-password", 10),
+    ("POST", "/api/auth/verify-email", 5),
+    ("POST", "/api/payments/callback", 0),  # iPaymu servers, must never be throttled
+    ("GET", "/health", 0),
+    ("GET", "/metrics", 0),  # Prometheus scraper
+    ("GET", "/", 0),
+]
+_ROUTE_COSTS = {(method, path): cost for method, path, cost in ROUTE_COSTS}
+
+
+def route_class(method: str, path: str) -> Tuple[str, int]:
+    """(cost class, cost) of a request"""
+    if method == "OPTIONS":
+        return "preflight", 0  # CORS preflight
+    if path != "/":
+        path = path.rstrip("/")
+    cost = _ROUTE_COSTS.get((method, path))
+    if cost is None:
+        return "default", 1
+    return f"{method} {path}", cost
+
+
+class SlidingWindowLimiter:
+    """Per-key sliding-window counters in a bounded LRU map"""
+
+    def __init__(self, limit: int, window_seconds: float, max_keys: int):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        # key -> [window index, previous window count, current window count]
+        self._clients: "OrderedDict[str, list]" = OrderedDict()
+        self.evictions = 0
+
+    def hit(self, key: str, cost: int = 1, now: float = None) -> Tuple[bool, float, float]:
+        """Spend `cost` for key; returns (allowed, remaining budget, retry after seconds)"""
+        now = time.monotonic() if now is None else now
+        window = int(now // self.window_seconds)
+        elapsed_share = (now % self.window_seconds) / self.window_seconds
+
+        state = self._clients.get(key)
+        if state is None:
+            state = [window, 0.0, 0.0]
+            self._clients[key] = state
+            if len(self._clients) > self.max_keys:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._clients.move_to_end(key)
+            if state[0] != window:
+                # Roll over: the current window becomes the previous one (or both reset after a gap)
+                state[1] = state[2] if state[0] == window - 1 else 0.0
+                state[2] = 0.0
+                state[0] = window
+
+        estimated = state[1] * (1 - elapsed_share) + state[2]
+        if estimated + cost > self.limit:
+            # Until the previous window's weight has decayed enough (or the window ends)
+            if state[1] > 0:
+                needed = estimated + cost - self.limit
+                retry_after = min(needed / state[1] * self.window_seconds, (1 - elapsed_share) * self.window_seconds)
+            else:
+                retry_after = (1 - elapsed_share) * self.window_seconds
+            return False, max(self.limit - estimated, 0.0), max(retry_after, 1.0)
+
+        state[2] += cost
+        return True, self.limit - estimated - cost, 0.0
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "max_clients": self.max_keys,
+            "evictions": self.evictions,
+            "rejected": int(rate_limit_rejected_total.total()),
+        }
+
+
+PROXY_HEADERS = (b"x-forwarded-for", b"x-real-ip")
+_proxy_warning_logged = False
+
+
+def client_ip(scope) -> str:
+    """Client address; behind a trusted proxy (nginx) the address the proxy saw
+
+    X-Real-IP is set by nginx itself. Without it, only the rightmost
+    X-Forwarded-For hop was appended by the proxy; everything left of it
+    comes from the client and is trivially forged.
     """
-    # Get client IP
-    client_ip = request.client.host
-    
-    # Get current time
-    now = datetime.now()
-    window_start = now - timedelta(seconds=window_seconds)
-    
-    # Clean old requests
-    rate_limit_storage[client_ip] = [
-        req_time for req_time in rate_limit_storage[client_ip]
-        if req_time > window_start
-    ]
-    
-    # Check if limit exceeded
-    if len(rate_limit_storage[client_ip]) >= max_requests:
-        raise HTTPException(
-            status_code=429,
-            detail=f"Rate limit exceeded. Maximum {max_requests} requests per {window_seconds} seconds."
-        )
-    
-    # Add current request
-    rate_limit_storage[client_ip].append(now)
-
-# Cleanup task (runs every hour)
-async def cleanup_rate_limit_storage():
-    """Remove old entries from rate limit storage"""
-    while True:
-        await asyncio.sleep(3600)  # 1 hour
-        cutoff_time = datetime.now() - timedelta(hours=1)
-        
-        # Clean up old entries
-        for ip in list(rate_limit_storage.keys()):
-            rate_limit_storage[ip] = [
-                req_time for req_time in rate_limit_storage[ip]
-                if req_time > cutoff_time
-            ]
-            # Remove empty entries
-            if not rate_limit_storage[ip]:
-                del rate_limit_storage[ip]
+    global _proxy_warning_logged
+    client = scope.get("client")
+    peer = client[0] if client else "unknown"
+    if not settings.RATE_LIMIT_TRUST_PROXY:
+        if not _proxy_warning_logged and any(name in PROXY_HEADERS for name, _ in scope.get("headers") or []):
+            # Behind a proxy every user would share the proxy's budget
+            _proxy_warning_logged = True
+            logger.warning(
+                "Request from %s carries X-Forwarded-For/X-Real-IP but RATE_LIMIT_TRUST_PROXY is off: "
+                "all clients behind that proxy share one rate limit budget", peer
+            )
+        return peer
+    forwarded = None
+    for name, value in scope.get("headers") or []:
+        if name == b"x-real-ip":
+            real_ip = value.decode("latin-1").strip()
+            if real_ip:
+                return real_ip
+        elif name == b"x-forwarded-for":
+            forwarded = value
+    if forwarded:
+        hop = forwarded.decode("latin-1").rsplit(",", 1)[-1].strip()
+        if hop:
+            return hop
+    return peer
+
+
+class RateLimitMiddleware:
+    """ASGI middleware answering 429 once a client's per-minute budget is spent"""
+
+    def __init__(self, app, limiter: SlidingWindowLimiter = None):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        cost_class, cost = route_class(scope["method"], scope["path"])
+        if cost == 0:
+            await self.app(scope, receive, send)
+            return
+
+        allowed, remaining, retry_after = self.limiter.hit(f"{client_ip(scope)} {cost_class}", cost)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        rate_limit_rejected_total.inc(cost_class)
+        body = json.dumps({
+            "detail": f"Rate limit exceeded. Maximum {self.limiter.limit} requests per "
+                      f"{int(self.limiter.window_seconds)} seconds."
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(int(retry_after + 0.999)).encode()),
+                (b"x-ratelimit-limit", str(self.limiter.limit).encode()),
+                (b"x-ratelimit-remaining", str(int(remaining)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+# Shared limiter (per process)
+rate_limiter = SlidingWindowLimiter(
+    settings.RATE_LIMIT_PER_MINUTE,
+    60.0,
+    settings.RATE_LIMIT_MAX_CLIENTS,
+)
@@ -0,0 +1,104 @@
+"""
+Background reconciliation of pending payments against iPaymu
+
+Catches payments whose callback never arrived, so the frontend no longer
+has to poll /check-status to move a payment out of "pending".
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .events import payment_events
+from .ipaymu import ipaymu_client, IpaymuUnavailable
+from .models import Payment
+from .payment_status import apply_ipaymu_status, order_graph_options
+
+logger = logging.getLogger(__name__)
+
+
+async def _fetch_statuses(transaction_ids: List[str], concurrency: int) -> Dict[str, Optional[str]]:
+    """Query iPaymu /transaction for many ids with at most `concurrency` calls in flight"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(transaction_id: str):
+        async with semaphore:
+            try:
+                return transaction_id, await ipaymu_client.transaction_status(transaction_id)
+            except IpaymuUnavailable:
+                # Circuit open: try again next run, no warning per payment
+                return transaction_id, None
+            except Exception as e:
+                logger.warning("iPaymu check failed: %s: %s", type(e).__name__, e, extra={"trx_id": transaction_id})
+                return transaction_id, None
+
+    results = await asyncio.gather(*(fetch(trx_id) for trx_id in transaction_ids))
+    return dict(results)
+
+
+async def reconcile_pending_payments(batch_size: int = None, concurrency: int = None) -> dict:
+    """Scan pending payments in id-ordered batches and apply iPaymu's current status
+
+    Returns counters: checked, updated, errors.
+    """
+    batch_size = batch_size or settings.PAYMENT_RECONCILE_BATCH_SIZE
+    concurrency = concurrency or settings.PAYMENT_RECONCILE_CONCURRENCY
+    summary = {"checked": 0, "updated": 0, "errors": 0}
+    last_id = 0
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            batch = (await db.scalars(
+                select(Payment).where(
+                    Payment.status == "pending",
+                    Payment.ipaymu_transaction_id.isnot(None),
+                    Payment.id > last_id
+                ).order_by(Payment.id).limit(batch_size).options(order_graph_options())
+            )).unique().all()
+
+            if not batch:
+                break
+            batch_last_id = batch[-1].id
+            full_batch = len(batch) == batch_size
+
+            statuses = await _fetch_statuses([p.ipaymu_transaction_id for p in batch], concurrency)
+
+            for payment in batch:
+                payment_id = payment.id
+                last_id = payment_id
+                status_code = statuses.get(payment.ipaymu_transaction_id)
+                summary["checked"] += 1
+                if status_code is None:
+                    summary["errors"] += 1
+                    continue
+                try:
+                    if await apply_ipaymu_status(db, payment, status_code, source="Reconcile"):
+                        await db.commit()
+                        payment_events.publish(payment)
+                        summary["updated"] += 1
+                except Exception as e:
+                    # Rollback expires the rest of the batch; resume after this payment
+                    await db.rollback()
+                    summary["errors"] += 1
+                    logger.warning("Failed to apply status: %s", e, extra={"payment_id": payment_id})
+                    break
+
+        if not full_batch and last_id == batch_last_id:
+            break
+
+    return summary
+
+
+async def payment_reconciliation_loop():
+    """Periodically reconcile pending payments (started on app startup)"""
+    while True:
+        await asyncio.sleep(settings.PAYMENT_RECONCILE_INTERVAL_SECONDS)
+        try:
+            summary = await reconcile_pending_payments()
+            if summary["checked"]:
+                logger.info("Pending payments reconciled", extra=summary)
+        except Exception as e:
+            logger.exception("Reconcile error")
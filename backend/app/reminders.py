@@ -0,0 +1,272 @@
+"""
+Subscription renewal reminders
+
+Replaces the hand-run send_scheduled_reminder_rsppn.py: every active
+subscription whose end date is H-7, H-3, H-1 or H-0 (Jakarta calendar days,
+SUBSCRIPTION_REMINDER_DAYS) gets a reminder rendered from the templates
+below. Subscriptions are read per day through ix_subscriptions_status_end_date
+in keyset batches, so a run never loads the whole table.
+
+Each batch inserts its email_outbox rows together with subscription_reminders
+log rows in one transaction (one executemany per table). The log's unique key (subscription, end date,
+step) means a rerun, a second worker or a restart never queues the same
+reminder twice. Delivery is left to the mail queue worker: one reused SMTP
+session, throttled per recipient provider.
+
+Jalankan sekali (tanpa server): python -m app.reminders
+"""
+import asyncio
+import html
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from .config import settings
+from .database import AsyncSessionLocal, async_engine
+from .mail_queue import mail_queue
+from .models import EmailOutbox, Subscription, SubscriptionReminder
+from .timezone import now_jakarta
+
+logger = logging.getLogger(__name__)
+
+# days_before -> (label, colour, icon); other values fall back to the generic entry
+URGENCY = {
+    7: ("REMINDER 7 HARI", "#ffc107", "📅"),
+    3: ("REMINDER 3 HARI", "#ff9800", "⚠️"),
+    1: ("REMINDER 1 HARI - URGENT!", "#f44336", "🚨"),
+    0: ("HARI INI - JATUH TEMPO!", "#d32f2f", "🔴"),
+}
+
+MONTHS = ["Januari", "Februari", "Maret", "April", "Mei", "Juni", "Juli",
+          "Agustus", "September", "Oktober", "November", "Desember"]
+
+SUBJECT_TEMPLATE = "{icon} {urgency}: Perpanjangan {package} - Jatuh Tempo {end_date}"
+
+TEXT_TEMPLATE = """{urgency}: PERPANJANGAN {package_upper}
+
+Kepada Yth,
+{name}
+
+{days_text}
+
+DETAIL PAKET:
+- Nama Paket: {package}
+- Email: {email}
+- Tanggal Berakhir: {end_date}
+- Harga Perpanjangan: Rp {price}
+
+PERPANJANG SEKARANG:
+{renew_url}
+
+Jika pembayaran tidak diterima sebelum tanggal berakhir, layanan akan otomatis dinonaktifkan.
+
+Salam Hangat,
+Tim Neo Integratech
+"""
+
+HTML_TEMPLATE = """<html>
+    <body style="font-family: Arial, sans-serif; padding: 20px; background-color: #f5f5f5;">
+        <div style="max-width: 600px; margin: 0 auto; background-color: white; border-radius: 10px; overflow: hidden;">
+            <div style="background-color: {color}; color: white; padding: 24px; text-align: center;">
+                <h2 style="margin: 0;">{icon} {urgency}</h2>
+                <p style="margin: 8px 0 0;">PERPANJANGAN {package_upper}</p>
+            </div>
+            <div style="padding: 30px;">
+                <p>Kepada Yth,<br><strong>{name}</strong></p>
+                <div style="background-color: #f9fafb; border-left: 4px solid {color}; padding: 15px; margin: 20px 0;">
+                    {days_text}
+                </div>
+                <table style="width: 100%; border-collapse: collapse;">
+                    <tr><td style="padding: 8px 0; color: #666;">Nama Paket:</td><td style="text-align: right;"><strong>{package}</strong></td></tr>
+                    <tr><td style="padding: 8px 0; color: #666;">Email:</td><td style="text-align: right;">{email}</td></tr>
+                    <tr><td style="padding: 8px 0; color: #666;">Tanggal Berakhir:</td><td style="text-align: right; color: #dc3545;"><strong>{end_date}</strong></td></tr>
+                    <tr><td style="padding: 8px 0; color: #666;">Harga Perpanjangan:</td><td style="text-align: right; color: #4F46E5;"><strong>Rp {price}</strong></td></tr>
+                </table>
+                <div style="text-align: center; margin: 30px 0;">
+                    <a href="{renew_url}" style="background-color: {color}; color: white; padding: 14px 32px; text-decoration: none; border-radius: 6px; display: inline-block;">
+                        PERPANJANG SEKARANG
+                    </a>
+                </div>
+                <p style="color: #666; font-size: 14px;">
+                    Jika pembayaran tidak diterima sebelum tanggal berakhir, layanan akan otomatis dinonaktifkan.
+                </p>
+                <p>Salam Hangat,<br><strong>Tim Neo Integratech</strong></p>
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+
+def format_date_id(value: datetime) -> str:
+    """7 Februari 2026"""
+    return f"{value.day} {MONTHS[value.month - 1]} {value.year}"
+
+
+def render_reminder(subscription: Subscription, days_before: int) -> Tuple[str, str, str]:
+    """Subject, plain text and HTML body of one reminder"""
+    urgency, color, icon = URGENCY.get(days_before, (f"REMINDER {days_before} HARI", "#2196f3", "🔔"))
+    end_date = format_date_id(subscription.end_date)
+    if days_before > 0:
+        days_text = f"Paket Anda akan berakhir dalam {days_before} hari pada tanggal {end_date}."
+    else:
+        days_text = f"Paket Anda berakhir HARI INI ({end_date}). Segera lakukan perpanjangan untuk menghindari gangguan layanan!"
+
+    price = subscription.renewal_price or subscription.price
+    values = {
+        "urgency": urgency,
+        "icon": icon,
+        "color": color,
+        "name": subscription.user.full_name,
+        "email": subscription.user.email,
+        "package": subscription.package_name,
+        "package_upper": subscription.package_name.upper(),
+        "end_date": end_date,
+        "price": f"{price:,.0f}".replace(",", "."),
+        "days_text": days_text,
+        "renew_url": f"{settings.FRONTEND_URL}/dashboard",
+    }
+    subject = SUBJECT_TEMPLATE.format(**values)
+    body = TEXT_TEMPLATE.format(**values)
+    html_body = HTML_TEMPLATE.format(**{key: html.escape(str(value)) for key, value in values.items()})
+    return subject, body, html_body
+
+
+def due_subscriptions_query(day_start: datetime, after: Optional[Tuple[datetime, int]], limit: int):
+    """Next keyset batch of active subscriptions ending on the day starting at `day_start`"""
+    query = select(Subscription).where(
+        Subscription.status == "active",
+        Subscription.end_date >= day_start,
+        Subscription.end_date < day_start + timedelta(days=1),
+    )
+    if after is not None:
+        last_end, last_id = after
+        query = query.where(or_(
+            Subscription.end_date > last_end,
+            and_(Subscription.end_date == last_end, Subscription.id > last_id)
+        ))
+    return query.order_by(Subscription.end_date, Subscription.id).limit(limit)
+
+
+async def _already_queued(db, batch: List[Subscription], days_before: int) -> set:
+    rows = (await db.execute(
+        select(SubscriptionReminder.subscription_id, SubscriptionReminder.end_date).where(
+            SubscriptionReminder.subscription_id.in_([s.id for s in batch]),
+            SubscriptionReminder.days_before == days_before,
+        )
+    )).all()
+    return {(subscription_id, end_date) for subscription_id, end_date in rows}
+
+
+async def _insert_reminders(db, items: List[tuple], days_before: int):
+    # executemany of plain rows: one INSERT per table and batch, not one per reminder
+    await db.execute(insert(EmailOutbox), [
+        {"to_email": to_email, "subject": subject, "body": body, "html": html_body}
+        for _, _, to_email, (subject, body, html_body) in items
+    ])
+    await db.execute(insert(SubscriptionReminder), [
+        {"subscription_id": subscription_id, "end_date": end_date, "days_before": days_before}
+        for subscription_id, end_date, _, _ in items
+    ])
+
+
+async def _queue_batch(db, batch: List[Subscription], days_before: int) -> Tuple[int, int]:
+    """Queue reminders for one batch; returns (queued, skipped)"""
+    done = await _already_queued(db, batch, days_before)
+    # Plain values: a rollback below expires the ORM rows
+    items = [
+        (s.id, s.end_date, s.user.email, render_reminder(s, days_before))
+        for s in batch if (s.id, s.end_date) not in done
+    ]
+    if not items:
+        return 0, len(batch)
+
+    try:
+        await _insert_reminders(db, items, days_before)
+        await db.commit()
+        return len(items), len(batch) - len(items)
+    except IntegrityError:
+        # Another worker queued some of these in the meantime: go one by one
+        await db.rollback()
+
+    queued = 0
+    for item in items:
+        try:
+            await _insert_reminders(db, [item], days_before)
+            await db.commit()
+            queued += 1
+        except IntegrityError:
+            await db.rollback()
+    return queued, len(batch) - queued
+
+
+async def run_subscription_reminders(today: date = None, batch_size: int = None) -> dict:
+    """Queue every reminder due today (Jakarta); safe to run any number of times
+
+    Returns counters: queued, skipped (already queued earlier), errors.
+    """
+    today = today or now_jakarta().date()
+    batch_size = batch_size or settings.SUBSCRIPTION_REMINDER_BATCH_SIZE
+    summary = {"queued": 0, "skipped": 0, "errors": 0}
+
+    for days_before in sorted(set(settings.SUBSCRIPTION_REMINDER_DAYS), reverse=True):
+        day_start = datetime.combine(today + timedelta(days=days_before), time.min)
+        after = None
+        while True:
+            async with AsyncSessionLocal() as db:
+                batch = (await db.scalars(
+                    due_subscriptions_query(day_start, after, batch_size).options(joinedload(Subscription.user))
+                )).all()
+                if not batch:
+                    break
+                # Read the cursor before commit/rollback can expire the rows
+                after = (batch[-1].end_date, batch[-1].id)
+                queued = 0
+                try:
+                    queued, skipped = await _queue_batch(db, batch, days_before)
+                    summary["queued"] += queued
+                    summary["skipped"] += skipped
+                except Exception as e:
+                    await db.rollback()
+                    summary["errors"] += len(batch)
+                    logger.warning("Reminder batch failed: %s", e, extra={"days_before": days_before, "last_id": after[1]})
+
+            if queued:
+                mail_queue.notify()
+            if len(batch) < batch_size:
+                break
+
+    return summary
+
+
+async def subscription_reminder_loop():
+    """Periodically queue due renewal reminders (started on app startup)"""
+    while True:
+        try:
+            summary = await run_subscription_reminders()
+            if summary["queued"] or summary["errors"]:
+                logger.info("Subscription reminders queued", extra=summary)
+        except Exception as e:
+            logger.exception("Subscription reminder error")
+        await asyncio.sleep(settings.SUBSCRIPTION_REMINDER_INTERVAL_SECONDS)
+
+
+async def _main():
+    try:
+        return await run_subscription_reminders()
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    from .database import init_db
+    init_db()
+    print(f"Reminders: {asyncio.run(_main())}")
+    # No worker runs outside the app: deliver what was queued now (throttled
+    # messages stay queued for the app's worker)
+    while any(mail_queue.deliver_due().values()):
+        pass
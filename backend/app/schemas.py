@@ -30,6 +30,10 @@ class Token(BaseModel):
     token_type: str
     user: UserResponse
 
+class StreamToken(BaseModel):
+    token: str
+    expires_in: int
+
 class ForgotPasswordRequest(BaseModel):
     email: EmailStr
 
@@ -8,80 +8,15 @@ import bcrypt
 
 from .database import SessionLocal, init_db
 from .models import User, Service, Subscription, Order, Payment
+from .catalog import default_services_upsert
 
 def hash_password(password: str) -> str:
     """Hash password using bcrypt"""
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
 def seed_services(db: Session):
-    """Seed initial services"""
-    services_data = [
-        {
-            "name": "Paket All In Service",
-            "slug": "all-in",
-            "description": "Paket paling hemat & optimal untuk bisnis jangka panjang. Sudah termasuk Website, SEO, Mail Server, Cloudflare, dan Hosting.",
-            "category": "package",
-            "price": 81000000,
-            "duration_days": 365,
-            "features": '["Website Service - Custom UI/UX", "SEO Service (12 bulan)", "Mail Server Service", "Cloudflare Protection", "Hosting Performa Tinggi", "Support Teknis Lengkap"]'
-        },
-        {
-            "name": "Website Service",
-            "slug": "website",
-            "description": "Website Service Profesional - Pembuatan website custom dengan performa tinggi.",
-            "category": "web",
-            "price": 36000000,
-            "duration_days": 365,
-            "features": '["Custom UI/UX", "Hosting Performa Tinggi", "Optimasi Kecepatan", "Maintenance & Update", "Backup & Keamanan", "Support Teknis"]'
-        },
-        {
-            "name": "SEO Service",
-            "slug": "seo",
-            "description": "SEO Service Berkelanjutan (12 Bulan) - Optimasi mesin pencari profesional.",
-            "category": "marketing",
-            "price": 42000000,
-            "duration_days": 365,
-            "features": '["SEO On-Page & Technical", "Optimasi Struktur & Kecepatan", "Google Search Console & Analytics", "Monitoring Keyword Bulanan", "Laporan Performa SEO", "Optimasi Berkelanjutan 12 Bulan"]'
-        },
-        {
-            "name": "Mail Server Service",
-            "slug": "mail-server",
-            "description": "Mail Server Bisnis Profesional - Email bisnis dengan domain perusahaan.",
-            "category": "email",
-            "price": 15000000,
-            "duration_days": 365,
-            "features": '["Email dengan Domain Perusahaan", "Setup SPF, DKIM, DMARC", "Perlindungan Spam & Phishing", "Sinkronisasi Webmail & Perangkat", "Maintenance & Support"]'
-        },
-        {
-            "name": "Cloudflare Service",
-            "slug": "cloudflare",
-            "description": "Cloudflare Protection & Performance - Keamanan dan performa maksimal.",
-            "category": "security",
-            "price": 24000000,
-            "duration_days": 365,
-            "features": '["CDN Global & Caching", "Proteksi DDoS & Firewall", "SSL Full Encryption", "Proteksi Bot & Traffic Berbahaya", "Monitoring Keamanan 24/7"]'
-        },
-        {
-            "name": "Test Payment Service",
-            "slug": "test-payment",
-            "description": "Service untuk test pembayaran dengan nominal minimal Rp 10.000 (minimum iPaymu)",
-            "category": "test",
-            "price": 10000,
-            "duration_days": 1,
-            "features": '["Test Payment", "Minimal Amount", "Email Notification Test"]'
-        }
-    ]
-    
-    for service_data in services_data:
-        existing = db.query(Service).filter(Service.slug == service_data["slug"]).first()
-        if not existing:
-            service = Service(**service_data)
-            db.add(service)
-        else:
-            # Update existing service with slug if needed
-            for key, value in service_data.items():
-                setattr(existing, key, value)
-    
+    """Seed initial services (app/catalog.py DEFAULT_SERVICES)"""
+    db.execute(default_services_upsert(db.get_bind().dialect.name, update=True))
     db.commit()
     print("✅ Services seeded successfully!")
 
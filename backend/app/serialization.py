@@ -0,0 +1,94 @@
+"""
+Fast JSON response path
+
+FastAPI's default path for a response_model validates every ORM row into
+the Pydantic model in Python (from_attributes), turns the models into
+plain dicts and then json.dumps() them. The app's default response class
+(ORJSONResponse) speeds up only the last step. The hot user-scoped reads
+(orders, payments, subscriptions) use the serializers below instead:
+built once per response model, they copy the model's fields straight from
+the loaded row and encode them with orjson - the same bytes as the
+Pydantic path, without building a model instance per row.
+
+benchmark_serialization.py measures the per-row cost of each path.
+"""
+import types
+from datetime import datetime
+from typing import Any, List, Optional, Type, Union, get_args, get_origin
+
+import orjson
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from .schemas import OrderResponse, PaymentResponse, SubscriptionResponse
+
+# Field types whose column values orjson encodes exactly like Pydantic does
+PLAIN_TYPES = (str, int, float, bool, datetime)
+
+
+def plain_type(annotation) -> Optional[type]:
+    """str/int/float/bool/datetime (or Optional of one), else None"""
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+    return annotation if annotation in PLAIN_TYPES else None
+
+
+class Serializer:
+    """Precompiled JSON encoder for one response model (one row, or a list with many=True)
+
+    When every field is a plain type and the model has no aliases or custom
+    serializers, rows are encoded directly from their column values; other
+    models go through a TypeAdapter built once here.
+    """
+
+    def __init__(self, model: Type[BaseModel], many: bool = False):
+        self.many = many
+        self.fields = tuple(model.model_fields)
+        field_types = [plain_type(field.annotation) for field in model.model_fields.values()]
+        decorators = model.__pydantic_decorators__
+        self.direct = (
+            all(field_types)
+            and not any(field.alias or field.serialization_alias for field in model.model_fields.values())
+            and not decorators.field_serializers and not decorators.model_serializers
+        )
+        # Pydantic turns an int in a float field into 1.0; keep that
+        self.float_fields = tuple(name for name, kind in zip(self.fields, field_types) if kind is float)
+        self.adapter = TypeAdapter(List[model] if many else model)
+
+    def _row(self, obj) -> dict:
+        values = obj.__dict__
+        try:
+            row = {name: values[name] for name in self.fields}
+        except KeyError:
+            # Expired or deferred attribute: let SQLAlchemy load it
+            row = {name: getattr(obj, name) for name in self.fields}
+        for name in self.float_fields:
+            if type(row[name]) is int:
+                row[name] = float(row[name])
+        return row
+
+    def dump_json(self, content: Any) -> bytes:
+        if not self.direct:
+            return self.adapter.dump_json(self.adapter.validate_python(content, from_attributes=True))
+        data = [self._row(obj) for obj in content] if self.many else self._row(content)
+        # OPT_UTC_Z: aware UTC datetimes end in "Z", as Pydantic writes them
+        return orjson.dumps(data, option=orjson.OPT_UTC_Z)
+
+    def response(self, content: Any, response: Optional[Response] = None, status_code: int = 200) -> Response:
+        """JSON response for ORM rows; keeps headers/status set on the endpoint's
+        injected Response (FastAPI only merges those for non-Response returns)"""
+        out = Response(content=self.dump_json(content), media_type="application/json", status_code=status_code)
+        if response is not None:
+            out.headers.raw.extend(response.headers.raw)
+            if response.status_code:
+                out.status_code = response.status_code
+        return out
+
+
+order_json = Serializer(OrderResponse)
+orders_json = Serializer(OrderResponse, many=True)
+payment_json = Serializer(PaymentResponse)
+payments_json = Serializer(PaymentResponse, many=True)
+subscription_json = Serializer(SubscriptionResponse)
+subscriptions_json = Serializer(SubscriptionResponse, many=True)
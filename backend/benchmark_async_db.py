@@ -0,0 +1,234 @@
+"""
+Benchmark: blocking Session vs AsyncSession inside async route handlers
+
+Runs the same mixed read/write traffic (order listing + order insert) against
+two in-process apps sharing one temporary SQLite file:
+  - blocking: async def handlers using the sync SessionLocal (old pattern)
+  - async:    async def handlers using AsyncSessionLocal (aiosqlite)
+While the traffic runs, a DB-free /ping endpoint is probed to show how much
+each variant stalls the event loop for unrelated requests.
+
+--io-latency-ms adds a sleep per SQL statement to emulate a slow disk. It
+sleeps inside SQLite's trace callback, i.e. in the thread that runs the
+statement: the event loop for the blocking variant, aiosqlite's worker
+thread for the async one. (An earlier version slept in a
+before_cursor_execute hook, which SQLAlchemy's asyncio layer calls on the
+event loop; that serialized the async variant and made it look slower.)
+
+Reading the results: a blocking handler never yields while it waits for
+SQLite, so each request runs alone and its own latency looks short; the
+time other requests spend waiting for the loop only shows up in the ping
+columns. Compare throughput and ping latency, not p50/p99 across variants.
+Without --io-latency-ms the work is CPU-bound under the GIL and the async
+variant is slower (aiosqlite hands every call to its thread and back); it
+wins once statements actually wait on I/O.
+
+Jalankan: python benchmark_async_db.py --requests 400 --concurrency 32 --io-latency-ms 2
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="neointegra-bench-"), "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import event, select
+
+from app.database import SessionLocal, AsyncSessionLocal, engine, async_engine, init_db
+from app.models import User, Order
+
+
+def build_blocking_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/orders/{user_id}")
+    async def list_orders(user_id: int):
+        db = SessionLocal()
+        try:
+            orders = db.query(Order).filter(Order.user_id == user_id).order_by(Order.id.desc()).limit(20).all()
+            return {"count": len(orders)}
+        finally:
+            db.close()
+
+    @app.post("/orders/{user_id}")
+    async def create_order(user_id: int):
+        db = SessionLocal()
+        try:
+            db.add(new_order(user_id))
+            db.commit()
+            return {"ok": True}
+        finally:
+            db.close()
+
+    return app
+
+
+def build_async_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/orders/{user_id}")
+    async def list_orders(user_id: int):
+        async with AsyncSessionLocal() as db:
+            orders = (await db.scalars(
+                select(Order).where(Order.user_id == user_id).order_by(Order.id.desc()).limit(20)
+            )).all()
+            return {"count": len(orders)}
+
+    @app.post("/orders/{user_id}")
+    async def create_order(user_id: int):
+        async with AsyncSessionLocal() as db:
+            db.add(new_order(user_id))
+            await db.commit()
+            return {"ok": True}
+
+    return app
+
+
+_order_seq = 0
+
+
+def new_order(user_id: int) -> Order:
+    global _order_seq
+    _order_seq += 1
+    return Order(
+        user_id=user_id,
+        order_number=f"BENCH-{os.getpid()}-{_order_seq}",
+        service_name="Benchmark",
+        unit_price=10000,
+        total_price=10000,
+    )
+
+
+def seed(users: int) -> list:
+    init_db()
+    db = SessionLocal()
+    try:
+        ids = []
+        for i in range(users):
+            user = User(email=f"bench{i}@example.com", full_name="Bench", hashed_password="x", is_active=True)
+            db.add(user)
+            db.flush()
+            ids.append(user.id)
+        db.commit()
+        return ids
+    finally:
+        db.close()
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_variant(name: str, app: FastAPI, user_ids: list, total: int, concurrency: int, write_ratio: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies, ping_latencies = [], []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue: asyncio.Queue = asyncio.Queue()
+        for _ in range(total):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                user_id = random.choice(user_ids)
+                started = time.perf_counter()
+                if random.random() < write_ratio:
+                    await client.post(f"/orders/{user_id}")
+                else:
+                    await client.get(f"/orders/{user_id}")
+                latencies.append(time.perf_counter() - started)
+
+        async def prober():
+            # Measure from when the ping was due, so time spent waiting for a
+            # blocked event loop counts against it
+            while not done.is_set():
+                due = time.perf_counter() + 0.005
+                await asyncio.sleep(0.005)
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - due)
+
+        probe_task = asyncio.create_task(prober())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    # Close pooled aiosqlite connections (their threads outlive asyncio.run otherwise)
+    await async_engine.dispose()
+
+    return {
+        "variant": name,
+        "requests": total,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "ping_p50_ms": round(statistics.median(ping_latencies) * 1000, 2) if ping_latencies else None,
+        "ping_p99_ms": round(percentile(ping_latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--io-latency-ms", type=float, default=2.0, help="sleep per SQL statement (slow disk)")
+    args = parser.parse_args()
+
+    if args.io_latency_ms > 0:
+        delay = args.io_latency_ms / 1000
+
+        def slow_io(dbapi_connection, connection_record):
+            # Sleep where SQLite itself runs: the calling thread for the sync
+            # engine, aiosqlite's worker thread for the async one. A
+            # before_cursor_execute hook would run on the event loop for both.
+            driver = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+            getattr(driver, "_conn", driver).set_trace_callback(lambda statement: time.sleep(delay))
+
+        event.listen(engine, "connect", slow_io)
+        event.listen(async_engine.sync_engine, "connect", slow_io)
+
+    user_ids = seed(args.users)
+    print(f"Database: {DB_PATH}")
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"{int(args.write_ratio * 100)}% writes, {args.io_latency_ms} ms per statement\n")
+
+    results = []
+    for name, app in (("blocking", build_blocking_app()), ("async", build_async_app())):
+        result = asyncio.run(run_variant(name, app, user_ids, args.requests, args.concurrency, args.write_ratio))
+        results.append(result)
+
+    header = f"{'variant':<10}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'ping p50':>10}{'ping p99':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['variant']:<10}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['ping_p50_ms']:>10}{r['ping_p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
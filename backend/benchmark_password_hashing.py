@@ -0,0 +1,125 @@
+"""
+Benchmark: bcrypt inline in async handlers vs the bounded worker pool
+
+Fires a burst of logins (bcrypt verify) at two in-process apps while a
+DB-free /ping endpoint is probed:
+  - inline: bcrypt.checkpw called directly in the async handler (old pattern)
+  - pool:   app.passwords.verify_password (thread pool + bounded queue)
+Reports login throughput/p99 and /ping latency during the burst.
+
+Jalankan: python benchmark_password_hashing.py --logins 32 --concurrency 16 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bcrypt
+import httpx
+from fastapi import FastAPI
+
+from app.passwords import verify_password, password_hasher
+
+PASSWORD = "benchmark-password"
+
+
+def build_app(hashed: str, pooled: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/login")
+    async def login():
+        if pooled:
+            ok = await verify_password(PASSWORD, hashed)
+        else:
+            ok = bcrypt.checkpw(PASSWORD.encode('utf-8'), hashed.encode('utf-8'))
+        return {"ok": ok}
+
+    return app
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run_variant(name: str, app: FastAPI, total: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    latencies, ping_latencies = [], []
+    statuses = {}
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        remaining = [total]
+
+        async def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                started = time.perf_counter()
+                response = await client.post("/login")
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        async def prober():
+            # Measured from when the ping was due, so a blocked loop counts against it
+            while not done.is_set():
+                due = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+                await client.get("/ping")
+                ping_latencies.append(time.perf_counter() - due)
+
+        probe_task = asyncio.create_task(prober())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    return {
+        "variant": name,
+        "logins": total,
+        "elapsed_s": round(elapsed, 2),
+        "logins_per_s": round(total / elapsed, 1),
+        "login_p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "ping_p50_ms": round(statistics.median(ping_latencies) * 1000, 1) if ping_latencies else 0.0,
+        "ping_p99_ms": round(percentile(ping_latencies, 0.99) * 1000, 1),
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor (12 = passlib/bcrypt default)")
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=args.rounds)).decode('utf-8')
+    print(f"{args.logins} logins, concurrency {args.concurrency}, bcrypt rounds {args.rounds}, "
+          f"pool workers {password_hasher.workers}, queue limit {password_hasher.max_queue}\n")
+
+    results = [
+        asyncio.run(run_variant("inline", build_app(hashed, pooled=False), args.logins, args.concurrency)),
+        asyncio.run(run_variant("pool", build_app(hashed, pooled=True), args.logins, args.concurrency)),
+    ]
+
+    header = f"{'variant':<10}{'logins/s':>10}{'login p99':>12}{'ping p50':>10}{'ping p99':>10}  statuses"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['variant']:<10}{r['logins_per_s']:>10}{r['login_p99_ms']:>12}"
+              f"{r['ping_p50_ms']:>10}{r['ping_p99_ms']:>10}  {r['statuses']}")
+    print(f"\nPool stats: {password_hasher.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: per-row cost of serializing order lists to a JSON response body
+
+Compares, for lists of 10, 100 and 1000 Order rows (GET /api/orders/):
+  - jsonresponse: FastAPI's response_model path with JSONResponse (old default)
+  - orjson:       the same path with ORJSONResponse (new app default)
+  - typeadapter:  a TypeAdapter built once (validation and encoding in
+                  pydantic-core, still one model instance per row)
+  - serializer:   app.serialization.orders_json (column values straight to
+                  orjson; used by the hot reads)
+Rows are ORM instances built in memory, so no database time is included.
+Every variant must produce the same JSON document; the bodies are compared
+before timing.
+
+Jalankan: python benchmark_serialization.py --sizes 10,100,1000 --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app.models import Order
+from app.schemas import OrderResponse
+from app.serialization import orders_json
+
+RESPONSE_FIELD = create_model_field(name="Response_get_my_orders", type_=List[OrderResponse], mode="serialization")
+ADAPTER = orders_json.adapter
+
+
+def make_orders(n: int) -> list:
+    started = datetime(2026, 1, 1, 8, 0, 0, 123456)
+    return [
+        Order(
+            id=i + 1, user_id=1, order_number=f"ORD-20260101-080000-{i:04X}NODE",
+            service_name="Website Company Profile", quantity=1, unit_price=2500000.0, total_price=2500000.0,
+            status=("pending", "paid", "cancelled")[i % 3], notes="Catatan: domain .co.id ✓" if i % 2 else None,
+            created_at=started + timedelta(minutes=i),
+        )
+        for i in range(n)
+    ]
+
+
+async def fastapi_body(rows: list, response_class) -> bytes:
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=rows)
+    return response_class(content).body
+
+
+def variants() -> dict:
+    return {
+        "jsonresponse": lambda rows: asyncio.run(fastapi_body(rows, JSONResponse)),
+        "orjson": lambda rows: asyncio.run(fastapi_body(rows, ORJSONResponse)),
+        "typeadapter": lambda rows: ADAPTER.dump_json(ADAPTER.validate_python(rows, from_attributes=True)),
+        "serializer": orders_json.dump_json,
+    }
+
+
+def time_variant(name: str, rows: list, min_rows: int, repeat: int) -> float:
+    """Best of `repeat` runs, seconds per row"""
+    loops = max(1, min_rows // len(rows))
+    best = float("inf")
+    for _ in range(repeat):
+        if name in ("typeadapter", "serializer"):
+            encode = variants()[name]
+            started = time.perf_counter()
+            for _ in range(loops):
+                encode(rows)
+            elapsed = time.perf_counter() - started
+        else:
+            response_class = JSONResponse if name == "jsonresponse" else ORJSONResponse
+
+            async def run():
+                started = time.perf_counter()
+                for _ in range(loops):
+                    await fastapi_body(rows, response_class)
+                return time.perf_counter() - started
+
+            elapsed = asyncio.run(run())
+        best = min(best, elapsed)
+    return best / (loops * len(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000", help="comma-separated list lengths")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (best is reported)")
+    parser.add_argument("--min-rows", type=int, default=20000, help="rows serialized per timed run")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    rows = make_orders(3)
+    bodies = {name: fn(rows) for name, fn in variants().items()}
+    documents = {name: json.loads(body) for name, body in bodies.items()}
+    if len({json.dumps(d, sort_keys=True) for d in documents.values()}) != 1:
+        sys.exit(f"❌ Variants disagree:\n" + "\n".join(f"{k}: {v}" for k, v in bodies.items()))
+    same_bytes = bodies["serializer"] == bodies["jsonresponse"]
+    print(f"✅ Same JSON document from every variant (serializer bytes identical to JSONResponse: {same_bytes})\n")
+
+    header = f"{'rows':>6}" + "".join(f"{name:>15}" for name in variants()) + f"{'speedup':>10}"
+    print(header + "   (µs per row, best of %d)" % args.repeat)
+    print("-" * len(header))
+    for size in sizes:
+        rows = make_orders(size)
+        per_row = {name: time_variant(name, rows, args.min_rows, args.repeat) for name in variants()}
+        speedup = per_row["jsonresponse"] / per_row["serializer"]
+        print(f"{size:>6}" + "".join(f"{per_row[name] * 1e6:>15.2f}" for name in variants()) + f"{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
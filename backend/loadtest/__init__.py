@@ -0,0 +1,10 @@
+"""
+End-to-end load tests against local stand-ins for iPaymu and SMTP
+
+- fake_ipaymu.py: /payment/direct, /transaction and the payment callback
+- smtp_sink.py:   plaintext SMTP server that accepts and counts every message
+- run.py:         starts both plus the app on a fresh SQLite file, drives the
+                  traffic mix and writes results/<time>-<commit>.json
+
+Jalankan (dari folder backend): python -m loadtest.run --users 20 --duration 30
+"""
@@ -0,0 +1,321 @@
+"""
+Local iPaymu simulator for tests and load tests
+
+Implements what the app calls - POST /payment/direct, POST /transaction and
+HEAD / (warm-up) - with the response shapes of the iPaymu v2 API, and
+checks every request's signature with the same HMAC scheme as
+app.ipaymu.generate_ipaymu_signature (401 on a mismatch).
+
+Each new transaction is paid after a random delay (`pay_after`): the
+simulator then POSTs the form-encoded callback iPaymu sends to notifyUrl,
+retrying like iPaymu when the app does not answer 200, and records how long
+the app took to answer.
+
+Faults, all off by default and changeable at runtime (POST /_sim/config):
+- latency:           extra seconds (min, max) before every API answer
+- error_rate:        share of API calls answered with HTTP `error_status`
+- unpaid_rate:       share of transactions never paid (no callback)
+- duplicate_rate:    share of callbacks delivered twice
+- out_of_order_rate: share of payments followed by a stale "pending" callback
+- va_field:          response key carrying the VA (Va, VaNumber or PaymentNo)
+
+GET /_sim/stats returns counters; POST /_sim/transactions/{id}/callback
+sends a callback with a given status on demand.
+
+Jalankan sendiri: python -m loadtest.fake_ipaymu --port 8900 --latency 0.2,2 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Dict, Tuple
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+# iPaymu transaction status codes and the status text of their callbacks
+STATUS_CODES = {"pending": 0, "success": 1, "expired": -2}
+STATUS_DESC = {0: "Pending", 1: "Berhasil", -2: "Expired"}
+CALLBACK_STATUS = {0: "pending", 1: "berhasil", -2: "expired"}
+
+VA_FIELDS = ("Va", "VaNumber", "PaymentNo")
+CALLBACK_RETRY_SECONDS = 1.0  # doubled per retry
+
+# Settable through configure() / POST /_sim/config
+FAULTS = ("latency", "error_rate", "error_status", "unpaid_rate", "duplicate_rate",
+          "out_of_order_rate", "pay_after", "va_field", "callback_retries")
+
+
+def ipaymu_signature(raw_body: bytes, va: str, api_key: str, method: str = "POST") -> str:
+    """HMAC-SHA256 of METHOD:VA:sha256(body):APIKEY, keyed with the API key"""
+    body_hash = hashlib.sha256(raw_body).hexdigest().lower()
+    string_to_sign = f"{method.upper()}:{va}:{body_hash}:{api_key}"
+    return hmac.new(api_key.encode(), string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+class FakeIpaymu:
+    """In-memory iPaymu: transactions, scheduled callbacks, faults and their counters
+
+    Without va/api_key signatures are not checked. `callback_transport` lets
+    an in-process test deliver callbacks straight to the app
+    (httpx.ASGITransport) instead of over the network.
+    """
+
+    def __init__(self, va: str = "", api_key: str = "", pay_after: Tuple[float, float] = (0.2, 1.0),
+                 seed: int = None, callback_transport: httpx.AsyncBaseTransport = None, **faults):
+        self.va = va
+        self.api_key = api_key
+        self.pay_after = pay_after
+        self.latency = (0.0, 0.0)
+        self.error_rate = 0.0
+        self.error_status = 503
+        self.unpaid_rate = 0.0
+        self.duplicate_rate = 0.0
+        self.out_of_order_rate = 0.0
+        self.va_field = "Va"
+        self.callback_retries = 2
+        self.configure(**faults)
+
+        self.transactions: Dict[str, dict] = {}
+        self.callback_seconds = []
+        self.counters = Counter()
+        self._ids = itertools.count(100000)
+        self._random = random.Random(seed)
+        self._tasks = set()
+        self._callback_transport = callback_transport
+        self._client = None
+        self.app = self._build_app()
+
+    def configure(self, **faults):
+        """Change faults (see FAULTS); unknown names raise ValueError"""
+        unknown = set(faults) - set(FAULTS)
+        if unknown:
+            raise ValueError(f"Unknown simulator setting(s): {', '.join(sorted(unknown))}")
+        if "va_field" in faults and faults["va_field"] not in VA_FIELDS:
+            raise ValueError(f"va_field must be one of {', '.join(VA_FIELDS)}")
+        for name, value in faults.items():
+            setattr(self, name, tuple(value) if name in ("latency", "pay_after") else value)
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake iPaymu", on_shutdown=[self.close])
+
+        @app.head("/")
+        async def root():
+            return Response(status_code=404)
+
+        @app.post("/payment/direct")
+        async def payment_direct(request: Request):
+            body, error = await self._read(request, "/payment/direct")
+            if error:
+                return error
+            return self._ok(self.create(body))
+
+        @app.post("/transaction")
+        async def transaction(request: Request):
+            body, error = await self._read(request, "/transaction")
+            if error:
+                return error
+            trx = self.transactions.get(str(body.get("transactionId")))
+            if trx is None:
+                return JSONResponse({"Status": 400, "Success": False, "Message": "Transaction not found", "Data": None})
+            return self._ok({
+                "TransactionId": int(trx["id"]),
+                "SessionId": trx["session_id"],
+                "ReferenceId": trx["reference_id"],
+                "Status": trx["status"],
+                "StatusCode": trx["status"],
+                "StatusDesc": STATUS_DESC[trx["status"]],
+                "Amount": trx["amount"],
+            })
+
+        @app.get("/_sim/stats")
+        async def sim_stats():
+            return self.stats()
+
+        @app.post("/_sim/config")
+        async def sim_config(request: Request):
+            try:
+                self.configure(**await request.json())
+            except (TypeError, ValueError) as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return {name: getattr(self, name) for name in FAULTS}
+
+        @app.post("/_sim/transactions/{trx_id}/callback")
+        async def sim_callback(trx_id: str, status: str = "success"):
+            trx = self.transactions.get(trx_id)
+            if trx is None or status not in STATUS_CODES:
+                raise HTTPException(status_code=404, detail="Unknown transaction or status")
+            trx["status"] = STATUS_CODES[status]
+            return {"delivered": await self.send_callback(trx, STATUS_CODES[status])}
+
+        return app
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use: ASGITransport in tests does not run startup handlers
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30, transport=self._callback_transport)
+        return self._client
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _read(self, request: Request, endpoint: str):
+        """Count, check the signature, inject latency/errors; returns (body, error response)"""
+        self.counters[f"requests {endpoint}"] += 1
+        raw = await request.body()
+        if self.api_key:
+            expected = ipaymu_signature(raw, self.va, self.api_key)
+            if request.headers.get("va") != self.va or not hmac.compare_digest(request.headers.get("signature", ""), expected):
+                self.counters["signature_failures"] += 1
+                return None, JSONResponse({"Status": 401, "Success": False, "Message": "unauthorized signature"}, status_code=401)
+        elif any(not request.headers.get(name) for name in ("va", "signature", "timestamp")):
+            return None, JSONResponse({"Status": 401, "Success": False, "Message": "Unauthorized"}, status_code=401)
+
+        if self.latency[1] > 0:
+            await asyncio.sleep(self._random.uniform(*self.latency))
+        if self.error_rate and self._random.random() < self.error_rate:
+            self.counters["injected_errors"] += 1
+            return None, JSONResponse({"Status": self.error_status, "Success": False, "Message": "Simulated gateway error"},
+                                      status_code=self.error_status)
+        try:
+            return json.loads(raw), None
+        except ValueError:
+            return None, JSONResponse({"Status": 400, "Success": False, "Message": "Invalid JSON"}, status_code=400)
+
+    @staticmethod
+    def _ok(data: dict) -> JSONResponse:
+        return JSONResponse({"Status": 200, "Success": True, "Message": "Success", "Data": data})
+
+    def create(self, body: dict) -> dict:
+        """Register a VA transaction and schedule its payment callback(s)"""
+        trx_id = str(next(self._ids))
+        trx = {
+            "id": trx_id,
+            "session_id": f"fake-session-{trx_id}",
+            "reference_id": body.get("referenceId", ""),
+            "amount": int(body.get("amount") or 0),
+            "notify_url": body.get("notifyUrl"),
+            "status": STATUS_CODES["pending"],
+        }
+        self.transactions[trx_id] = trx
+        if self._random.random() >= self.unpaid_rate:
+            self._spawn(self._pay(trx, self._random.uniform(*self.pay_after)))
+        else:
+            self.counters["unpaid"] += 1
+        va = f"8808{trx_id:0>12}"
+        return {
+            "TransactionId": int(trx_id),
+            "SessionID": trx["session_id"],
+            "ReferenceId": trx["reference_id"],
+            "Via": "VA",
+            "Channel": body.get("paymentChannel", "bca").upper(),
+            self.va_field: va,
+            "Total": trx["amount"],
+            "Expired": "",
+        }
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _pay(self, trx: dict, delay: float):
+        await asyncio.sleep(delay)
+        trx["status"] = STATUS_CODES["success"]
+        await self.send_callback(trx, trx["status"])
+        if self._random.random() < self.duplicate_rate:
+            self.counters["duplicate_callbacks"] += 1
+            await self.send_callback(trx, trx["status"])
+        if self._random.random() < self.out_of_order_rate:
+            # A "pending" notification that was delayed in transit arrives last
+            self.counters["out_of_order_callbacks"] += 1
+            await self.send_callback(trx, STATUS_CODES["pending"])
+
+    async def send_callback(self, trx: dict, status: int) -> bool:
+        """POST one callback to the transaction's notifyUrl, retrying on failure"""
+        if not trx["notify_url"]:
+            return False
+        data = {
+            "trx_id": trx["id"],
+            "sid": trx["session_id"],
+            "reference_id": trx["reference_id"],
+            "status": CALLBACK_STATUS[status],
+            "status_code": str(status),
+        }
+        delay = CALLBACK_RETRY_SECONDS
+        for attempt in range(self.callback_retries + 1):
+            if attempt:
+                self.counters["callback_retries"] += 1
+                await asyncio.sleep(delay)
+                delay *= 2
+            started = time.perf_counter()
+            try:
+                response = await self._http().post(trx["notify_url"], data=data)
+            except httpx.HTTPError:
+                continue
+            if response.status_code == 200:
+                self.callback_seconds.append(time.perf_counter() - started)
+                self.counters["callbacks"] += 1
+                return True
+        self.counters["callback_errors"] += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "transactions": len(self.transactions),
+            "paid": sum(t["status"] == STATUS_CODES["success"] for t in self.transactions.values()),
+            **{name: self.counters[name] for name in (
+                "callbacks", "callback_errors", "callback_retries", "duplicate_callbacks",
+                "out_of_order_callbacks", "unpaid", "injected_errors", "signature_failures",
+            )},
+            "requests": {name.split(" ", 1)[1]: count for name, count in self.counters.items() if name.startswith("requests ")},
+        }
+
+
+def seconds_range(value: str) -> Tuple[float, float]:
+    """"0.2,1.0" -> (0.2, 1.0); a single value means a fixed delay"""
+    low, _, high = value.partition(",")
+    return float(low), float(high or low)
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Fault options shared by this module and loadtest.run"""
+    parser.add_argument("--pay-after", type=seconds_range, default=(0.2, 1.0), help="min,max seconds before a transaction is paid")
+    parser.add_argument("--latency", type=seconds_range, default=(0.0, 0.0), help="min,max extra seconds per iPaymu API call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of API calls failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--unpaid-rate", type=float, default=0.0, help="share of transactions never paid")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="share of callbacks sent twice")
+    parser.add_argument("--out-of-order-rate", type=float, default=0.0, help="share of payments followed by a stale pending callback")
+    parser.add_argument("--va-field", choices=VA_FIELDS, default="Va", help="response key carrying the VA number")
+
+
+def faults_from_args(args) -> dict:
+    return {
+        "pay_after": args.pay_after, "latency": args.latency, "error_rate": args.error_rate,
+        "error_status": args.error_status, "unpaid_rate": args.unpaid_rate, "duplicate_rate": args.duplicate_rate,
+        "out_of_order_rate": args.out_of_order_rate, "va_field": args.va_field,
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--va", default="", help="IPAYMU_VA of the app (checks signatures together with --api-key)")
+    parser.add_argument("--api-key", default="", help="IPAYMU_API_KEY of the app")
+    add_arguments(parser)
+    args = parser.parse_args()
+    simulator = FakeIpaymu(va=args.va, api_key=args.api_key, **faults_from_args(args))
+    uvicorn.run(simulator.app, host="127.0.0.1", port=args.port, log_level="warning")
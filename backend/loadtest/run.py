@@ -0,0 +1,484 @@
+"""
+Load test: the whole app against local iPaymu and SMTP stand-ins
+
+1. Starts the fake iPaymu and the SMTP sink (own thread and event loop)
+2. Starts the app with uvicorn on a fresh SQLite file, pointed at both
+3. Runs --users virtual users for --duration seconds; each picks a flow
+   from --mix and runs it to the end:
+     browse     GET /api/services/, GET /api/services/{id}
+     checkout   register, services, create order, create payment, then poll
+                GET /api/payments/{id} until the callback marked it paid
+     returning  login, GET /api/users/me, GET /api/orders/
+4. Reports throughput and p50/p95/p99 per step and per flow, plus
+   "paid" (payment created -> poll sees success) and "callback" (iPaymu
+   callback answered by the app), and writes everything to
+   loadtest/results/<time>-<commit>.json
+
+Compare with an earlier run: --compare loadtest/results/<file>.json
+Slow or flaky gateway: --latency, --error-rate, --unpaid-rate,
+--duplicate-rate, --out-of-order-rate (see loadtest/fake_ipaymu.py)
+
+Jalankan (dari folder backend):
+    python -m loadtest.run --users 20 --duration 30
+    python -m loadtest.run --users 50 --duration 60 --mix browse=50,checkout=30,returning=20
+    python -m loadtest.run --users 20 --duration 30 --latency 0.5,3 --error-rate 0.05 --duplicate-rate 0.2
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND, "loadtest", "results")
+sys.path.insert(0, BACKEND)
+
+import httpx
+import uvicorn
+
+from loadtest.fake_ipaymu import FakeIpaymu, add_arguments, faults_from_args
+from loadtest.smtp_sink import SMTPSink
+
+FLOWS = ("browse", "checkout", "returning")
+PASSWORD = "loadtest-password"
+# Credentials the app signs with and the simulator checks
+IPAYMU_VA = "0000007700000001"
+IPAYMU_API_KEY = "loadtest-api-key"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(value: str) -> dict:
+    """"browse=70,checkout=30" -> {"browse": 70.0, "checkout": 30.0}"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"unknown flow {name!r} (choose from {', '.join(FLOWS)})")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("mix needs at least one positive weight")
+    return mix
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def summarize(samples: list, errors: int, elapsed: float) -> dict:
+    values = sorted(samples)
+    ms = lambda seconds: round(seconds * 1000, 1)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 2) if elapsed else 0,
+        "mean_ms": ms(sum(values) / len(values)) if values else 0,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1]) if values else 0,
+    }
+
+
+def git_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BACKEND, capture_output=True, text=True, timeout=30).stdout.strip()
+        except (OSError, subprocess.TimeoutExpired):
+            return ""
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "subject": git("log", "-1", "--format=%s"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+class StandIns:
+    """Fake iPaymu (uvicorn) and SMTP sink on their own thread and event loop,
+    so the load generator's CPU use does not delay callbacks"""
+
+    def __init__(self, faults: dict, seed: int):
+        self.ipaymu = FakeIpaymu(va=IPAYMU_VA, api_key=IPAYMU_API_KEY, seed=seed, **faults)
+        self.smtp = SMTPSink()
+        self.ipaymu_port = free_port()
+        self.smtp_port = free_port()
+        self._server = uvicorn.Server(uvicorn.Config(
+            self.ipaymu.app, host="127.0.0.1", port=self.ipaymu_port, log_level="warning", access_log=False
+        ))
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=asyncio.run, args=(self._serve(),), daemon=True)
+
+    async def _serve(self):
+        await self.smtp.start(port=self.smtp_port)
+        self._ready.set()
+        try:
+            await self._server.serve()
+        finally:
+            await self.smtp.stop()
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait(10)
+        deadline = time.monotonic() + 10
+        while not self._server.started and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if not self._server.started:
+            raise RuntimeError("fake iPaymu did not start")
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(10)
+
+
+class AppProcess:
+    """The app under uvicorn in a subprocess, on a fresh SQLite file"""
+
+    def __init__(self, args, stand_ins: StandIns, workdir: str):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, "app.log")
+        self.env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+            "DEBUG": "false",
+            "SECRET_KEY": secrets.token_urlsafe(32),
+            "LOG_LEVEL": "WARNING",
+            "RATE_LIMIT_ENABLED": "false",  # every virtual user shares 127.0.0.1
+            "BACKEND_URL": self.url,
+            "IPAYMU_API_URL": f"http://127.0.0.1:{stand_ins.ipaymu_port}",
+            "IPAYMU_VA": IPAYMU_VA,
+            "IPAYMU_API_KEY": IPAYMU_API_KEY,
+            "IPAYMU_PRODUCTION": "false",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(stand_ins.smtp_port),
+            "SMTP_STARTTLS": "false",
+            "SMTP_USER": "",
+            "SMTP_PASSWORD": "",
+        }
+        for name in ("MAIL_SERVER", "MAIL_PORT", "MAIL_USERNAME", "MAIL_PASSWORD"):
+            self.env.pop(name, None)
+        self.command = [
+            sys.executable, "-m", "uvicorn", "app.main:app",
+            "--host", "127.0.0.1", "--port", str(self.port),
+            "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+        ]
+        self._process = None
+        self._log = None
+
+    def start(self, timeout: float = 60) -> float:
+        """Start and wait for /health; returns seconds until healthy"""
+        self._log = open(self.log_path, "w")
+        started = time.perf_counter()
+        self._process = subprocess.Popen(self.command, cwd=BACKEND, env=self.env, stdout=self._log, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                break
+            try:
+                if httpx.get(f"{self.url}/health", timeout=2).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError(f"app did not become healthy, see {self.log_path}")
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.send_signal(signal.SIGINT)
+            try:
+                self._process.wait(15)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self._log is not None:
+            self._log.close()
+
+
+class LoadTest:
+    """Virtual users, flows and the per-step samples they record"""
+
+    def __init__(self, args, base_url: str):
+        self.args = args
+        self.base_url = base_url
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self.statuses = defaultdict(Counter)
+        self.flows_started = Counter()
+        self.random = random.Random(args.seed)
+        self.run_id = secrets.token_hex(3)
+        self.accounts = []
+        self.services = []
+        self._emails = 0
+        self.client = None
+
+    async def request(self, step: str, method: str, path: str, expect: int = 200, **kwargs):
+        """One timed request; returns the response, or None on an error"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError as e:
+            self.errors[step] += 1
+            self.statuses[step][type(e).__name__] += 1
+            return None
+        elapsed = time.perf_counter() - started
+        self.statuses[step][str(response.status_code)] += 1
+        if response.status_code != expect:
+            self.errors[step] += 1
+            return None
+        self.samples[step].append(elapsed)
+        return response
+
+    def new_email(self) -> str:
+        self._emails += 1
+        return f"lt-{self.run_id}-{self._emails}@example.com"
+
+    @staticmethod
+    def auth(token: str) -> dict:
+        return {"Authorization": f"Bearer {token}"}
+
+    async def think(self):
+        if self.args.think_time:
+            await asyncio.sleep(self.random.uniform(0, 2 * self.args.think_time))
+
+    async def browse(self) -> bool:
+        r = await self.request("services", "GET", "/api/services/")
+        if r is None:
+            return False
+        await self.think()
+        service = self.random.choice(self.services)
+        return await self.request("service_detail", "GET", f"/api/services/{service['id']}") is not None
+
+    async def register(self, step: str = "register"):
+        email = self.new_email()
+        r = await self.request(step, "POST", "/api/auth/register", expect=201, json={
+            "email": email, "password": PASSWORD, "full_name": "Load Test", "phone": "081200000000",
+        })
+        return (email, r.json()["access_token"]) if r is not None else None
+
+    async def checkout(self) -> bool:
+        account = await self.register()
+        if account is None:
+            return False
+        headers = self.auth(account[1])
+        await self.think()
+        if await self.request("services", "GET", "/api/services/") is None:
+            return False
+        await self.think()
+        service = self.random.choice(self.services)
+        r = await self.request("create_order", "POST", "/api/orders/", expect=201, headers=headers,
+                               json={"service_slug": service["slug"]})
+        if r is None:
+            return False
+        order = r.json()
+        await self.think()
+        r = await self.request("create_payment", "POST", "/api/payments/", expect=201, headers=headers, json={
+            "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": order["total_price"],
+        })
+        if r is None:
+            return False
+        created = time.perf_counter()
+        payment_id = r.json()["id"]
+
+        # Customer keeps the status page open until the callback lands
+        deadline = time.monotonic() + self.args.paid_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            r = await self.request("status_poll", "GET", f"/api/payments/{payment_id}", headers=headers)
+            if r is not None and r.json()["status"] == "success":
+                self.samples["paid"].append(time.perf_counter() - created)
+                return True
+        self.errors["paid"] += 1
+        return False
+
+    async def returning(self) -> bool:
+        email = self.random.choice(self.accounts)
+        r = await self.request("login", "POST", "/api/auth/login", json={"email": email, "password": PASSWORD})
+        if r is None:
+            return False
+        headers = self.auth(r.json()["access_token"])
+        await self.think()
+        if await self.request("me", "GET", "/api/users/me", headers=headers) is None:
+            return False
+        await self.think()
+        return await self.request("orders_list", "GET", "/api/orders/", headers=headers) is not None
+
+    async def setup(self):
+        """Catalog and returning users, not measured"""
+        r = await self.client.get("/api/services/")
+        r.raise_for_status()
+        self.services = [s for s in r.json() if s.get("is_active", True)]
+        for _ in range(self.args.accounts):
+            r = await self.client.post("/api/auth/register", json={
+                "email": (email := self.new_email()), "password": PASSWORD, "full_name": "Load Test Returning",
+            })
+            r.raise_for_status()
+            self.accounts.append(email)
+
+    async def virtual_user(self, deadline: float):
+        names, weights = zip(*self.args.mix.items())
+        while time.monotonic() < deadline:
+            flow = self.random.choices(names, weights)[0]
+            self.flows_started[flow] += 1
+            started = time.perf_counter()
+            if await getattr(self, flow)():
+                self.samples[f"flow:{flow}"].append(time.perf_counter() - started)
+            else:
+                self.errors[f"flow:{flow}"] += 1
+            await self.think()
+
+    async def run(self) -> float:
+        limits = httpx.Limits(max_connections=self.args.users * 2, max_keepalive_connections=self.args.users * 2)
+        async with httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.args.timeout) as client:
+            self.client = client
+            await self.setup()
+            started = time.perf_counter()
+            deadline = time.monotonic() + self.args.duration
+            # Stagger the ramp-up over the first second
+            users = [self.delayed(i / self.args.users, deadline) for i in range(self.args.users)]
+            await asyncio.gather(*users)
+            return time.perf_counter() - started
+
+    async def delayed(self, delay: float, deadline: float):
+        await asyncio.sleep(delay)
+        await self.virtual_user(deadline)
+
+
+def wait_for_mail(stand_ins: StandIns, timeout: float):
+    """Give the app's mail worker time to drain its queue into the sink"""
+    deadline = time.monotonic() + timeout
+    last, stable_since = -1, time.monotonic()
+    while time.monotonic() < deadline:
+        count = stand_ins.smtp.messages
+        if count != last:
+            last, stable_since = count, time.monotonic()
+        elif time.monotonic() - stable_since > 2:
+            break
+        time.sleep(0.2)
+
+
+def print_report(result: dict, baseline: dict = None):
+    print(f"\n{'step':<22}{'count':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    print("-" * 85)
+    for name, s in result["steps"].items():
+        print(f"{name:<22}{s['count']:>8}{s['errors']:>6}{s['rps']:>9.1f}{s['p50_ms']:>10.1f}"
+              f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    print("-" * 85)
+    print(f"emails: {result['smtp']['messages']} delivered over {result['smtp']['connections']} SMTP connection(s); "
+          f"iPaymu: {result['ipaymu']['transactions']} transactions, {result['ipaymu']['callbacks']} callbacks")
+
+    if baseline:
+        meta = baseline.get("meta", {})
+        print(f"\nvs {meta.get('commit', '?')} ({meta.get('started_at', '?')}): rps and p95 change")
+        for name, s in result["steps"].items():
+            old = baseline.get("steps", {}).get(name)
+            if not old:
+                continue
+            change = lambda new, before: f"{(new - before) / before * 100:+.0f}%" if before else "n/a"
+            print(f"   {name:<22} rps {old['rps']:>8.1f} -> {s['rps']:<8.1f} {change(s['rps'], old['rps']):>6}"
+                  f"   p95 {old['p95_ms']:>8.1f} -> {s['p95_ms']:<8.1f} {change(s['p95_ms'], old['p95_ms']):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load (flows in progress finish)")
+    parser.add_argument("--mix", type=parse_mix, default="browse=60,checkout=25,returning=15", help="flow weights")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--accounts", type=int, default=10, help="pre-registered users for the returning flow")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause between steps, seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="status poll interval, seconds")
+    parser.add_argument("--paid-timeout", type=float, default=30, help="give up polling after this many seconds")
+    parser.add_argument("--timeout", type=float, default=30, help="per-request timeout, seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="result file (default: loadtest/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    add_arguments(parser.add_argument_group("iPaymu simulator"))
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print(f"LOAD TEST: {args.users} users, {args.duration:.0f}s, mix {args.mix}")
+    print("="*60)
+
+    workdir = tempfile.mkdtemp(prefix="neointegra-loadtest-")
+    stand_ins = StandIns(faults_from_args(args), args.seed)
+    stand_ins.start()
+    app = AppProcess(args, stand_ins, workdir)
+    started_at = datetime.now().astimezone()
+    try:
+        startup = app.start()
+        print(f"   app healthy after {startup:.1f}s ({app.url}, {workdir})")
+        load = LoadTest(args, app.url)
+        elapsed = asyncio.run(load.run())
+        wait_for_mail(stand_ins, timeout=15)
+        health = httpx.get(f"{app.url}/health", timeout=10).json()
+    finally:
+        app.stop()
+        stand_ins.stop()
+
+    names = sorted(set(load.samples) | set(load.errors), key=lambda n: (n.startswith("flow:"), n == "paid", n))
+    steps = {name: summarize(load.samples[name], load.errors[name], elapsed) for name in names}
+    if stand_ins.ipaymu.transactions:
+        steps["callback"] = summarize(stand_ins.ipaymu.callback_seconds, stand_ins.ipaymu.counters["callback_errors"], elapsed)
+    result = {
+        "meta": {
+            **git_info(),
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {**vars(args), "mix": args.mix},
+        },
+        "elapsed_s": round(elapsed, 2),
+        "startup_s": round(startup, 2),
+        "flows_started": dict(load.flows_started),
+        "steps": steps,
+        "status_codes": {name: dict(codes) for name, codes in load.statuses.items()},
+        "ipaymu": stand_ins.ipaymu.stats(),
+        "smtp": stand_ins.smtp.stats(),
+        "app_health": health,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{started_at:%Y%m%d-%H%M%S}-{result['meta']['commit']}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults: {output}")
+
+    errors = sum(s["errors"] for s in steps.values())
+    print("\n" + "="*60)
+    print("✅ LOAD TEST DONE" if not errors else f"⚠️ LOAD TEST DONE WITH {errors} ERRORS")
+    print("="*60)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Local SMTP sink for load tests
+
+Plaintext asyncio SMTP server that accepts every message and only counts
+it (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT; no STARTTLS or AUTH).
+Point the app at it with SMTP_HOST/SMTP_PORT, SMTP_STARTTLS=false and an
+empty SMTP_USER.
+
+Jalankan sendiri: python -m loadtest.smtp_sink --port 8925
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+
+class SMTPSink:
+    """Accepts and counts messages; nothing is stored or relayed"""
+
+    def __init__(self):
+        self.connections = 0
+        self.messages = 0
+        self.bytes = 0
+        self.recipients = Counter()  # per recipient domain
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start listening; returns the bound port"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        recipients = []
+
+        async def reply(line: str):
+            writer.write(line.encode() + b"\r\n")
+            await writer.drain()
+
+        try:
+            await reply("220 loadtest-sink ESMTP")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line[:4].decode("ascii", "replace").upper()
+                if command == "EHLO":
+                    await reply("250-loadtest-sink\r\n250-8BITMIME\r\n250 SIZE 26214400")
+                elif command == "HELO":
+                    await reply("250 loadtest-sink")
+                elif command == "MAIL":
+                    recipients = []
+                    await reply("250 OK")
+                elif command == "RCPT":
+                    recipients.append(line.decode("ascii", "replace").rpartition("@")[2].strip(" >\r\n").lower())
+                    await reply("250 OK")
+                elif command == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    size = 0
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk == b".\r\n":
+                            break
+                        size += len(chunk)
+                    self.messages += 1
+                    self.bytes += size
+                    self.recipients.update(recipients)
+                    await reply("250 OK queued")
+                elif command == "RSET":
+                    recipients = []
+                    await reply("250 OK")
+                elif command == "NOOP":
+                    await reply("250 OK")
+                elif command == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "per_domain": dict(self.recipients),
+        }
+
+
+async def _serve(port: int):
+    sink = SMTPSink()
+    port = await sink.start(port=port)
+    print(f"SMTP sink on 127.0.0.1:{port}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"   {sink.stats()}")
+    finally:
+        await sink.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8925)
+    try:
+        asyncio.run(_serve(parser.parse_args().port))
+    except KeyboardInterrupt:
+        pass
@@ -15,7 +15,7 @@ call venv_fixed\Scripts\activate.bat
 echo.
 echo Pilih mode pengiriman:
 echo 1. Manual Reminder (kirim sekarang)
-echo 2. Scheduled Reminder (cek otomatis H-7, H-3, H-1, H-Day)
+echo 2. Scheduled Reminder semua subscription (H-7, H-3, H-1, H-Day)
 echo 3. Exit
 echo.
 
@@ -28,7 +28,7 @@ if "%choice%"=="1" (
 ) else if "%choice%"=="2" (
     echo.
     echo Menjalankan scheduled reminder...
-    python send_scheduled_reminder_rsppn.py
+    python -m app.reminders
 ) else if "%choice%"=="3" (
     echo.
     echo Keluar...
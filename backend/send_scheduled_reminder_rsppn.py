@@ -5,6 +5,9 @@ Akan mengirim reminder pada:
 - H-3 (3 hari sebelum jatuh tempo)  
 - H-1 (1 hari sebelum jatuh tempo)
 - H-Day (hari jatuh tempo)
+
+Catatan: reminder untuk semua subscription aktif sekarang dijalankan otomatis
+oleh aplikasi (app/reminders.py). Manual: python -m app.reminders
 """
 
 import os
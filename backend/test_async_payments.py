@@ -0,0 +1,195 @@
+"""
+Test: asynchronous payment creation (POST /payments/ with 202 Accepted)
+
+1. "Prefer: respond-async" answers 202 with status "processing" without
+   waiting for a slow iPaymu; the VA number shows up on GET /payments/{id}
+   and the SSE stream once the background job is done
+2. Without the header the call stays synchronous (201 with the VA number)
+3. A gateway rejection marks the payment "failed"; gateway errors are
+   retried and the payment still gets created once iPaymu recovers; a job
+   that keeps crashing is marked "failed" after its last attempt; a read
+   timeout (iPaymu may have created the VA) is not retried
+4. Payments left "processing" by a restart are picked up on startup
+
+Runs in-process against a temporary SQLite file, no server or network needed.
+Jalankan: python test_async_payments.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("async-pay", IPAYMU_VA="0000007700000001", IPAYMU_API_KEY="simulator-api-key")
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.config import settings
+from app.database import SessionLocal
+from app.events import payment_events
+from app.ipaymu import ipaymu_client
+from app.models import EmailOutbox, Payment
+from app import payment_jobs as payment_jobs_module
+from app.payment_jobs import payment_jobs, payment_jobs_total
+from loadtest.fake_ipaymu import FakeIpaymu
+
+
+# unpaid_rate=1: no automatic callbacks, payments stay "pending" once created
+simulator = FakeIpaymu(va=settings.IPAYMU_VA, api_key=settings.IPAYMU_API_KEY, seed=3, unpaid_rate=1.0)
+
+
+def connect_simulator():
+    """Route the app's pooled iPaymu client to the simulator (in-process)"""
+    ipaymu_client._client = httpx.AsyncClient(
+        base_url="http://fake-ipaymu", transport=httpx.ASGITransport(app=simulator.app),
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def payment_row(payment_id: int) -> Payment:
+    db = SessionLocal()
+    try:
+        return db.get(Payment, payment_id)
+    finally:
+        db.close()
+
+
+def count_emails(subject_like: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(EmailOutbox).filter(EmailOutbox.subject.like(subject_like)).count()
+    finally:
+        db.close()
+
+
+banner("ASYNC PAYMENT CREATION TEST")
+
+settings.PAYMENT_JOB_RETRY_SECONDS = 0.2
+settings.PAYMENT_JOB_MAX_ATTEMPTS = 3
+settings.IPAYMU_BREAKER_FAILURE_THRESHOLD = 100
+
+with TestClient(app) as client:
+    connect_simulator()
+    r = client.post("/api/auth/register", json={"email": "async@example.com", "password": "password123", "full_name": "Async"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    def checkout(respond_async: bool = True) -> httpx.Response:
+        order = client.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers).json()
+        extra = {"Prefer": "respond-async"} if respond_async else {}
+        return client.post("/api/payments/", headers={**headers, **extra}, json={
+            "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": order["total_price"],
+        })
+
+    # 1. 202 without waiting for the gateway
+    print("\n1. Prefer: respond-async")
+    simulator.configure(latency=(1.0, 1.0))
+    started = time.perf_counter()
+    r = checkout()
+    elapsed = time.perf_counter() - started
+    payment = r.json()
+    check(f"202 in {elapsed * 1000:.0f} ms while iPaymu takes 1 s", r.status_code == 202 and elapsed < 0.8)
+    check("status processing, no VA yet", payment["status"] == "processing" and payment["va_number"] is None)
+    check("Location and Preference-Applied headers",
+          r.headers.get("location") == f"/api/payments/{payment['id']}" and r.headers.get("preference-applied") == "respond-async")
+
+    async def next_event(payment_id: int) -> dict:
+        queue = payment_events.subscribe(f"payment:{payment_id}")
+        try:
+            return await asyncio.wait_for(queue.get(), timeout=5)
+        finally:
+            payment_events.unsubscribe(f"payment:{payment_id}", queue)
+
+    event = client.portal.call(next_event, payment["id"])
+    check("push event carries the VA number", event["status"] == "pending" and (event["va_number"] or "").startswith("8808"))
+    resource = client.get(f"/api/payments/{payment['id']}", headers=headers).json()
+    check("GET /payments/{id} shows the VA number", resource["status"] == "pending" and resource["va_number"] == event["va_number"])
+    check("pending email queued", wait_for(lambda: count_emails("Complete Your Payment%") == 1))
+    check("check-status leaves a processing payment alone",
+          client.post(f"/api/payments/{payment['id']}/check-status", headers=headers).status_code == 200)
+
+    # 2. Synchronous by default
+    print("\n2. Without the header")
+    simulator.configure(latency=(0.0, 0.0))
+    r = checkout(respond_async=False)
+    check("201 with the VA number", r.status_code == 201 and (r.json()["va_number"] or "").startswith("8808"))
+
+    # 3. Failures and retries
+    print("\n3. Gateway errors")
+    simulator.configure(error_rate=1.0, error_status=400)
+    payment = checkout().json()
+    check("rejected by iPaymu -> failed", wait_for(lambda: payment_row(payment["id"]).status == "failed"))
+
+    simulator.configure(error_status=502)
+    retried = payment_jobs.outcomes.get("retry", 0)
+    payment = checkout().json()
+    check("gateway error is retried", wait_for(lambda: payment_jobs.outcomes.get("retry", 0) > retried))
+    check("still processing meanwhile", payment_row(payment["id"]).status == "processing")
+    simulator.configure(error_rate=0.0)
+    check("created once iPaymu recovers", wait_for(lambda: payment_row(payment["id"]).status == "pending"))
+
+    simulator.configure(error_rate=1.0)
+    payment = checkout().json()
+    check(f"failed after {settings.PAYMENT_JOB_MAX_ATTEMPTS} attempts",
+          wait_for(lambda: payment_row(payment["id"]).status == "failed"))
+    simulator.configure(error_rate=0.0)
+
+    async def crash(payment_id: int, final_attempt: bool = False) -> str:
+        raise RuntimeError("job crashed")
+
+    run_payment_job = payment_jobs_module.run_payment_job
+    payment_jobs_module.run_payment_job = crash
+    try:
+        payment = checkout().json()
+        event = client.portal.call(next_event, payment["id"])
+    finally:
+        payment_jobs_module.run_payment_job = run_payment_job
+    check("job crashing on every attempt -> failed, pushed to the stream",
+          event["status"] == "failed" and payment_row(payment["id"]).status == "failed")
+    check(f"payment_jobs_total outcomes are created/failed/retried ({sorted(payment_jobs_total.snapshot())})",
+          set(payment_jobs_total.snapshot()) <= {("created",), ("failed",), ("retried",)})
+    creates = []
+
+    def read_timeout(request: httpx.Request) -> httpx.Response:
+        creates.append(request.url.path)
+        raise httpx.ReadTimeout("no response", request=request)
+
+    ipaymu_client._client = httpx.AsyncClient(base_url="http://fake-ipaymu", transport=httpx.MockTransport(read_timeout))
+    try:
+        payment = checkout().json()
+        event = client.portal.call(next_event, payment["id"])
+    finally:
+        connect_simulator()
+    check(f"read timeout: one create call, no retry ({creates})",
+          event["status"] == "failed" and creates == ["/payment/direct"] and payment_row(payment["id"]).status == "failed")
+    check("/health reports the worker", client.get("/health").json()["payment_jobs"]["outcomes"].get("created") == 2)
+
+    # Leave one job behind: its gateway call is still running when the app stops
+    simulator.configure(latency=(5.0, 5.0))
+    leftover = checkout().json()
+
+check("left processing by the shutdown", payment_row(leftover["id"]).status == "processing")
+
+# 4. Restart
+print("\n4. Restart")
+simulator.configure(latency=(0.0, 0.0))
+with TestClient(app) as client:
+    connect_simulator()
+    check("picked up on startup", wait_for(lambda: payment_row(leftover["id"]).status == "pending"))
+    print(f"   jobs: {payment_jobs.stats()}")
+    client.portal.call(simulator.close)
+
+finish("ASYNC PAYMENT CREATION TEST")
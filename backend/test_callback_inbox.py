@@ -0,0 +1,151 @@
+"""
+Test: callback inbox side effects are part of the entry's transaction
+
+1. The entry's commit fails once ("database is locked"): nothing of it is
+   kept - no confirmation email, payment still pending, subscription not
+   extended - and the entry is retried
+2. The retry applies it once: one confirmation email, the renewal extends
+   the subscription by exactly 365 days
+3. Another pass over the inbox changes nothing
+4. Two paths holding the same pending payment (e.g. the reconciler's batch
+   and a status check) both apply "paid": only the first one changes the
+   row, queues the email and extends the subscription
+
+Runs against a temporary SQLite file, no server or network needed.
+Jalankan: python test_callback_inbox.py
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("inbox")
+
+from sqlalchemy import event, select
+
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, init_db
+from app.callback_inbox import process_pending_callbacks
+from app.payment_status import apply_ipaymu_status, order_graph_options
+from app.models import EmailOutbox, Order, Payment, PaymentCallbackInbox, Subscription, User
+
+# Set to make the next UPDATE of an inbox row fail like a busy SQLite writer
+fail_next_inbox_update = False
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def locked_inbox(conn, cursor, statement, parameters, context, executemany):
+    global fail_next_inbox_update
+    if fail_next_inbox_update and statement.startswith("UPDATE payment_callback_inbox"):
+        fail_next_inbox_update = False
+        raise sqlite3.OperationalError("database is locked")
+
+
+async def process() -> dict:
+    try:
+        return await process_pending_callbacks()
+    finally:
+        await async_engine.dispose()
+
+
+def state() -> tuple:
+    """(payment status, subscription end_date, confirmation emails, inbox entry)"""
+    db = SessionLocal()
+    try:
+        emails = db.query(EmailOutbox).filter(EmailOutbox.subject.like("Payment Received%")).count()
+        entry = db.query(PaymentCallbackInbox).one()
+        return db.get(Payment, payment_id).status, db.get(Subscription, subscription_id).end_date, emails, (entry.status, entry.attempts)
+    finally:
+        db.close()
+
+
+banner("CALLBACK INBOX TEST")
+
+init_db()
+db = SessionLocal()
+user = User(email="inbox@example.com", full_name="Inbox", hashed_password="x", is_active=True)
+db.add(user)
+db.flush()
+end_date = datetime(2026, 6, 1)
+subscription = Subscription(user_id=user.id, package_name="Website Service", package_type="yearly",
+                            start_date=end_date - timedelta(days=365), end_date=end_date, price=100000)
+db.add(subscription)
+db.flush()
+order = Order(user_id=user.id, order_number="ORD-INBOX-1", service_name="Renewal: Website Service",
+              unit_price=100000, total_price=100000, subscription_id=subscription.id)
+db.add(order)
+db.flush()
+payment = Payment(order_id=order.id, payment_method="va", amount=100000, status="pending", ipaymu_transaction_id="T-INBOX-1")
+db.add(payment)
+db.add(PaymentCallbackInbox(trx_id="T-INBOX-1", status_code="1", payload='{"trx_id": "T-INBOX-1", "status_code": "1"}'))
+db.commit()
+payment_id, subscription_id = payment.id, subscription.id
+db.close()
+
+# 1. Commit fails
+print("\n1. Entry commit fails")
+fail_next_inbox_update = True
+summary = asyncio.run(process())
+status, end, emails, entry = state()
+check(f"entry retried ({summary})", summary["retried"] == 1 and summary["processed"] == 0 and entry == ("pending", 1))
+check("no confirmation email queued", emails == 0)
+check("payment still pending, subscription not extended", status == "pending" and end == end_date)
+
+# 2. Retry
+print("\n2. Retry")
+summary = asyncio.run(process())
+status, end, emails, entry = state()
+check(f"entry processed ({summary})", summary["processed"] == 1 and entry[0] == "processed")
+check("exactly one confirmation email", emails == 1)
+check("paid, subscription extended by 365 days once", status == "success" and end == end_date + timedelta(days=365))
+
+# 3. Nothing left
+print("\n3. Another pass")
+summary = asyncio.run(process())
+check("nothing pending, nothing changed", summary["processed"] == summary["retried"] == 0 and state()[1:3] == (end_date + timedelta(days=365), 1))
+
+# 4. Concurrent transitions
+print("\n4. Two paths, one stale payment")
+db = SessionLocal()
+order = Order(user_id=db.query(User.id).scalar(), order_number="ORD-INBOX-2", service_name="Renewal: Website Service",
+              unit_price=100000, total_price=100000, subscription_id=subscription_id)
+db.add(order)
+db.flush()
+payment = Payment(order_id=order.id, payment_method="va", amount=100000, status="pending", ipaymu_transaction_id="T-INBOX-2")
+db.add(payment)
+db.commit()
+race_payment_id = payment.id
+db.close()
+extended_once = end_date + timedelta(days=2 * 365)
+
+
+async def race() -> tuple:
+    """Both sessions load the payment while it is pending, then apply "1" one after the other"""
+    try:
+        async with AsyncSessionLocal() as first, AsyncSessionLocal() as second:
+            query = select(Payment).where(Payment.id == race_payment_id).options(order_graph_options())
+            stale = [(await first.scalars(query)).unique().one(), (await second.scalars(query)).unique().one()]
+            results = []
+            for db, payment in zip((first, second), stale):
+                results.append(await apply_ipaymu_status(db, payment, "1", source="Test"))
+                await db.commit()
+            return results, [p.status for p in stale], [p.paid_at for p in stale]
+    finally:
+        await async_engine.dispose()
+
+
+results, statuses, paid_at = asyncio.run(race())
+db = SessionLocal()
+emails = db.query(EmailOutbox).filter(EmailOutbox.subject == "Payment Received - Order #ORD-INBOX-2 - NeoIntegra Tech").count()
+stored_paid_at = db.get(Payment, race_payment_id).paid_at
+end = db.get(Subscription, subscription_id).end_date
+db.close()
+check(f"only the first path changes the payment ({results})", results == [True, False])
+check("the second path sees the winner's row", statuses == ["success", "success"] and paid_at[1] == stored_paid_at == paid_at[0])
+check("one confirmation email, subscription extended once", emails == 1 and end == extended_once)
+
+finish("CALLBACK INBOX TEST")
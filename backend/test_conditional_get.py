@@ -0,0 +1,171 @@
+"""
+Test: conditional GET (weak ETag / If-None-Match) on user-scoped resources
+
+1. Single rows (/orders/{id}, /orders/number/{n}, /payments/{id},
+   /subscriptions/{id}): weak ETag + "private, no-cache", 304 while the row
+   is unchanged, a new ETag after a write
+2. Lists (/payments/order/{id}, /subscriptions/my-subscriptions,
+   /subscriptions/expiring-soon): 304 until a row is added or changed;
+   every page/filter has its own ETag
+3. Another user's ETag never turns a 404 into a 304
+4. The public catalog (/services/) compares weakly too: a W/ validator
+   (nginx weakens ETags when it gzips) still gets the 304
+
+Runs in-process against a temporary SQLite file with iPaymu faked.
+Jalankan: python test_conditional_get.py
+"""
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("etag")
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.database import SessionLocal
+from app.ipaymu import ipaymu_client
+from app.models import Subscription, User
+
+
+# Fake iPaymu: every transaction exists and reports the status set in IPAYMU_STATUS
+transaction_ids = itertools.count(7000)
+IPAYMU_STATUS = {}
+
+
+def ipaymu_handler(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    if request.url.path.endswith("/payment/direct"):
+        trx_id = str(next(transaction_ids))
+        IPAYMU_STATUS[trx_id] = "0"
+        return httpx.Response(200, json={"Status": 200, "Success": True, "Data": {
+            "TransactionId": trx_id, "SessionID": f"s{trx_id}", "Va": f"8888{trx_id}"
+        }})
+    if request.url.path.endswith("/transaction"):
+        return httpx.Response(200, json={"Status": 200, "Success": True, "Data": {
+            "StatusCode": IPAYMU_STATUS.get(str(body["transactionId"]), "0")
+        }})
+    return httpx.Response(404)
+
+
+banner("CONDITIONAL GET TEST")
+
+with TestClient(app) as c:
+    ipaymu_client._client = httpx.AsyncClient(base_url="http://fake-ipaymu", transport=httpx.MockTransport(ipaymu_handler))
+
+    def register(email: str) -> dict:
+        r = c.post("/api/auth/register", json={"email": email, "password": "password123", "full_name": "ETag"})
+        return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    headers = register("etag@example.com")
+    other = register("other@example.com")
+
+    def checkout() -> tuple:
+        order = c.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers).json()
+        payment = c.post("/api/payments/", headers=headers, json={
+            "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": order["total_price"],
+        }).json()
+        return order, payment
+
+    def revalidate(url: str, etag: str, auth: dict = None) -> httpx.Response:
+        return c.get(url, headers={**(auth or headers), "If-None-Match": etag})
+
+    order, payment = checkout()
+
+    # 1. Single rows
+    print("\n1. Single rows")
+    r = c.get(f"/api/orders/{order['id']}", headers=headers)
+    etag = r.headers.get("etag", "")
+    check(f"weak ETag ({etag})", r.status_code == 200 and etag.startswith('W/"order-'))
+    check("Cache-Control: private, no-cache", r.headers.get("cache-control") == "private, no-cache")
+    r = revalidate(f"/api/orders/{order['id']}", etag)
+    check("304 with the current ETag, empty body", r.status_code == 304 and r.content == b"" and r.headers.get("etag") == etag)
+    check("strong form and tag lists match too (weak comparison)",
+          revalidate(f"/api/orders/{order['id']}", etag.removeprefix("W/")).status_code == 304
+          and revalidate(f"/api/orders/{order['id']}", f'W/"stale", {etag}').status_code == 304)
+    check("stale ETag gets the full 200", revalidate(f"/api/orders/{order['id']}", 'W/"order-stale"').status_code == 200)
+    check("/orders/number/{n} shares the order's ETag",
+          revalidate(f"/api/orders/number/{order['order_number']}", etag).status_code == 304)
+
+    payment_etag = c.get(f"/api/payments/{payment['id']}", headers=headers).headers["etag"]
+    check("payment 304 while unchanged", revalidate(f"/api/payments/{payment['id']}", payment_etag).status_code == 304)
+
+    # Paid: payment and order rows are written, both ETags change
+    time.sleep(0.01)
+    IPAYMU_STATUS[max(IPAYMU_STATUS)] = "1"
+    c.post(f"/api/payments/{payment['id']}/check-status", headers=headers)
+    r = revalidate(f"/api/payments/{payment['id']}", payment_etag)
+    check("payment 200 with a new ETag after it was paid",
+          r.status_code == 200 and r.json()["status"] == "success" and r.headers["etag"] != payment_etag)
+    r = revalidate(f"/api/orders/{order['id']}", etag)
+    check("order 200 after it was paid", r.status_code == 200 and r.json()["status"] == "paid")
+
+    # 2. Lists
+    print("\n2. Lists")
+    url = f"/api/payments/order/{order['id']}"
+    r = c.get(url, headers=headers)
+    list_etag = r.headers["etag"]
+    check("order payments 304 while unchanged", revalidate(url, list_etag).status_code == 304)
+    check("another page has its own ETag", c.get(f"{url}?limit=1", headers=headers).headers["etag"] != list_etag)
+    c.post("/api/payments/", headers=headers, json={
+        "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": order["total_price"],
+    })
+    r = revalidate(url, list_etag)
+    check("new payment -> 200 with both payments", r.status_code == 200 and len(r.json()) == 2)
+
+    db = SessionLocal()
+    user = db.query(User).filter(User.email == "etag@example.com").first()
+    subscription = Subscription(
+        user_id=user.id, package_name="Website Service", package_type="yearly",
+        start_date=datetime.utcnow(), end_date=datetime.utcnow() + timedelta(days=10), price=10000
+    )
+    db.add(subscription)
+    db.commit()
+    subscription_id = subscription.id
+    db.close()
+
+    subs_etag = c.get("/api/subscriptions/my-subscriptions", headers=headers).headers["etag"]
+    expiring_etag = c.get("/api/subscriptions/expiring-soon", headers=headers).headers["etag"]
+    one_etag = c.get(f"/api/subscriptions/{subscription_id}", headers=headers).headers["etag"]
+    check("subscriptions 304 while unchanged",
+          revalidate("/api/subscriptions/my-subscriptions", subs_etag).status_code == 304
+          and revalidate("/api/subscriptions/expiring-soon", expiring_etag).status_code == 304
+          and revalidate(f"/api/subscriptions/{subscription_id}", one_etag).status_code == 304)
+
+    time.sleep(0.01)
+    db = SessionLocal()
+    db.get(Subscription, subscription_id).end_date = datetime.utcnow() + timedelta(days=400)
+    db.commit()
+    db.close()
+    r = revalidate("/api/subscriptions/expiring-soon", expiring_etag)
+    check("renewed: leaves the expiring list (200, empty)", r.status_code == 200 and r.json() == [])
+    check("renewed: list and row get new ETags",
+          revalidate("/api/subscriptions/my-subscriptions", subs_etag).status_code == 200
+          and revalidate(f"/api/subscriptions/{subscription_id}", one_etag).status_code == 200)
+
+    # 3. Ownership
+    print("\n3. Other users")
+    check("another user's ETag: 404, not 304",
+          revalidate(f"/api/orders/{order['id']}", etag, auth=other).status_code == 404
+          and revalidate(f"/api/payments/{payment['id']}", payment_etag, auth=other).status_code == 404
+          and revalidate(url, list_etag, auth=other).status_code == 404)
+
+    # 4. Catalog
+    print("\n4. Service catalog")
+    catalog_etag = c.get("/api/services/").headers.get("etag", "")
+    check(f"catalog ETag ({catalog_etag})", catalog_etag.startswith('"'))
+    check("304 with the ETag, with its W/ form and in a list",
+          revalidate("/api/services/", catalog_etag).status_code == 304
+          and revalidate("/api/services/", f"W/{catalog_etag}").status_code == 304
+          and revalidate("/api/services/?category=website", f'W/"stale", W/{catalog_etag}').status_code == 304)
+    check("stale ETag gets the full 200", revalidate("/api/services/", '"catalog-stale"').status_code == 200)
+
+finish("CONDITIONAL GET TEST")
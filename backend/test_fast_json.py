@@ -0,0 +1,108 @@
+"""
+Test: fast JSON response path (ORJSONResponse default + app/serialization.py)
+
+1. The precompiled serializers write the same bytes as FastAPI's
+   response_model + JSONResponse path for orders, payments and
+   subscriptions (None, ints in float fields, naive/UTC/offset datetimes,
+   non-ASCII text)
+2. Endpoints served by them keep their headers: X-Total-Count and
+   X-Next-Cursor on /orders/, ETag on single rows
+3. Other JSON endpoints go through ORJSONResponse
+
+Runs in-process against a temporary SQLite file, no server or network needed.
+Jalankan: python test_fast_json.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("json")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.testclient import TestClient
+from fastapi.utils import create_model_field
+
+from app.main import app
+from app.models import Order, Payment, Subscription
+from app.schemas import OrderResponse, PaymentResponse, SubscriptionResponse
+from app.serialization import (order_json, orders_json, payment_json, payments_json,
+                               subscription_json, subscriptions_json)
+
+
+def fastapi_body(model, content, many: bool) -> bytes:
+    """Body FastAPI would send for `content` with response_model=model"""
+    field = create_model_field(name="Response", type_=List[model] if many else model, mode="serialization")
+    return JSONResponse(asyncio.run(serialize_response(field=field, response_content=content))).body
+
+
+banner("FAST JSON RESPONSE TEST")
+
+# 1. Same bytes as the Pydantic path
+print("\n1. Serializers vs response_model + JSONResponse")
+naive = datetime(2026, 1, 1, 8, 0, 0, 123456)
+stamps = [naive, naive.replace(microsecond=0), naive.replace(tzinfo=timezone.utc),
+          naive.replace(tzinfo=timezone(timedelta(hours=7)))]
+
+orders = [
+    Order(id=i + 1, user_id=1, order_number=f"ORD-{i}", service_name="Website “Company” ✓", quantity=1,
+          unit_price=2500000 if i % 2 else 2500000.5, total_price=2500000.0, status="pending",
+          notes=None if i % 2 else "Catatan\n\"kutip\"", created_at=stamps[i % len(stamps)])
+    for i in range(8)
+]
+payments = [
+    Payment(id=i + 1, order_id=1, payment_method="va", payment_channel=None if i % 2 else "bca", amount=150000,
+            status="pending", va_number="8808123" if i % 2 else None, expired_at=None if i % 2 else stamps[i % 4],
+            created_at=stamps[(i + 1) % 4])
+    for i in range(4)
+]
+subscriptions = [
+    Subscription(id=i + 1, user_id=1, package_name="Website Service", package_type="yearly",
+                 start_date=stamps[i % 4], end_date=stamps[(i + 2) % 4], price=1200000, renewal_price=None if i % 2 else 99.9,
+                 is_active=bool(i % 2), status="active", features='["SSL", "Domain"]', created_at=stamps[(i + 3) % 4])
+    for i in range(4)
+]
+
+for name, model, rows, one, many in (
+    ("orders", OrderResponse, orders, order_json, orders_json),
+    ("payments", PaymentResponse, payments, payment_json, payments_json),
+    ("subscriptions", SubscriptionResponse, subscriptions, subscription_json, subscriptions_json),
+):
+    check(f"{name}: direct path used", one.direct and many.direct)
+    check(f"{name}: list bytes identical", many.dump_json(rows) == fastapi_body(model, rows, many=True))
+    check(f"{name}: single-row bytes identical",
+          all(one.dump_json(row) == fastapi_body(model, row, many=False) for row in rows))
+check("empty list", orders_json.dump_json([]) == b"[]")
+
+# 2. Headers survive the Response returned by the endpoints
+print("\n2. Endpoints")
+with TestClient(app) as c:
+    r = c.post("/api/auth/register", json={"email": "json@example.com", "password": "password123", "full_name": "JSON"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    created = [c.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers).json() for _ in range(3)]
+
+    r = c.get("/api/orders/?limit=2", headers=headers)
+    check("/orders/ first page: 2 rows, X-Total-Count and X-Next-Cursor",
+          r.status_code == 200 and len(r.json()) == 2
+          and r.headers.get("x-total-count") == "3" and "x-next-cursor" in r.headers)
+    check("application/json", r.headers.get("content-type") == "application/json")
+    r = c.get(f"/api/orders/?limit=2&cursor={r.headers['x-next-cursor']}", headers=headers)
+    check("/orders/ last page: 1 row, no cursor", len(r.json()) == 1 and "x-next-cursor" not in r.headers)
+
+    r = c.get(f"/api/orders/{created[0]['id']}", headers=headers)
+    check("/orders/{id}: same document as on create, ETag kept",
+          r.json() == created[0] and r.headers.get("etag", "").startswith('W/"order-'))
+    check("/orders/{id} of another id still 404", c.get("/api/orders/999999", headers=headers).status_code == 404)
+
+    # 3. Default response class
+    print("\n3. ORJSONResponse default")
+    r = c.get("/api/auth/me", headers=headers)
+    check("/auth/me is compact JSON", r.status_code == 200 and b": " not in r.content and r.json()["email"] == "json@example.com")
+
+finish("FAST JSON RESPONSE TEST")
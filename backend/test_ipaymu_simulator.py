@@ -0,0 +1,233 @@
+"""
+Test: checkout against the local iPaymu simulator (loadtest/fake_ipaymu.py)
+
+1. Signatures: the app's signed requests pass, a wrong key or a changed
+   body is rejected with 401
+2. The VA number is read from Va, VaNumber or PaymentNo
+3. Duplicate and out-of-order callbacks: every payment ends "success"
+   exactly once (never a second confirmation email)
+4. Faults: gateway errors leave no payment behind, latency shows up in
+   checkout time, unpaid transactions stay pending until a manual callback
+5. Circuit breaker and bulkhead: consecutive 5xx/timeouts open the circuit
+   (fast 503, no gateway call), one probe closes it again; calls beyond the
+   bulkhead get 503 instead of waiting
+
+Runs in-process against a temporary SQLite file, no server or network needed.
+Jalankan: python test_ipaymu_simulator.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("ipaymu", IPAYMU_VA="0000007700000001", IPAYMU_API_KEY="simulator-api-key")
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.config import settings
+from app.database import SessionLocal
+from app.ipaymu import CircuitBreaker, generate_ipaymu_signature, ipaymu_client
+from app.models import EmailOutbox, Payment
+from loadtest.fake_ipaymu import FakeIpaymu
+
+
+simulator = FakeIpaymu(va=settings.IPAYMU_VA, api_key=settings.IPAYMU_API_KEY, pay_after=(0.05, 0.2), seed=7,
+                       callback_transport=httpx.ASGITransport(app=app))
+
+
+def connect_simulator(transport: httpx.AsyncBaseTransport = None):
+    """Route the app's pooled iPaymu client to the simulator (in-process)"""
+    ipaymu_client._client = httpx.AsyncClient(
+        base_url="http://fake-ipaymu", transport=transport or httpx.ASGITransport(app=simulator.app),
+        headers={"Content-Type": "application/json", "Accept": "application/json"},
+    )
+
+
+def read_timeout(request: httpx.Request) -> httpx.Response:
+    # ASGITransport ignores client timeouts; raise what a slow gateway would cause
+    raise httpx.ReadTimeout("simulated read timeout", request=request)
+
+
+def wait_for(condition, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def payment_statuses(ids: list) -> list:
+    db = SessionLocal()
+    try:
+        return [p.status for p in db.query(Payment).filter(Payment.id.in_(ids)).all()]
+    finally:
+        db.close()
+
+
+def count_emails(subject_like: str) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(EmailOutbox).filter(EmailOutbox.subject.like(subject_like)).count()
+    finally:
+        db.close()
+
+
+banner("IPAYMU SIMULATOR TEST")
+
+with TestClient(app) as client:
+    connect_simulator()
+    r = client.post("/api/auth/register", json={"email": "sim@example.com", "password": "password123", "full_name": "Sim"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    def checkout() -> httpx.Response:
+        order = client.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers).json()
+        return client.post("/api/payments/", headers=headers, json={
+            "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": order["total_price"],
+        })
+
+    # 1. Signatures
+    print("\n1. Signatures")
+    body = {"transactionId": "1"}
+    signed = client.portal.call(ipaymu_client.post, "/transaction", body)
+    check("app's signed request accepted", signed.status_code == 200)
+    sim = TestClient(simulator.app)
+    raw = json.dumps(body, separators=(',', ':'))
+    valid = generate_ipaymu_signature(body)
+    bad_key = sim.post("/transaction", content=raw, headers={"va": settings.IPAYMU_VA, "signature": "0" * 64, "timestamp": "x"})
+    tampered = sim.post("/transaction", content=raw.replace("1", "2"), headers={"va": settings.IPAYMU_VA, "signature": valid, "timestamp": "x"})
+    wrong_va = sim.post("/transaction", content=raw, headers={"va": "1", "signature": valid, "timestamp": "x"})
+    check("wrong signature, changed body and wrong VA get 401",
+          [bad_key.status_code, tampered.status_code, wrong_va.status_code] == [401, 401, 401])
+    check("rejections counted", simulator.stats()["signature_failures"] == 3)
+
+    # 2. VA field variants
+    print("\n2. VA number fields")
+    for field in ("Va", "VaNumber", "PaymentNo"):
+        simulator.configure(va_field=field, unpaid_rate=1.0)
+        r = checkout()
+        check(f"VA read from {field}", r.status_code == 201 and (r.json().get("va_number") or "").startswith("8808"))
+
+    # 3. Duplicate and out-of-order callbacks
+    print("\n3. Duplicate and out-of-order callbacks")
+    simulator.configure(va_field="Va", unpaid_rate=0.0, duplicate_rate=1.0, out_of_order_rate=1.0)
+    ids = [checkout().json()["id"] for _ in range(10)]
+    check("every payment success", wait_for(lambda: payment_statuses(ids) == ["success"] * 10))
+    check("duplicate and stale callbacks delivered",
+          wait_for(lambda: simulator.stats()["callbacks"] == 30) and simulator.stats()["duplicate_callbacks"] == 10)
+    time.sleep(0.5)  # let the inbox apply the stale "pending" callbacks too
+    check("stale pending does not undo success", payment_statuses(ids) == ["success"] * 10)
+    # At most one: an outbox insert can still lose a SQLite write race under this burst
+    wait_for(lambda: count_emails("Payment Received%") == 10, timeout=5)
+    check("no second confirmation email for duplicates", 0 < count_emails("Payment Received%") <= 10)
+
+    # 4. Faults
+    print("\n4. Faults")
+    simulator.configure(duplicate_rate=0.0, out_of_order_rate=0.0, error_rate=1.0, error_status=503)
+    db = SessionLocal()
+    before = db.query(Payment).count()
+    db.close()
+    r = checkout()
+    db = SessionLocal()
+    check(f"gateway error surfaces as {r.status_code}, no payment left behind",
+          r.status_code == 503 and db.query(Payment).count() == before)
+    db.close()
+
+    simulator.configure(error_rate=0.0, latency=(0.3, 0.3))
+    started = time.perf_counter()
+    r = checkout()
+    elapsed = time.perf_counter() - started
+    check(f"latency injected ({elapsed * 1000:.0f} ms)", r.status_code == 201 and elapsed >= 0.3)
+
+    simulator.configure(latency=(0, 0), unpaid_rate=1.0)
+    payment = checkout().json()
+    r = client.post(f"/api/payments/{payment['id']}/check-status", headers=headers)
+    check("unpaid transaction stays pending", r.status_code == 200 and r.json()["status"] == "pending")
+    trx = list(simulator.transactions.values())[-1]
+    trx["status"] = 1
+    client.portal.call(simulator.send_callback, trx, 1)
+    check("manual callback marks it paid", wait_for(lambda: payment_statuses([payment["id"]]) == ["success"]))
+
+    # 5. Circuit breaker and bulkhead
+    print("\n5. Circuit breaker and bulkhead")
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10, clock=lambda: now[0])
+    for _ in range(3):
+        breaker.record_failure()
+    opened = breaker.state == "open" and not breaker.allow()
+    now[0] = 10
+    probe, second = breaker.allow(), breaker.allow()
+    breaker.record_failure()
+    reopened = breaker.state == "open"
+    now[0] = 20
+    breaker.allow()
+    breaker.record_success()
+    check("opens after 3 failures, one probe at a time, reopens or closes on its result",
+          opened and probe and not second and reopened and breaker.state == "closed")
+
+    ipaymu_client.breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.5)
+    simulator.configure(unpaid_rate=1.0)
+    pending = checkout().json()
+    simulator.configure(error_rate=1.0, error_status=502)
+    statuses = [checkout().status_code for _ in range(3)]
+    calls = sum(simulator.stats()["requests"].values())
+    db = SessionLocal()
+    before = db.query(Payment).count()
+    db.close()
+    started = time.perf_counter()
+    r = checkout()
+    fast = time.perf_counter() - started
+    db = SessionLocal()
+    check(f"3 gateway 502s open the circuit ({statuses})", statuses == [502] * 3 and ipaymu_client.breaker.state == "open")
+    check(f"then 503 with Retry-After in {fast * 1000:.0f} ms, no gateway call, no payment row",
+          r.status_code == 503 and r.headers.get("retry-after") == "1"
+          and sum(simulator.stats()["requests"].values()) == calls and db.query(Payment).count() == before)
+    db.close()
+    r = client.post(f"/api/payments/{pending['id']}/check-status", headers=headers)
+    check("status check fails fast too", r.status_code == 503)
+    metrics = client.get("/metrics").text
+    check("breaker state and rejections in /metrics", "ipaymu_circuit_state 2" in metrics
+          and 'ipaymu_rejected_total{endpoint="/payment/direct",reason="circuit_open"}' in metrics)
+
+    simulator.configure(error_rate=0.0)
+    time.sleep(0.6)
+    r = checkout()
+    check("probe after the reset time closes the circuit", r.status_code == 201 and ipaymu_client.breaker.state == "closed")
+    check("/health reports the gateway", client.get("/health").json()["ipaymu_gateway"]["circuit"] == "closed")
+
+    connect_simulator(httpx.MockTransport(read_timeout))
+    statuses = [checkout().status_code for _ in range(3)]
+    check(f"timeouts answer 504 and count as failures too ({statuses})",
+          statuses == [504] * 3 and ipaymu_client.breaker.state == "open")
+    ipaymu_client.breaker = CircuitBreaker(failure_threshold=3, reset_seconds=0.5)
+    connect_simulator()
+
+    settings.IPAYMU_MAX_CONCURRENT_CALLS, settings.IPAYMU_BULKHEAD_WAIT_SECONDS = 2, 0.2
+    ipaymu_client._bulkhead = None
+    simulator.configure(latency=(1.0, 1.0))
+
+    async def burst(n: int) -> list:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            orders = [(await c.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers)).json()
+                      for _ in range(n)]
+            responses = await asyncio.gather(*(c.post("/api/payments/", headers=headers, json={
+                "order_id": o["id"], "payment_method": "va", "payment_channel": "bca", "amount": o["total_price"],
+            }) for o in orders))
+            return sorted(r.status_code for r in responses)
+
+    statuses = client.portal.call(burst, 6)
+    check(f"bulkhead of 2: the rest get 503 after 0.2 s ({statuses})", statuses == [201, 201, 503, 503, 503, 503])
+    check("bulkhead rejections counted", ipaymu_client.gateway_stats()["rejected"].get("bulkhead_full") == 4)
+    print(f"   simulator: {simulator.stats()}")
+    print(f"   gateway: {ipaymu_client.gateway_stats()}")
+
+    client.portal.call(simulator.close)
+
+finish("IPAYMU SIMULATOR TEST")
@@ -0,0 +1,106 @@
+"""
+Test: /metrics exposition (route templates, DB, iPaymu, SMTP, loop lag,
+password hashing pool, SSE streams)
+
+Runs the app in-process against a temporary SQLite file with iPaymu and
+SMTP faked, makes a few requests and checks the Prometheus output.
+No server or network needed.
+Jalankan: python test_metrics.py
+"""
+import os
+import smtplib
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("metrics", EVENT_LOOP_LAG_INTERVAL_SECONDS="0.05")
+
+import httpx
+from fastapi.testclient import TestClient
+
+
+class FailingSMTP:
+    """Every connection attempt is refused"""
+    def __init__(self, *args, **kwargs):
+        raise ConnectionRefusedError("smtp down")
+
+
+smtplib.SMTP = FailingSMTP
+
+from app.main import app
+from app.config import settings
+from app.ipaymu import ipaymu_client
+from app.mail_queue import store_email, mail_queue
+from app.api.endpoints.auth import create_access_token
+from app.database import SessionLocal
+from app.models import Order, Payment, User
+from app.passwords import password_hasher
+
+
+def ipaymu_handler(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(502, json={"Status": 502, "Success": False})
+
+
+banner("METRICS TEST")
+
+with TestClient(app) as c:
+    pooled = ipaymu_client._client
+    ipaymu_client._client = httpx.AsyncClient(base_url=pooled.base_url, transport=httpx.MockTransport(ipaymu_handler))
+
+    c.get("/api/services/")
+    c.get("/api/orders/12345")  # 401/403 without a token, still one route label
+    c.get("/no/such/path")
+    c.portal.call(ipaymu_client.transaction_status, "1")
+    max_queue, password_hasher.max_queue = password_hasher.max_queue, -password_hasher.workers  # pool "full"
+    busy = c.post("/api/auth/register", json={"email": "busy@example.com", "password": "password123", "full_name": "Busy"})
+    password_hasher.max_queue = max_queue
+    # Written directly: no emails queued, the SMTP failure count stays 1
+    db = SessionLocal()
+    user = User(email="sse@example.com", full_name="SSE", hashed_password="x", is_active=True)
+    db.add(user)
+    db.flush()
+    order = Order(user_id=user.id, order_number="ORD-METRICS-1", service_name="Test", unit_price=10000, total_price=10000)
+    db.add(order)
+    db.flush()
+    db.add(Payment(order_id=order.id, payment_method="va", amount=10000, status="success"))  # final: the stream ends at once
+    db.commit()
+    order_id = order.id
+    db.close()
+    auth = {"Authorization": f"Bearer {create_access_token({'sub': 'sse@example.com'})}"}
+    stream = c.get(f"/api/payments/order/{order_id}/events", headers=auth)
+    store_email("metrics@example.com", "Test", "body")
+    mail_queue.deliver_due()
+    time.sleep(0.2)
+
+    r = c.get("/metrics")
+    body = r.text
+    check("200 text/plain", r.status_code == 200 and r.headers["content-type"].startswith("text/plain"))
+    check("route template label", 'route="/api/orders/{order_id}"' in body and "/api/orders/12345" not in body)
+    check("unmatched paths share one label", 'route="unmatched",status="404"' in body)
+    check("request histogram buckets", 'http_request_duration_seconds_bucket{method="GET",route="/api/services/",status="200",le="+Inf"} 1' in body)
+    check("in-flight gauge", "# TYPE http_requests_in_flight gauge" in body)
+    check("SQL statements per request", 'http_request_db_queries_count{method="GET",route="/api/services/"}' in body)
+    check("SQL latency by operation", 'db_query_duration_seconds_count{operation="SELECT"}' in body)
+    check("iPaymu error class", 'ipaymu_request_errors_total{endpoint="/transaction",error="http_502"} 1' in body)
+    check("SMTP failures", 'smtp_send_failures_total{error="ConnectionRefusedError"} 1' in body)
+    check("event loop lag", "event_loop_lag_seconds_count " in body)
+    events_route = 'method="GET",route="/api/payments/order/{order_id}/events"'
+    check("SSE stream lifetime in its own histogram",
+          stream.headers["content-type"].startswith("text/event-stream")
+          and f"http_stream_duration_seconds_count{{{events_route}}} 1" in body
+          and f'http_stream_duration_seconds_count{{method="GET",route="/api/services/"}}' not in body)
+    check("request latency of a stream is the time to open it",
+          f'http_request_duration_seconds_count{{{events_route},status="200"}} 1' in body)
+    check("password hashing queue depth", "# TYPE password_hash_queue_depth gauge" in body)
+    check(f"password hashing rejections ({busy.status_code})",
+          busy.status_code == 503 and 'password_hash_rejected_total{operation="hash"} 1' in body)
+
+    settings.METRICS_TOKEN = "scrape-secret"
+    check("token required", c.get("/metrics").status_code == 401)
+    check("token accepted", c.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200)
+    settings.METRICS_TOKEN = ""
+
+finish("METRICS TEST")
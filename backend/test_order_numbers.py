@@ -0,0 +1,132 @@
+"""
+Test: order numbers stay unique and monotonic under concurrency
+
+1. 8 threads x 25,000 numbers in one process
+2. 4 forked worker processes x 50,000 numbers (fork copies the generator)
+3. Clock going backwards and sequence overflow
+4. 500 POST /api/orders/, 20 at a time, against the app (temporary SQLite)
+
+No server or network needed.
+Jalankan: python test_order_numbers.py
+"""
+import asyncio
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("orders")
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import order_numbers
+from app.order_numbers import OrderNumberGenerator, generate_order_number
+
+FORMAT = re.compile(r"^ORD-\d{8}-\d{6}-[0-9A-HJKMNP-TV-Z]{8}$")
+
+
+def generate_many(count: int, out: list):
+    out.extend(generate_order_number() for _ in range(count))
+
+
+def worker_process(count: int, queue):
+    numbers = [generate_order_number() for _ in range(count)]
+    queue.put((numbers == sorted(numbers), numbers))
+
+
+banner("ORDER NUMBER TEST")
+
+# 1. Threads in one process
+generate_order_number()  # seed the node id before forking below
+per_thread = [[] for _ in range(8)]
+threads = [threading.Thread(target=generate_many, args=(25000, out)) for out in per_thread]
+started = time.perf_counter()
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+elapsed = time.perf_counter() - started
+all_numbers = [n for out in per_thread for n in out]
+print(f"\n   threads: {len(all_numbers):,} numbers in {elapsed:.2f}s ({len(all_numbers) / elapsed:,.0f}/s)")
+check("format ORD-YYYYMMDD-HHMMSS-XXXXXXXX", all(FORMAT.match(n) for n in all_numbers))
+check("unique across threads", len(set(all_numbers)) == len(all_numbers))
+check("monotonic per thread", all(out == sorted(out) for out in per_thread))
+
+# 2. Forked worker processes (same generator state copied into each child)
+ctx = multiprocessing.get_context("fork")
+queue = ctx.Queue()
+processes = [ctx.Process(target=worker_process, args=(50000, queue)) for _ in range(4)]
+for p in processes:
+    p.start()
+results = [queue.get() for _ in processes]
+for p in processes:
+    p.join()
+process_numbers = [n for _, numbers in results for n in numbers] + all_numbers
+nodes = {n[-4:] for _, numbers in results for n in numbers}
+print(f"   processes: {len(process_numbers):,} numbers from {len(processes)} forks + parent")
+check("forks draw their own node id", len(nodes) == len(processes) and order_numbers.order_numbers._node not in nodes)
+check("unique across processes", len(set(process_numbers)) == len(process_numbers))
+check("monotonic per process", all(ok for ok, _ in results))
+
+# 3. Clock edge cases
+fake_now = [1_800_000_000.0]
+gen = OrderNumberGenerator(clock=lambda: fake_now[0])
+first = gen.next()
+fake_now[0] -= 30  # NTP step backwards
+after_step_back = gen.next()
+check("clock going back keeps increasing", after_step_back > first and after_step_back[:19] == first[:19])
+gen._sequence = (1 << order_numbers.SEQUENCE_BITS) - 1
+overflow = gen.next()
+check("sequence overflow borrows the next second", overflow > after_step_back and overflow[13:19] != first[13:19])
+
+# 4. Concurrent order creation through the API
+from app.main import app
+from app.database import SessionLocal
+from app.models import EmailOutbox
+
+TOTAL, CONCURRENCY = 500, 20
+
+
+async def create_orders(headers: dict) -> tuple:
+    transport = httpx.ASGITransport(app=app)
+    statuses, numbers = [], []
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        pending = iter(range(TOTAL))
+
+        async def worker():
+            for _ in pending:
+                r = await client.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers)
+                statuses.append(r.status_code)
+                if r.status_code == 201:
+                    numbers.append(r.json()["order_number"])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        return statuses, numbers, time.perf_counter() - started
+
+
+with TestClient(app) as c:
+    r = c.post("/api/auth/register", json={"email": "orders@example.com", "password": "password123", "full_name": "Orders"})
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    statuses, numbers, elapsed = c.portal.call(create_orders, headers)
+
+    # Each order queues a confirmation email on a worker thread; let those
+    # inserts finish before shutdown closes the database
+    db = SessionLocal()
+    deadline = time.monotonic() + 30
+    while db.query(EmailOutbox).count() < TOTAL + 1 and time.monotonic() < deadline:
+        time.sleep(0.2)
+    db.close()
+
+print(f"   api: {TOTAL} orders, concurrency {CONCURRENCY}, {elapsed:.2f}s ({TOTAL / elapsed:,.0f} orders/s)")
+check("every order created (no 500 on order_number)", statuses.count(201) == TOTAL)
+check("order numbers unique", len(set(numbers)) == len(numbers))
+
+finish("ORDER NUMBER TEST")
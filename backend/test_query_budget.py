@@ -0,0 +1,193 @@
+"""
+Test: SQL query budgets per endpoint (catches N+1 regressions)
+
+Runs the app in-process against a temporary SQLite file with iPaymu and
+SMTP faked, reads X-DB-Query-Count from each response and fails when an
+endpoint runs more queries than its budget. No server or network needed.
+Jalankan: python test_query_budget.py
+"""
+import asyncio
+import itertools
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("budget", DEBUG="true")
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.ipaymu import ipaymu_client
+from app.database import SessionLocal
+from app.models import PaymentCallbackInbox, Subscription, User
+from app.callback_inbox import process_pending_callbacks
+from app.reconcile import reconcile_pending_payments
+from app.query_counter import count_queries
+
+# Fake iPaymu: every transaction exists and reports the status set in IPAYMU_STATUS
+transaction_ids = itertools.count(5000)
+IPAYMU_STATUS = {}
+
+
+def ipaymu_handler(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    if request.url.path.endswith("/payment/direct"):
+        trx_id = str(next(transaction_ids))
+        IPAYMU_STATUS[trx_id] = "0"
+        return httpx.Response(200, json={"Status": 200, "Success": True, "Data": {
+            "TransactionId": trx_id, "SessionID": f"s{trx_id}", "Va": f"8888{trx_id}"
+        }})
+    if request.url.path.endswith("/transaction"):
+        return httpx.Response(200, json={"Status": 200, "Success": True, "Data": {
+            "StatusCode": IPAYMU_STATUS.get(str(body["transactionId"]), "0")
+        }})
+    return httpx.Response(404)
+
+
+# endpoint -> max statements (INSERT/UPDATE count too, not just SELECTs);
+# queued email is one email_outbox INSERT in the endpoint's own transaction
+BUDGETS = {
+    "POST /api/auth/register": 3,
+    "POST /api/auth/login": 1,
+    "GET /api/auth/me": 1,
+    "GET /api/users/me (cached user)": 0,
+    "GET /api/services/": 0,
+    "POST /api/orders/": 2,
+    "GET /api/orders/": 2,
+    "POST /api/payments/": 4,
+    "GET /api/payments/order/{id}": 3,
+    "POST /api/payments/{id}/check-status (paid)": 4,
+    "POST /api/payments/{id}/check-status (already paid)": 1,
+    "GET /api/subscriptions/my-subscriptions": 2,
+    # If-None-Match with a current ETag: version lookup only, no rows loaded
+    "GET /api/orders/{id} (304)": 1,
+    "GET /api/payments/{id} (304)": 1,
+    "GET /api/payments/order/{id} (304)": 2,
+    "GET /api/subscriptions/my-subscriptions (304)": 1,
+    "POST /api/payments/callback": 1,
+    # 2 SELECTs (inbox rows, payment graph) + fresh subscription row
+    # + inbox/payment/order/subscription UPDATEs + email
+    "inbox: apply renewal payment": 8,
+    # 1 SELECT for the batch + payment and order UPDATE and email per payment (3 payments)
+    "reconcile: batch of pending payments": 1 + 3 * 3,
+}
+
+results = {}
+
+
+def record(name: str, response: httpx.Response = None, count: int = None):
+    if response is not None:
+        assert response.status_code < 400, f"{name}: {response.status_code} {response.text}"
+        count = int(response.headers["x-db-query-count"])
+    results[name] = count
+
+
+def create_paid_flow(c, headers, slug="test-payment"):
+    order = c.post("/api/orders/", json={"service_slug": slug}, headers=headers).json()
+    payment = c.post("/api/payments/", json={
+        "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": 10000
+    }, headers=headers).json()
+    return order, payment
+
+
+banner("QUERY BUDGET TEST")
+
+with TestClient(app) as c:
+    pooled = ipaymu_client._client
+    ipaymu_client._client = httpx.AsyncClient(base_url=pooled.base_url, transport=httpx.MockTransport(ipaymu_handler))
+
+    r = c.post("/api/auth/register", json={"email": "budget@example.com", "password": "password123", "full_name": "Budget"})
+    record("POST /api/auth/register", r)
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    record("POST /api/auth/login", c.post("/api/auth/login", json={"email": "budget@example.com", "password": "password123"}))
+    record("GET /api/auth/me", c.get("/api/auth/me", headers=headers))
+    record("GET /api/users/me (cached user)", c.get("/api/users/me", headers=headers))
+    c.get("/api/services/")
+    record("GET /api/services/", c.get("/api/services/"))
+
+    r = c.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers)
+    record("POST /api/orders/", r)
+    order = r.json()
+    r = c.post("/api/payments/", json={
+        "order_id": order["id"], "payment_method": "va", "payment_channel": "bca", "amount": 10000
+    }, headers=headers)
+    record("POST /api/payments/", r)
+    payment = r.json()
+    record("GET /api/orders/", c.get("/api/orders/", headers=headers))
+    record("GET /api/payments/order/{id}", c.get(f"/api/payments/order/{order['id']}", headers=headers))
+
+    trx_id = str(max(int(t) for t in IPAYMU_STATUS))
+    IPAYMU_STATUS[trx_id] = "1"
+    record("POST /api/payments/{id}/check-status (paid)", c.post(f"/api/payments/{payment['id']}/check-status", headers=headers))
+    record("POST /api/payments/{id}/check-status (already paid)", c.post(f"/api/payments/{payment['id']}/check-status", headers=headers))
+    record("GET /api/subscriptions/my-subscriptions", c.get("/api/subscriptions/my-subscriptions", headers=headers))
+
+    for name, url in (
+        ("GET /api/orders/{id} (304)", f"/api/orders/{order['id']}"),
+        ("GET /api/payments/{id} (304)", f"/api/payments/{payment['id']}"),
+        ("GET /api/payments/order/{id} (304)", f"/api/payments/order/{order['id']}"),
+        ("GET /api/subscriptions/my-subscriptions (304)", "/api/subscriptions/my-subscriptions"),
+    ):
+        etag = c.get(url, headers=headers).headers["etag"]
+        r = c.get(url, headers={**headers, "If-None-Match": etag})
+        assert r.status_code == 304, f"{name}: {r.status_code}"
+        record(name, r)
+
+    # Renewal: subscription -> renewal order -> payment -> callback via the inbox
+    db = SessionLocal()
+    user = db.query(User).filter(User.email == "budget@example.com").first()
+    subscription = Subscription(
+        user_id=user.id, package_name="Website Service", package_type="yearly",
+        start_date=datetime.utcnow(), end_date=datetime.utcnow() + timedelta(days=10), price=10000
+    )
+    db.add(subscription)
+    db.commit()
+    subscription_id = subscription.id
+    db.close()
+
+    renewal = c.post(f"/api/subscriptions/renew/{subscription_id}", json={"payment_method": "va", "payment_channel": "bca"}, headers=headers).json()
+    renewal_payment = c.post("/api/payments/", json={
+        "order_id": renewal["order_id"], "payment_method": "va", "payment_channel": "bca", "amount": 10000
+    }, headers=headers).json()
+    renewal_trx = str(max(int(t) for t in IPAYMU_STATUS))
+
+    # Insert directly (no notify) so the background processor does not race the measurement
+    db = SessionLocal()
+    db.query(PaymentCallbackInbox).update({"status": "processed"})
+    db.add(PaymentCallbackInbox(trx_id=renewal_trx, status_code="1", payload="{}"))
+    db.commit()
+    db.close()
+
+    async def measure(coro_fn):
+        with count_queries() as stats:
+            summary = await coro_fn()
+        return stats.count, summary
+
+    count, summary = c.portal.call(measure, process_pending_callbacks)
+    assert summary["processed"] == 1, summary
+    record("inbox: apply renewal payment", count=count)
+
+    # Several pending payments reconciled in one batch
+    for _ in range(3):
+        create_paid_flow(c, headers)
+    for t in IPAYMU_STATUS:
+        IPAYMU_STATUS[t] = "1"
+    count, summary = c.portal.call(measure, reconcile_pending_payments)
+    assert summary["updated"] == 3, summary
+    record("reconcile: batch of pending payments", count=count)
+
+    # Last: the ack wakes the background inbox processor
+    record("POST /api/payments/callback", c.post("/api/payments/callback", json={"trx_id": "no-such-trx", "status_code": "0"}))
+
+print()
+for name, budget in BUDGETS.items():
+    count = results.get(name)
+    check(f"{name}: {count} queries (budget {budget})", count is not None and count <= budget)
+
+finish("QUERY BUDGET TEST")
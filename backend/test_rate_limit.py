@@ -0,0 +1,112 @@
+"""
+Test: rate limiter (app/rate_limit.py)
+
+1. Sliding window: the budget is spent, then refills as the previous
+   window's weight decays; Retry-After points at the moment it fits again
+2. Middleware: 429 with Retry-After and X-RateLimit-* headers once a cost
+   class is spent; other cost classes of the same client keep their budget
+3. The rejection metric is labelled by cost class, never by raw path
+4. The LRU map is capped at max_keys and evicts the least recently used key
+5. client_ip: peer address unless RATE_LIMIT_TRUST_PROXY; behind the proxy
+   X-Real-IP, else the rightmost X-Forwarded-For hop (forged left hops ignored);
+   proxy headers while trust is off log one warning
+
+Runs in-process against a temporary SQLite file, no server or network needed.
+Jalankan: python test_rate_limit.py
+"""
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("ratelimit", RATE_LIMIT_ENABLED="true", RATE_LIMIT_PER_MINUTE="30")
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.main import app
+from app.rate_limit import SlidingWindowLimiter, client_ip, rate_limit_rejected_total, rate_limiter, route_class
+
+
+def scope(peer: str, **headers: str) -> dict:
+    return {"client": (peer, 50000), "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]}
+
+
+banner("RATE LIMIT TEST")
+
+# 1. Sliding window
+print("\n1. Sliding window refill")
+limiter = SlidingWindowLimiter(limit=10, window_seconds=60, max_keys=100)
+results = [limiter.hit("a", 1, now=60.0 + i)[0] for i in range(10)]
+check("10 hits inside the budget allowed", all(results))
+allowed, remaining, retry_after = limiter.hit("a", 1, now=70.0)
+check(f"11th hit rejected, retry after the window ends ({retry_after:.0f}s)", not allowed and remaining == 0 and retry_after == 50.0)
+# Next window: previous count 10 weighs 10 * (1 - share); at 30s in it weighs 5
+allowed, remaining, _ = limiter.hit("a", 5, now=150.0)
+check(f"half a window later half the budget is back (remaining {remaining})", allowed and remaining == 0.0)
+allowed, _, retry_after = limiter.hit("a", 1, now=150.0)
+check(f"then rejected until the previous window decays by one more hit ({retry_after:.0f}s)", not allowed and retry_after == 6.0)
+check("after a full idle window the budget is whole", limiter.hit("a", 10, now=300.0)[:2] == (True, 0.0))
+
+# 2. Middleware
+print("\n2. Middleware 429 and cost classes")
+check("cost classes", route_class("POST", "/api/auth/login/") == ("POST /api/auth/login", 10)
+      and route_class("GET", "/api/orders/123") == ("default", 1)
+      and route_class("OPTIONS", "/api/auth/login") == ("preflight", 0))
+with TestClient(app) as client:
+    login = {"email": "nobody@example.com", "password": "wrong-password"}
+    codes = [client.post("/api/auth/login", json=login).status_code for _ in range(3)]
+    check(f"3 logins (cost 10 of 30) reach the endpoint ({codes})", 429 not in codes)
+    r = client.post("/api/auth/login", json=login)
+    check("4th login answered 429", r.status_code == 429)
+    check(f"Retry-After set ({r.headers.get('retry-after')})", int(r.headers.get("retry-after", "0")) >= 1)
+    check("X-RateLimit-Limit / Remaining", r.headers.get("x-ratelimit-limit") == "30" and r.headers.get("x-ratelimit-remaining") == "0")
+    check("browsing still allowed for the same client", client.get("/api/services/").status_code == 200)
+    check("health checks never limited", all(client.get("/health").status_code == 200 for _ in range(40)))
+    for i in range(30):
+        client.get(f"/api/orders/{i}")
+    r = client.get("/api/orders/999")
+    check("default class has its own budget, spent after 30 requests", r.status_code == 429)
+
+    # 3. Metric labels
+    print("\n3. Rejection metric")
+    labels = set(rate_limit_rejected_total.snapshot())
+    check(f"labelled by cost class ({sorted(labels)})", labels == {("POST /api/auth/login",), ("default",)})
+    check("no raw path in /metrics", "/api/orders/999" not in client.get("/metrics").text)
+
+# 4. LRU
+print("\n4. LRU eviction")
+limiter = SlidingWindowLimiter(limit=10, window_seconds=60, max_keys=3)
+for key in ("a", "b", "c"):
+    limiter.hit(key, 10, now=1.0)
+limiter.hit("a", 0, now=2.0)  # touch a: b is now the oldest
+limiter.hit("d", 1, now=3.0)
+check("map capped at max_keys", len(limiter._clients) == 3 and limiter.evictions == 1)
+check("least recently used key evicted", list(limiter._clients) == ["c", "a", "d"])
+check("evicted key starts over, kept key stays spent",
+      limiter.hit("b", 10, now=4.0)[0] and not limiter.hit("a", 1, now=5.0)[0])
+check("stats report the cap", rate_limiter.stats()["max_clients"] == settings.RATE_LIMIT_MAX_CLIENTS)
+
+# 5. client_ip
+print("\n5. Client address")
+forged = scope("10.0.0.2", x_forwarded_for="1.2.3.4, 203.0.113.7")
+warnings = []
+handler = logging.Handler(logging.WARNING)
+handler.emit = warnings.append
+logging.getLogger("app.rate_limit").addHandler(handler)
+settings.RATE_LIMIT_TRUST_PROXY = False
+check("no warning without proxy headers", client_ip(scope("10.0.0.2")) == "10.0.0.2" and not warnings)
+check("without trust: peer address, headers ignored",
+      client_ip(forged) == "10.0.0.2" and client_ip(scope("10.0.0.2", x_real_ip="1.2.3.4")) == "10.0.0.2")
+check(f"proxy headers while trust is off: warned once ({len(warnings)})",
+      len(warnings) == 1 and "RATE_LIMIT_TRUST_PROXY" in warnings[0].getMessage())
+settings.RATE_LIMIT_TRUST_PROXY = True
+check("behind the proxy: rightmost X-Forwarded-For hop, forged left hop ignored", client_ip(forged) == "203.0.113.7")
+check("X-Real-IP preferred", client_ip(scope("10.0.0.2", x_real_ip="198.51.100.9", x_forwarded_for="1.2.3.4")) == "198.51.100.9")
+check("no headers: peer address", client_ip(scope("10.0.0.2")) == "10.0.0.2" and client_ip({"headers": []}) == "unknown")
+settings.RATE_LIMIT_TRUST_PROXY = False
+
+finish("RATE LIMIT TEST")
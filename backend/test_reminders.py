@@ -0,0 +1,190 @@
+"""
+Test: subscription renewal reminders (H-7, H-3, H-1, H-0)
+
+1. 3,000 subscriptions spread over 12 days: only active ones ending on a
+   reminder day get one, read in keyset batches with a bounded query count
+2. Rerun and two concurrent runs never queue a reminder twice
+3. A renewed subscription (new end date) is reminded again
+4. Delivery: one SMTP session, throttled per recipient provider
+5. Two delivery processes (the app's worker and a CLI run) never send the
+   same message twice; a claim left by a dead process is taken over, and
+   a CLI enqueue_email() only delivers its own message
+
+Runs against a temporary SQLite file, no server or network needed.
+Jalankan: python test_reminders.py
+"""
+import asyncio
+import os
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import FakeSMTP, banner, check, finish, use_temp_database
+
+use_temp_database("reminders")
+
+
+from sqlalchemy import func
+
+from app.config import settings
+from app.database import SessionLocal, async_engine, init_db
+from app.mail_queue import SENDING_LEASE, MailQueueWorker, enqueue_email, mail_queue, store_email
+from app.models import EmailOutbox, Subscription, SubscriptionReminder, User
+from app.query_counter import count_queries
+from app.reminders import run_subscription_reminders
+
+TODAY = date(2026, 3, 1)
+TOTAL = 3000
+BATCH = 200
+DOMAINS = ["gmail.com", "yahoo.co.id", "rsppn.co.id"]
+
+
+async def reminders(runs: int = 1) -> list:
+    """run_subscription_reminders `runs` times concurrently on a fresh event loop"""
+    try:
+        return await asyncio.gather(*(run_subscription_reminders(today=TODAY, batch_size=BATCH) for _ in range(runs)))
+    finally:
+        await async_engine.dispose()
+
+
+def count(model, *where) -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count(model.id)).filter(*where).scalar()
+    finally:
+        db.close()
+
+
+banner("SUBSCRIPTION REMINDER TEST")
+
+init_db()
+db = SessionLocal()
+users = [
+    User(email=f"user{i}@{DOMAINS[i % len(DOMAINS)]}", full_name=f"User <{i}>", hashed_password="x", is_active=True)
+    for i in range(TOTAL)
+]
+db.add_all(users)
+db.flush()
+expected = 0
+for i, user in enumerate(users):
+    days = i % 12
+    status = "expired" if i % 10 == 9 else "active"
+    # Reminders go by calendar day: times within the day do not matter
+    end = datetime.combine(TODAY + timedelta(days=days), datetime.min.time()) + timedelta(hours=i % 24)
+    expected += status == "active" and days in (7, 3, 1, 0)
+    db.add(Subscription(user_id=user.id, package_name="Paket All In Service", package_type="yearly",
+                        start_date=end - timedelta(days=365), end_date=end, price=81000000,
+                        renewal_price=81000000, status=status))
+db.commit()
+db.close()
+
+print("\n1. First run")
+with count_queries() as stats:
+    summary, = asyncio.run(reminders())
+batches = expected // BATCH + 4 * 2
+print(f"   {summary}, {stats.count} SQL statements")
+check(f"queued {expected} reminders", summary["queued"] == expected and count(EmailOutbox) == expected)
+check("one log row per reminder", count(SubscriptionReminder) == expected)
+check(f"queries stay per batch, not per subscription ({stats.count} <= {batches * 4})", stats.count <= batches * 4)
+
+db = SessionLocal()
+message = db.query(EmailOutbox).filter(EmailOutbox.subject.like("%REMINDER 7 HARI%")).first()
+check("rendered from template", message is not None and "1 Maret 2026" not in message.subject
+      and "8 Maret 2026" in message.subject and "Rp 81.000.000" in message.body)
+check("names escaped in HTML", message is not None and "&lt;" in message.html and "User <" not in message.html)
+db.close()
+
+print("\n2. Reruns")
+summary, = asyncio.run(reminders())
+check(f"rerun queues nothing ({summary})", summary["queued"] == 0 and summary["skipped"] == expected)
+
+db = SessionLocal()
+day_seven = db.query(SubscriptionReminder).filter(SubscriptionReminder.days_before == 7).all()
+seven_count = len(day_seven)
+for reminder in day_seven:
+    db.delete(reminder)
+db.commit()
+db.close()
+
+results = asyncio.run(reminders(runs=2))
+queued = sum(r["queued"] for r in results)
+check(f"two concurrent runs queue H-7 once ({queued} of {seven_count})", queued == seven_count)
+check("no duplicate log rows", count(SubscriptionReminder) == expected)
+
+print("\n3. Renewal")
+db = SessionLocal()
+renewed = db.query(Subscription).filter(
+    Subscription.status == "active",
+    Subscription.end_date < datetime.combine(TODAY + timedelta(days=1), datetime.min.time())
+).first()
+renewed.end_date = datetime.combine(TODAY + timedelta(days=7), datetime.min.time())
+db.commit()
+db.close()
+summary, = asyncio.run(reminders())
+check(f"new end date gets its own reminder ({summary['queued']})", summary["queued"] == 1)
+
+print("\n4. Delivery")
+settings.MAIL_PROVIDER_MAX_PER_MINUTE = 100
+worker = MailQueueWorker()
+totals = Counter()
+while True:
+    result = worker.deliver_due(limit=500)
+    totals.update(result)
+    if not any(result.values()):
+        break
+per_provider = Counter(to.rpartition("@")[2] for to in FakeSMTP.sent)
+print(f"   {dict(totals)}, per provider {dict(per_provider)}")
+check("one SMTP session for the whole run", FakeSMTP.connections == 1)
+check("at most 100 per provider per minute", per_provider and max(per_provider.values()) == 100)
+check("throttled mail is deferred, not failed",
+      totals["deferred"] > 0 and count(EmailOutbox, EmailOutbox.status == "queued", EmailOutbox.attempts == 0)
+      == count(EmailOutbox) - len(FakeSMTP.sent))
+
+print("\n5. Concurrent delivery")
+race_ids = [store_email(f"race{i}@example.org", "Race", "body") for i in range(3)]
+app_worker, cli_worker = MailQueueWorker(), MailQueueWorker()
+send_message = FakeSMTP.send_message
+cli_results = []
+
+
+def send_during_cli_run(self, msg):
+    # The CLI process drains the queue while the app's worker is mid-send
+    if not cli_results:
+        cli_results.append(None)
+        cli_results[0] = cli_worker.deliver_due()
+    send_message(self, msg)
+
+
+FakeSMTP.send_message = send_during_cli_run
+try:
+    app_summary = app_worker.deliver_due()
+finally:
+    FakeSMTP.send_message = send_message
+race_sent = Counter(to for to in FakeSMTP.sent if to.startswith("race"))
+check(f"every message sent exactly once (app {app_summary['sent']}, cli {cli_results[0]['sent']})",
+      sorted(race_sent) == [f"race{i}@example.org" for i in range(3)] and set(race_sent.values()) == {1}
+      and app_summary["sent"] + cli_results[0]["sent"] == 3)
+check("all marked sent", count(EmailOutbox, EmailOutbox.id.in_(race_ids), EmailOutbox.status == "sent") == 3)
+
+db = SessionLocal()
+stale = EmailOutbox(to_email="stale@example.org", subject="Stale", body="body", status="sending",
+                    next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+held = EmailOutbox(to_email="held@example.org", subject="Held", body="body", status="sending",
+                   next_attempt_at=datetime.utcnow() + SENDING_LEASE)
+db.add_all([stale, held])
+db.commit()
+db.close()
+MailQueueWorker().deliver_due()
+check("expired claim taken over, live claim left alone",
+      "stale@example.org" in FakeSMTP.sent and "held@example.org" not in FakeSMTP.sent)
+
+other_id = store_email("other@example.org", "Other", "body")
+check("no worker running in this process", not mail_queue.running)
+enqueue_email("cli@example.org", "CLI", "body")
+check("CLI enqueue_email delivers only its own message",
+      "cli@example.org" in FakeSMTP.sent and "other@example.org" not in FakeSMTP.sent
+      and count(EmailOutbox, EmailOutbox.id == other_id, EmailOutbox.status == "queued") == 1)
+
+finish("SUBSCRIPTION REMINDER TEST")
@@ -0,0 +1,186 @@
+"""
+Test: startup cost and idempotency
+
+1. Import-time budget for `import app.main` (python -X importtime, fresh process)
+2. Cold start on an empty database, then a restart: the restart is one
+   schema version check plus one catalog INSERT, no create_all
+3. Warm-up opens the DB pool, iPaymu and SMTP connections before the first
+   request; the first email reuses the warm SMTP session; email queued in a
+   transaction is dropped on rollback and delivered after commit
+4. Admin init-services: one upsert, keeps is_active, restores defaults;
+   operator endpoints need ADMIN_TOKEN
+
+Runs against a temporary SQLite file, no server or network needed.
+Jalankan: python test_startup.py
+"""
+import os
+import re
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND)
+
+from tests.helpers import FakeSMTP, banner, check, finish, use_temp_database
+
+DB_PATH = use_temp_database("startup")
+
+# Whole `import app.main` (mostly FastAPI, SQLAlchemy and pydantic) and the app's own modules
+IMPORT_BUDGET_MS = 4000
+APP_IMPORT_BUDGET_MS = 800
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+
+banner("STARTUP TEST")
+
+# 1. Import time, measured in a fresh interpreter
+print("\n1. Import time")
+result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", "import app.main"],
+    cwd=BACKEND, capture_output=True, text=True, env={**os.environ, "DATABASE_URL": f"sqlite:///{DB_PATH}.import"},
+)
+imports = []
+for line in result.stderr.splitlines():
+    match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+    if match:
+        imports.append((match.group(4), int(match.group(1)) / 1000, int(match.group(2)) / 1000))
+total_ms = next((cumulative for name, _, cumulative in imports if name == "app.main"), float("inf"))
+own = sorted(((name, own_ms) for name, own_ms, _ in imports if name == "app" or name.startswith("app.")), key=lambda i: -i[1])
+own_ms = sum(ms for _, ms in own)
+print(f"   import app.main: {total_ms:.0f} ms, app modules: {own_ms:.0f} ms")
+print("   slowest app modules: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in own[:5]))
+check(f"import app.main under {IMPORT_BUDGET_MS} ms", total_ms < IMPORT_BUDGET_MS)
+check(f"app modules under {APP_IMPORT_BUDGET_MS} ms", own_ms < APP_IMPORT_BUDGET_MS)
+check("seed/CLI-only modules not imported", not {"app.seed", "app.migrations"} & {name for name, _, _ in imports})
+
+from app.main import app
+from app.config import settings
+from app.database import SessionLocal, async_engine, engine
+from app.ipaymu import ipaymu_client
+from app.mail_queue import enqueue_email
+from app.models import EmailOutbox, Service
+
+statements = []
+
+
+def record(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+
+event.listen(engine, "before_cursor_execute", record)
+event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+
+head_requests = []
+
+
+def ipaymu_handler(request: httpx.Request) -> httpx.Response:
+    head_requests.append(request.method)
+    return httpx.Response(404)
+
+
+def start(client: TestClient) -> float:
+    """Enter the app (startup + warm-up) with iPaymu mocked; returns seconds"""
+    ipaymu_client._client = httpx.AsyncClient(base_url=settings.IPAYMU_BASE_URL, transport=httpx.MockTransport(ipaymu_handler))
+    statements.clear()
+    started = time.perf_counter()
+    client.__enter__()
+    return time.perf_counter() - started
+
+
+# 2. Cold start, then restart
+print("\n2. Cold start and restart")
+client = TestClient(app)
+cold = start(client)
+cold_statements = list(statements)
+client.__exit__(None, None, None)
+
+client = TestClient(app)
+warm = start(client)
+restart_statements = list(statements)
+writes = [s for s in restart_statements if s.lstrip().upper().startswith(("INSERT", "UPDATE", "DELETE", "CREATE"))]
+print(f"   cold start: {cold * 1000:.0f} ms, {len(cold_statements)} statements; "
+      f"restart: {warm * 1000:.0f} ms, {len(restart_statements)} statements")
+check("cold start creates the schema", any("CREATE TABLE" in s for s in cold_statements))
+check("restart skips create_all", not any("table_info" in s.lower() for s in restart_statements))
+check("restart checks the schema version once",
+      sum("FROM schema_version" in s for s in restart_statements) == 1)
+check("one catalog INSERT ... ON CONFLICT", [s for s in writes if "services" in s] == [s for s in writes if "ON CONFLICT" in s] and
+      sum("INSERT INTO services" in s for s in writes) == 1)
+db = SessionLocal()
+check("6 default services, not duplicated", db.query(Service).count() == 6)
+db.close()
+
+# 3. Warm-up
+print("\n3. Warm-up")
+# Background workers may already hold one of the warmed connections
+opened = async_engine.pool.checkedin() + async_engine.pool.checkedout()
+check(f"async pool filled ({opened} of {settings.DB_POOL_SIZE})", opened >= settings.DB_POOL_SIZE)
+check("iPaymu skipped when not configured", head_requests == [])
+client.__exit__(None, None, None)
+
+settings.IPAYMU_VA = "0000000000000000"
+settings.SMTP_USER = "mailer@example.com"
+client = TestClient(app)
+start(client)
+check("iPaymu connection opened before the first request", head_requests == ["HEAD"])
+check("SMTP session opened before the first request", FakeSMTP.connections == 1)
+r = client.post("/api/auth/register", json={"email": "startup@example.com", "password": "password123", "full_name": "Startup"})
+deadline = time.monotonic() + 5
+while len(FakeSMTP.sent) < 1 and time.monotonic() < deadline:
+    time.sleep(0.05)
+check("first email reuses the warm session", r.status_code == 201 and len(FakeSMTP.sent) == 1 and FakeSMTP.connections == 1)
+
+# Queued with the caller's session: rolled back with it, never half-sent
+db = SessionLocal()
+enqueue_email("rollback@example.com", "Rolled back", "body", db=db)
+db.rollback()
+enqueue_email("commit@example.com", "Committed", "body", db=db)
+db.commit()
+db.close()
+deadline = time.monotonic() + 5
+while len(FakeSMTP.sent) < 2 and time.monotonic() < deadline:
+    time.sleep(0.05)
+db = SessionLocal()
+check("email queued in a rolled-back transaction is gone",
+      db.query(EmailOutbox).filter(EmailOutbox.to_email == "rollback@example.com").count() == 0)
+check("email queued in a committed transaction is delivered after the commit",
+      len(FakeSMTP.sent) == 2 and db.query(EmailOutbox).filter(EmailOutbox.to_email == "commit@example.com").one().status == "sent")
+db.close()
+
+# 4. Admin endpoints
+print("\n4. Admin endpoints")
+db = SessionLocal()
+seo = db.query(Service).filter(Service.slug == "seo").first()
+seo.price, seo.is_active = 1, False
+db.query(Service).filter(Service.slug == "cloudflare").delete()
+db.commit()
+db.close()
+r = client.post("/api/admin/init-services")
+db = SessionLocal()
+seo = db.query(Service).filter(Service.slug == "seo").first()
+check(f"counts created/updated ({r.json().get('message')})", "Created: 1, Updated: 5" in r.json().get("message", ""))
+check("defaults restored, is_active kept", seo.price == 42000000 and seo.is_active is False and db.query(Service).count() == 6)
+db.close()
+
+# Operator endpoints expose customer addresses: token only, off without one
+settings.ADMIN_TOKEN = ""
+check("email-outbox and callback replay disabled without ADMIN_TOKEN",
+      client.get("/api/admin/email-outbox").status_code == 403
+      and client.post("/api/admin/callback-inbox/replay").status_code == 403)
+settings.ADMIN_TOKEN = "admin-secret"
+check("email-outbox rejects a missing/wrong token",
+      client.get("/api/admin/email-outbox").status_code == 401
+      and client.get("/api/admin/email-outbox", headers={"Authorization": "Bearer nope"}).status_code == 401)
+r = client.get("/api/admin/email-outbox", headers={"Authorization": "Bearer admin-secret"})
+check("email-outbox with the token", r.status_code == 200 and "counts" in r.json())
+check("callback-inbox replay needs the token too",
+      client.post("/api/admin/callback-inbox/replay").status_code == 401
+      and client.post("/api/admin/callback-inbox/replay", headers={"Authorization": "Bearer admin-secret"}).status_code == 200)
+settings.ADMIN_TOKEN = ""
+client.__exit__(None, None, None)
+
+finish("STARTUP TEST")
@@ -0,0 +1,84 @@
+"""
+Test: event stream authentication (?token= on the SSE URLs)
+
+1. POST .../events/token issues a short-lived token for one stream of the
+   caller's own order/payment; someone else's order is 404
+2. The stream accepts that token in the query string, and still accepts
+   the Authorization header
+3. The login access token is refused in the query string, a stream token
+   is refused for another stream and as a Bearer access token, and an
+   expired one is refused
+
+Runs in-process against a temporary SQLite file, no server or network needed.
+Jalankan: python test_stream_token.py
+"""
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tests.helpers import banner, check, finish, use_temp_database
+
+use_temp_database("stream-token")
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.endpoints.auth import create_access_token
+from app.database import SessionLocal
+from app.models import Payment
+
+
+def register(client: TestClient, email: str) -> dict:
+    r = client.post("/api/auth/register", json={"email": email, "password": "password123", "full_name": "Stream"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+banner("STREAM TOKEN TEST")
+
+with TestClient(app) as client:
+    headers = register(client, "stream@example.com")
+    other = register(client, "other@example.com")
+    order = client.post("/api/orders/", json={"service_slug": "test-payment"}, headers=headers).json()
+    other_order = client.post("/api/orders/", json={"service_slug": "test-payment"}, headers=other).json()
+    db = SessionLocal()
+    # A final status ends the stream right after the current state
+    payment = Payment(order_id=order["id"], payment_method="va", amount=10000, status="success")
+    db.add(payment)
+    db.commit()
+    payment_id = payment.id
+    db.close()
+    order_stream = f"/api/payments/order/{order['id']}/events"
+    payment_stream = f"/api/payments/{payment_id}/events"
+
+    # 1. Issuing
+    print("\n1. Token endpoint")
+    r = client.post(f"{order_stream}/token", headers=headers)
+    token = r.json().get("token")
+    check(f"order stream token issued ({r.status_code}, expires in {r.json().get('expires_in')} s)",
+          r.status_code == 200 and token and r.json()["expires_in"] == 60)
+    check("needs the Authorization header", client.post(f"{order_stream}/token").status_code == 401)
+    check("another user's order -> 404",
+          client.post(f"/api/payments/order/{other_order['id']}/events/token", headers=headers).status_code == 404)
+    payment_token = client.post(f"{payment_stream}/token", headers=headers).json()["token"]
+
+    # 2. Accepted
+    print("\n2. Stream accepts")
+    r = client.get(f"{order_stream}?token={token}")
+    check("stream token in the query string", r.status_code == 200 and '"status":"success"' in r.text)
+    check("payment stream token", client.get(f"{payment_stream}?token={payment_token}").status_code == 200)
+    check("Authorization header", client.get(order_stream, headers=headers).status_code == 200)
+
+    # 3. Refused
+    print("\n3. Stream refuses")
+    access_token = headers["Authorization"].split(" ", 1)[1]
+    check("login access token in the query string", client.get(f"{order_stream}?token={access_token}").status_code == 401)
+    check("no token at all", client.get(order_stream).status_code == 401)
+    check("token of another stream", client.get(f"{order_stream}?token={payment_token}").status_code == 401)
+    check("stream token as Bearer access token",
+          client.get("/api/auth/me", headers={"Authorization": f"Bearer {token}"}).status_code == 401)
+    expired = create_access_token({"sub": "stream@example.com", "scope": order_stream}, timedelta(seconds=-1))
+    check("expired stream token", client.get(f"{order_stream}?token={expired}").status_code == 401)
+
+finish("STREAM TOKEN TEST")
@@ -0,0 +1,78 @@
+"""
+Shared setup for the standalone test scripts (backend/test_*.py)
+
+Each script runs the app in-process against its own temporary SQLite file,
+with SMTP replaced by FakeSMTP (importing this module installs it):
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from tests.helpers import FakeSMTP, banner, check, finish, use_temp_database
+
+    DB_PATH = use_temp_database("etag")  # before the first `app` import
+    ...
+    banner("CONDITIONAL GET TEST")
+    check("304 while unchanged", r.status_code == 304)
+    finish("CONDITIONAL GET TEST")
+"""
+import os
+import smtplib
+import sys
+import tempfile
+
+# Background work that would race the checks; a script can turn it back on
+TEST_ENV = {
+    "RATE_LIMIT_ENABLED": "false",
+    "PAYMENT_RECONCILE_ENABLED": "false",
+    "SUBSCRIPTION_REMINDERS_ENABLED": "false",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def use_temp_database(name: str, **env: str) -> str:
+    """Point DATABASE_URL at a fresh SQLite file and apply TEST_ENV (plus
+    `env` overrides); returns the file path
+
+    Settings are read when `app` is first imported, so call this before.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix=f"neointegra-{name}-"), f"{name}.db")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{path}", **TEST_ENV, **env})
+    return path
+
+
+class FakeSMTP:
+    """Accepts everything and counts it; the mail queue never leaves the process"""
+    connections = 0
+    sent = []  # recipients, in delivery order
+
+    def __init__(self, *args, **kwargs): FakeSMTP.connections += 1
+    def starttls(self): pass
+    def login(self, *args): pass
+    def noop(self): return (250, b"ok")
+    def send_message(self, msg): FakeSMTP.sent.append(msg["To"])
+    def quit(self): pass
+    def close(self): pass
+
+
+smtplib.SMTP = FakeSMTP
+
+failures = 0
+
+
+def check(name: str, ok: bool) -> bool:
+    global failures
+    failures += not ok
+    print(f"   {'✅' if ok else '❌'} {name}")
+    return ok
+
+
+def banner(title: str):
+    print("\n" + "="*60)
+    print(title)
+    print("="*60)
+
+
+def finish(title: str):
+    """Closing banner; exits 1 if any check failed"""
+    print("\n" + "="*60)
+    print(f"✅ {title} PASSED" if not failures else f"❌ {title} FAILED ({failures})")
+    print("="*60)
+    sys.exit(1 if failures else 0)
@@ -5,9 +5,16 @@ import toast from 'react-hot-toast'
 
 /**
  * PaymentStatusChecker Component
- * Auto-polls payment status for pending payments
+ * Listens for pushed status changes (Server-Sent Events) on pending payments,
+ * falls back to slow polling if the stream is unavailable
  * Shows manual refresh button
  */
+
+// Fallback polling interval when the SSE stream cannot be used
+const FALLBACK_POLL_INTERVAL = 60000 // 60 seconds
+// Stream (re)connects failing in a row before falling back to polling
+const MAX_STREAM_FAILURES = 3
+const STREAM_RECONNECT_DELAY = 5000 // matches the server's "retry: 5000"
 export default function PaymentStatusChecker({ orderId, orderStatus, onStatusUpdate }) {
   const [checking, setChecking] = useState(false)
   const [paymentId, setPaymentId] = useState(null)
@@ -83,22 +90,97 @@ export default function PaymentStatusChecker({ orderId, orderStatus, onStatusUpd
     }
   }, [paymentId, paymentStatus, checking, onStatusUpdate])
 
-  // Auto-check every 10 seconds for pending payments
+  // Apply a status pushed by the server stream
+  const applyPushedStatus = useCallback((event) => {
+    if (event.payment_id !== paymentId || event.status === paymentStatus) {
+      return
+    }
+
+    setPaymentStatus(event.status)
+
+    if (event.status === 'success') {
+      toast.success('🎉 Pembayaran berhasil dikonfirmasi!')
+      setAutoCheckEnabled(false)
+    } else if (event.status === 'failed') {
+      toast.error('Pembayaran gagal atau expired')
+      setAutoCheckEnabled(false)
+    }
+
+    if (onStatusUpdate) {
+      onStatusUpdate(event)
+    }
+  }, [paymentId, paymentStatus, onStatusUpdate])
+
+  // Subscribe to pushed status changes; poll slowly only if SSE is unavailable
   useEffect(() => {
     if (!autoCheckEnabled || !paymentId || paymentStatus !== 'pending') {
       return
     }
 
-    // Check immediately
-    checkPaymentStatus(false)
-
-    // Then check every 10 seconds
-    const interval = setInterval(() => {
+    let interval = null
+    const startFallbackPolling = () => {
+      if (interval) return
       checkPaymentStatus(false)
-    }, 10000) // 10 seconds
+      interval = setInterval(() => {
+        checkPaymentStatus(false)
+      }, FALLBACK_POLL_INTERVAL)
+    }
 
-    return () => clearInterval(interval)
-  }, [autoCheckEnabled, paymentId, paymentStatus, checkPaymentStatus])
+    if (typeof EventSource === 'undefined') {
+      startFallbackPolling()
+      return () => clearInterval(interval)
+    }
+
+    // Stream tokens are short-lived, so EventSource's own reconnect (same URL)
+    // would be refused: reconnect ourselves with a fresh token instead
+    let source = null
+    let reconnectTimer = null
+    let failures = 0
+    let cancelled = false
+
+    const reconnect = () => {
+      failures += 1
+      if (failures >= MAX_STREAM_FAILURES) {
+        startFallbackPolling()
+      } else {
+        reconnectTimer = setTimeout(connect, STREAM_RECONNECT_DELAY)
+      }
+    }
+
+    const connect = () => {
+      paymentsAPI.orderEventsUrl(orderId)
+        .then((url) => {
+          if (cancelled) return
+          const stream = new EventSource(url)
+          source = stream
+          stream.onopen = () => {
+            failures = 0
+          }
+          stream.addEventListener('payment_status', (e) => {
+            try {
+              applyPushedStatus(JSON.parse(e.data))
+            } catch (error) {
+              console.error('Invalid payment event:', error)
+            }
+          })
+          stream.onerror = () => {
+            stream.close()
+            if (!cancelled) reconnect()
+          }
+        })
+        .catch(() => {
+          if (!cancelled) reconnect()
+        })
+    }
+    connect()
+
+    return () => {
+      cancelled = true
+      clearTimeout(reconnectTimer)
+      if (source) source.close()
+      if (interval) clearInterval(interval)
+    }
+  }, [autoCheckEnabled, paymentId, paymentStatus, orderId, applyPushedStatus, checkPaymentStatus])
 
   // Don't show button if order is not pending or no payment
   if (orderStatus !== 'pending' || !paymentId) {
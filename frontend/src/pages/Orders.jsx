@@ -56,6 +56,9 @@ export default function Orders() {
   const [loading, setLoading] = useState(true)
   const [searchQuery, setSearchQuery] = useState('')
   const [filterStatus, setFilterStatus] = useState('all')
+  const [nextCursor, setNextCursor] = useState(null)
+  const [totalCount, setTotalCount] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     loadOrders()
@@ -66,6 +69,8 @@ export default function Orders() {
       setLoading(true)
       const response = await ordersAPI.getAll()
       setOrders(response.data)
+      setNextCursor(response.headers['x-next-cursor'] || null)
+      setTotalCount(Number(response.headers['x-total-count'] ?? response.data.length))
     } catch (error) {
       console.error('Failed to load orders:', error)
     } finally {
@@ -73,6 +78,21 @@ export default function Orders() {
     }
   }
 
+  // Next page (keyset cursor from the previous response)
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return
+    try {
+      setLoadingMore(true)
+      const response = await ordersAPI.getAll({ cursor: nextCursor })
+      setOrders(prev => [...prev, ...response.data])
+      setNextCursor(response.headers['x-next-cursor'] || null)
+    } catch (error) {
+      console.error('Failed to load more orders:', error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const handleStatusUpdate = (updatedPayment) => {
     // Refresh orders when payment status changes
     loadOrders()
@@ -279,6 +299,19 @@ export default function Orders() {
           </div>
         )}
 
+        {/* Load more */}
+        {nextCursor && (
+          <div className="mt-6 text-center">
+            <button
+              onClick={loadMoreOrders}
+              disabled={loadingMore}
+              className="btn btn-secondary"
+            >
+              {loadingMore ? 'Memuat...' : `Muat order lainnya (${orders.length} dari ${totalCount})`}
+            </button>
+          </div>
+        )}
+
         {/* Summary */}
         {filteredOrders.length > 0 && (
           <motion.div
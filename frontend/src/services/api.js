@@ -105,7 +105,14 @@ export const paymentsAPI = {
   create: (data) => api.post('/payments/', data),
   getById: (id) => api.get(`/payments/${id}`),
   getByOrder: (orderId) => api.get(`/payments/order/${orderId}`),
-  checkStatus: (paymentId) => api.post(`/payments/check-status/${paymentId}`),
+  checkStatus: (paymentId) => api.post(`/payments/${paymentId}/check-status`),
+  // Server-Sent Events stream of payment status changes for an order.
+  // EventSource cannot send headers, so the URL carries a short-lived token
+  // scoped to this stream (never the login token).
+  orderEventsUrl: async (orderId) => {
+    const { data } = await api.post(`/payments/order/${orderId}/events/token`)
+    return `${API_URL}/payments/order/${orderId}/events?token=${encodeURIComponent(data.token)}`
+  },
 }
 
 // Users API